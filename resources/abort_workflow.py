@@ -1,4 +1,4 @@
-"""Simple script to abort a workflow.
+"""Simple script to abort workflow(s).
 
 Useful for quick debugging in prod.
 """
@@ -15,12 +15,13 @@ logging.getLogger().setLevel(logging.INFO)
 
 async def main():
     parser = argparse.ArgumentParser(
-        description="Abort a workflow",
+        description="Abort workflow(s)",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
     parser.add_argument(
-        "workflow_id",
-        help="the workflow's id",
+        "workflow_ids",
+        nargs="+",
+        help="the workflows' ids",
     )
     parser.add_argument(
         "--ewms",
@@ -35,10 +36,11 @@ async def main():
 
     ####
 
-    logging.info(f"aborting workflow {args.workflow_id}")
+    logging.info(f"aborting workflow(s) {args.workflow_ids}")
     resp = await rc.request(
         "POST",
-        f"/v1/workflows/{args.workflow_id}/actions/abort",
+        "/v1/workflows/actions/abort",
+        {"workflow_ids": args.workflow_ids},
     )
     print(json.dumps(resp, indent=4), flush=True)
 
@@ -15,6 +15,7 @@ from .utils import (
     CONDOR_LOCATIONS_LOOKUP,
     StateForTMS,
     _request_and_validate_and_print,
+    _request_and_validate_and_print__with_status,
     check_taskforce_states,
     sleep_until_background_runners_advance_taskforces,
 )
@@ -207,6 +208,100 @@ async def user_requests_new_workflow(
     return workflow_resp["workflow"]["workflow_id"], task_id, tms_states
 
 
+async def user_requests_new_workflows_batch(
+    rc: RestClient,
+    openapi_spec: openapi_core.OpenAPI,
+    condor_locations: list[str],
+    n_workflows: int,
+    bad_indexes: list[int],
+) -> list[str]:
+    """Request many workflows at once, the ones at `bad_indexes` are invalid.
+
+    Return the ids of the workflows that were created.
+    """
+    workflow_requests = []
+    for i in range(n_workflows):
+        pilot_environment = {"FOO": str(i)}
+        if i in bad_indexes:
+            # valid per the json schema, but not per the server
+            pilot_environment["EWMS_PILOT_TASK_IMAGE"] = "icecube/badpassenger"
+        workflow_requests.append(
+            {
+                "tasks": [
+                    {
+                        "cluster_locations": condor_locations,
+                        "task_image": "icecube/earthpassenger",
+                        "task_args": f"aaa bbb --ccc {i}",
+                        "input_queue_aliases": ["qfoo"],
+                        "output_queue_aliases": ["qbar"],
+                        #
+                        "n_workers": 99,
+                        "worker_config": {
+                            "do_transfer_worker_stdouterr": False,
+                            "max_worker_runtime": 60 * 60 * 1,
+                            "n_cores": 4,
+                            "priority": 1,
+                            "worker_disk": "1G",
+                            "worker_memory": "512M",
+                            "condor_requirements": "bar && baz",
+                        },
+                        "pilot_config": {
+                            "tag": "latest",
+                            "image_source": "cvmfs",
+                            "environment": pilot_environment,
+                            "input_files": [],
+                        },
+                    }
+                ],
+                "public_queue_aliases": ["qfoo", "qbar"],
+            }
+        )
+
+    #
+    # USER...
+    # requests new workflows
+    #
+    status, resp = await _request_and_validate_and_print__with_status(
+        rc,
+        openapi_spec,
+        "POST",
+        "/v1/workflows/batch",
+        {"workflows": workflow_requests},
+    )
+    assert status == (207 if bad_indexes else 200)
+    assert len(resp["results"]) == n_workflows
+
+    # one result per request, in order
+    workflow_ids = []
+    for i, result in enumerate(resp["results"]):
+        if i in bad_indexes:
+            assert result["status"] == 400
+            assert "EWMS_PILOT_TASK_IMAGE" in result["error"]
+            continue
+        assert result["status"] == 200
+        assert len(result["task_directives"]) == 1
+        assert result["task_directives"][0]["task_args"] == f"aaa bbb --ccc {i}"
+        assert len(result["taskforces"]) == len(condor_locations)
+        assert all(
+            tf["workflow_id"] == result["workflow"]["workflow_id"]
+            and tf["phase"] == "pre-mq-activation"
+            for tf in result["taskforces"]
+        )
+        workflow_ids.append(result["workflow"]["workflow_id"])
+
+    # only the good ones were put into the db
+    resp = await _request_and_validate_and_print(
+        rc,
+        openapi_spec,
+        "POST",
+        "/v1/query/workflows",
+        {"query": {}, "projection": ["workflow_id"]},
+    )
+    assert sorted(w["workflow_id"] for w in resp["workflows"]) == sorted(workflow_ids)
+
+    return workflow_ids
+
+
 async def tms_starter(
     rc: RestClient,
     openapi_spec: openapi_core.OpenAPI,
@@ -404,6 +499,61 @@ async def user_deactivates_workflow(
     )
 
 
+async def user_deactivates_workflows(
+    rc: RestClient,
+    openapi_spec: openapi_core.OpenAPI,
+    kind_of_deactivation: str,
+    args: dict,
+    n_taskforces_stopped: dict[str, int],
+    not_founds: list[str],
+) -> None:
+    """Deactivate many workflows at once, by 'workflow_ids' or 'query'.
+
+    `n_taskforces_stopped` is keyed by the workflows expected to be deactivated.
+    """
+    #
+    # USER...
+    # stop workflows
+    #
+    then = time.time()
+    status, resp = await _request_and_validate_and_print__with_status(
+        rc,
+        openapi_spec,
+        "POST",
+        {
+            "ABORTED": "/v1/workflows/actions/abort",
+            "FINISHED": "/v1/workflows/actions/finished",
+        }[kind_of_deactivation],
+        args,
+    )
+    assert status == (207 if not_founds else 200)
+    assert resp["results"] == [
+        {"status": 200, "workflow_id": w, "n_taskforces": n}
+        for w, n in n_taskforces_stopped.items()
+    ] + [
+        {
+            "status": 404,
+            "workflow_id": w,
+            "error": "no non-deactivated workflow found",
+        }
+        for w in not_founds
+    ]
+
+    #
+    # USER...
+    # check above
+    #
+    for workflow_id in n_taskforces_stopped:
+        resp = await _request_and_validate_and_print(
+            rc,
+            openapi_spec,
+            "GET",
+            f"/v1/workflows/{workflow_id}",
+        )
+        assert resp["deactivated"] == kind_of_deactivation
+        assert then < resp["deactivated_ts"] < time.time()
+
+
 async def tms_stopper(
     rc: RestClient,
     openapi_spec: openapi_core.OpenAPI,
@@ -596,6 +746,15 @@ async def add_more_workers(
                     "context": "Created when adding more workers for this task directive.",
                 }
             ],
+            "n_failed_phase_changes": {
+                "pre-mq-activation": 0,
+                "pre-launch": 0,
+                "pending-starter": 0,
+                "condor-submit": 0,
+                "pending-stopper": 0,
+                "condor-rm": 0,
+                "condor-complete": 0,
+            },
         },
     }
     print("expected:", expected)
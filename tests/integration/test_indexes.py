@@ -0,0 +1,253 @@
+"""Verify that the hot daemon/handler queries are supported by indexes.
+
+Each query is explained against a seeded database (not the WMS's), then fails
+if the winning plan does a collection scan (COLLSCAN) or an in-memory sort.
+
+The queries come from the same functions the daemons and REST handlers use.
+"""
+
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator
+
+import pytest
+import pytest_asyncio
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
+
+from wms import taskforce_launch_control, workflow_mq_activator
+from wms.config import ENV
+from wms.database.utils import (
+    TASKFORCES_COLL_NAME,
+    WORKFLOWS_COLL_NAME,
+    ensure_indexes,
+)
+from wms.rest_handlers import taskforce_handlers
+from wms.schema.enums import TaskforcePhase
+
+LOGGER = logging.getLogger(__name__)
+
+TEST_DB_NAME = "WMS_DB_test_indexes"
+
+SCHEDDS = ["SCHEDD1", "SCHEDD2", "SCHEDD3"]
+N_WORKFLOWS = 200
+N_TASKFORCES_PER_WORKFLOW = 5
+
+
+# --------------------------------------------------------------------------------------
+
+
+@pytest_asyncio.fixture
+async def db() -> AsyncIterator[AsyncDatabase]:
+    """Yield a seeded database with the WMS's indexes."""
+    mongo_client = AsyncMongoClient(  # type: ignore[var-annotated]
+        f"mongodb://{os.environ['MONGODB_HOST']}:{os.environ['MONGODB_PORT']}"
+    )
+    await mongo_client.drop_database(TEST_DB_NAME)
+    await ensure_indexes(mongo_client, db_name=TEST_DB_NAME)
+
+    workflows, taskforces = [], []
+    for i in range(N_WORKFLOWS):
+        workflow_id = f"WF-{uuid.uuid4().hex}"
+        priority = random.randint(0, 100)
+        timestamp = time.time() + i
+        workflows.append(
+            {
+                "workflow_id": workflow_id,
+                "timestamp": timestamp,
+                "priority": priority,
+                "deactivated": random.choice([None, "ABORTED", "FINISHED"]),
+                "mq_activated_ts": random.choice([None, timestamp]),
+                "mq_activation_lease_until": None,
+            }
+        )
+        for _ in range(N_TASKFORCES_PER_WORKFLOW):
+            taskforces.append(
+                {
+                    "taskforce_uuid": uuid.uuid4().hex,
+                    "workflow_id": workflow_id,
+                    "timestamp": timestamp,
+                    "priority": priority,
+                    "schedd": random.choice(SCHEDDS),
+                    "phase": random.choice(list(TaskforcePhase)),
+                    "cluster_id": random.choice([None, 123]),
+                    "phase_change_log": [],
+                    "n_failed_phase_changes": {
+                        phase: random.randint(0, ENV.TMS_ACTION_RETRIES + 1)
+                        for phase in TaskforcePhase
+                    },
+                }
+            )
+    await mongo_client[TEST_DB_NAME][WORKFLOWS_COLL_NAME].insert_many(workflows)
+    await mongo_client[TEST_DB_NAME][TASKFORCES_COLL_NAME].insert_many(taskforces)
+
+    yield mongo_client[TEST_DB_NAME]
+
+    await mongo_client.drop_database(TEST_DB_NAME)
+    await mongo_client.close()
+
+
+def _get_plan_stages(explanation: Any) -> list[str]:
+    """Get the names of all the stages of all the winning plans (recursively).
+
+    Aggregation stages left over after the query layer (ex: an in-memory '$sort')
+    are included by their operator name.
+    """
+    stages: list[str] = []
+
+    def _walk(obj: Any, in_winning_plan: bool) -> None:
+        if isinstance(obj, list):
+            for o in obj:
+                _walk(o, in_winning_plan)
+        elif isinstance(obj, dict):
+            for k, v in obj.items():
+                if k == "rejectedPlans":
+                    continue
+                elif k == "stage" and in_winning_plan:
+                    stages.append(v)
+                elif k == "winningPlan":
+                    _walk(v, True)
+                else:
+                    _walk(v, in_winning_plan)
+
+    _walk(explanation, False)
+    # aggregation pipeline stages not pushed down into the query layer
+    for stage in explanation.get("stages", []):
+        stages.extend(k for k in stage if k != "$cursor")
+
+    return stages
+
+
+async def _assert_indexed(
+    db: AsyncDatabase,
+    command: dict,
+) -> None:
+    explanation = await db.command("explain", command, verbosity="queryPlanner")
+    stages = _get_plan_stages(explanation)
+    LOGGER.info(f"{command} -> {stages}")
+
+    assert "COLLSCAN" not in stages, command
+    assert "SORT" not in stages, command
+    assert "$sort" not in stages, command
+
+
+# --------------------------------------------------------------------------------------
+# workflow_mq_activator
+
+
+async def test_000__mq_activator__claim_next_workflow_id(db: AsyncDatabase) -> None:
+    """Test workflow_mq_activator.claim_next_workflow_id()."""
+    query, sort = workflow_mq_activator.get_next_workflow_query(time.time())
+    await _assert_indexed(
+        db,
+        {
+            "findAndModify": WORKFLOWS_COLL_NAME,
+            "query": query,
+            "update": {"$set": {"mq_activation_lease_until": time.time() + 600}},
+            "sort": dict(sort),
+        },
+    )
+
+
+async def test_001__mq_activator__advance_stragglers(db: AsyncDatabase) -> None:
+    """Test workflow_mq_activator.advance_stragglers_to_prelaunch()."""
+    await _assert_indexed(
+        db,
+        {
+            "aggregate": TASKFORCES_COLL_NAME,
+            "pipeline": workflow_mq_activator.get_stragglers_pipeline(),
+            "cursor": {},
+        },
+    )
+
+
+# --------------------------------------------------------------------------------------
+# taskforce_launch_control
+
+
+async def test_100__launch_control__get_next_batch(db: AsyncDatabase) -> None:
+    """Test taskforce_launch_control.get_next_batch()."""
+    query, sort = taskforce_launch_control.get_pre_launch_query()
+    await _assert_indexed(
+        db,
+        {
+            "find": TASKFORCES_COLL_NAME,
+            "filter": query,
+            "sort": dict(sort),
+            "limit": ENV.TASKFORCE_LAUNCH_CONTROL_BATCH_SIZE,
+        },
+    )
+
+
+async def test_101__launch_control__get_backlog_depth(db: AsyncDatabase) -> None:
+    """Test taskforce_launch_control.get_backlog_depth()."""
+    await _assert_indexed(
+        db,
+        {
+            "aggregate": TASKFORCES_COLL_NAME,
+            "pipeline": taskforce_launch_control.get_backlog_depth_pipeline(),
+            "cursor": {},
+        },
+    )
+
+
+async def test_102__launch_control__get_next_batch__schedd_budget(
+    db: AsyncDatabase,
+) -> None:
+    """Test taskforce_launch_control.get_next_batch(), w/ a per-schedd budget."""
+    query, _ = taskforce_launch_control.get_pre_launch_query()
+    await _assert_indexed(
+        db,
+        {
+            "distinct": TASKFORCES_COLL_NAME,
+            "key": "schedd",
+            "query": query,
+        },
+    )
+
+    query, sort = taskforce_launch_control.get_pre_launch_query(SCHEDDS[0])
+    await _assert_indexed(
+        db,
+        {
+            "find": TASKFORCES_COLL_NAME,
+            "filter": query,
+            "sort": dict(sort),
+            "limit": ENV.TASKFORCE_LAUNCH_CONTROL_BATCH_SIZE,
+        },
+    )
+
+
+# --------------------------------------------------------------------------------------
+# REST handlers
+
+
+@pytest.mark.parametrize("limit", [1, 10])  # 'limit' query param: batch handout
+async def test_200__tms_pending_starter(db: AsyncDatabase, limit: int) -> None:
+    """Test GET @ /tms/pending-starter/taskforces."""
+    query, sort = taskforce_handlers.get_pending_starter_query(SCHEDDS[0])
+    await _assert_indexed(
+        db,
+        {
+            "find": TASKFORCES_COLL_NAME,
+            "filter": query,
+            "sort": dict(sort),
+            "limit": limit,
+        },
+    )
+
+
+async def test_201__tms_pending_stopper(db: AsyncDatabase) -> None:
+    """Test GET @ /tms/pending-stopper/taskforces."""
+    query, sort = taskforce_handlers.get_pending_stopper_query(SCHEDDS[0])
+    await _assert_indexed(
+        db,
+        {
+            "find": TASKFORCES_COLL_NAME,
+            "filter": query,
+            "sort": dict(sort),
+            "limit": 1,
+        },
+    )
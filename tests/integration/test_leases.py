@@ -0,0 +1,201 @@
+"""Test the mongo-backed daemon leases."""
+
+import asyncio
+import datetime as dt
+import os
+from typing import AsyncIterator
+
+import pytest
+import pytest_asyncio
+from pymongo import AsyncMongoClient
+
+from wms.config import ENV
+from wms.database.leases import (
+    Lease,
+    REPLICA_ID,
+    run_once_holding_lease,
+    run_while_holding_lease,
+)
+from wms.database.utils import LEASES_COLL_NAME
+
+TEST_DB_NAME = "WMS_DB_test_leases"
+
+
+@pytest_asyncio.fixture
+async def mongo_client() -> AsyncIterator[AsyncMongoClient]:
+    """Yield a mongo client, with an empty test database."""
+    mongo_client = AsyncMongoClient(  # type: ignore[var-annotated]
+        f"mongodb://{os.environ['MONGODB_HOST']}:{os.environ['MONGODB_PORT']}"
+    )
+    await mongo_client.drop_database(TEST_DB_NAME)
+
+    yield mongo_client
+
+    await mongo_client.drop_database(TEST_DB_NAME)
+    await mongo_client.close()
+
+
+async def _insert_other_replicas_lease(
+    mongo_client: AsyncMongoClient,
+    name: str,
+    expires_in: float,
+) -> None:
+    await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].insert_one(
+        {
+            "_id": name,
+            "holder": "some-other-replica",
+            "expires_at": dt.datetime.now(dt.timezone.utc)
+            + dt.timedelta(seconds=expires_in),
+        }
+    )
+
+
+async def test_000__acquire_free(mongo_client: AsyncMongoClient) -> None:
+    """Test acquiring (and renewing) a free lease."""
+    lease = Lease(mongo_client, "foo", db_name=TEST_DB_NAME)
+
+    assert await lease.acquire()
+    assert await lease.acquire()  # renew
+
+    doc = await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].find_one({"_id": "foo"})
+    assert doc
+    assert doc["holder"] == REPLICA_ID
+
+
+async def test_001__acquire_held(mongo_client: AsyncMongoClient) -> None:
+    """Test that a lease held by another replica cannot be acquired."""
+    await _insert_other_replicas_lease(mongo_client, "foo", expires_in=60)
+    lease = Lease(mongo_client, "foo", db_name=TEST_DB_NAME)
+
+    assert not await lease.acquire()
+
+    # and, releasing does not touch another replica's lease
+    await lease.release()
+    doc = await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].find_one({"_id": "foo"})
+    assert doc
+    assert doc["holder"] == "some-other-replica"
+
+
+async def test_002__acquire_expired(mongo_client: AsyncMongoClient) -> None:
+    """Test taking over a lease that another replica let expire."""
+    await _insert_other_replicas_lease(mongo_client, "foo", expires_in=-1)
+    lease = Lease(mongo_client, "foo", db_name=TEST_DB_NAME)
+
+    assert await lease.acquire()
+
+
+async def test_003__release(mongo_client: AsyncMongoClient) -> None:
+    """Test releasing a lease, so it is free for others."""
+    lease = Lease(mongo_client, "foo", db_name=TEST_DB_NAME)
+    assert await lease.acquire()
+
+    await lease.release()
+    assert not await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].find_one(
+        {"_id": "foo"}
+    )
+
+
+async def test_100__run_while_holding_lease(mongo_client: AsyncMongoClient) -> None:
+    """Test that the daemon only runs while the lease is held."""
+    await _insert_other_replicas_lease(mongo_client, "foo", expires_in=60)
+    started = asyncio.Event()
+
+    async def daemon() -> None:
+        started.set()
+        await asyncio.Event().wait()
+
+    task = asyncio.create_task(
+        run_while_holding_lease(mongo_client, "foo", daemon, db_name=TEST_DB_NAME)
+    )
+
+    # the other replica holds the lease
+    await asyncio.sleep(ENV.LEASE_RENEW_INTERVAL + 1)
+    assert not started.is_set()
+
+    # ...then, lets it go
+    await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].delete_one({"_id": "foo"})
+    await asyncio.wait_for(started.wait(), timeout=ENV.LEASE_RENEW_INTERVAL + 1)
+
+    # shutting down releases the lease
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].find_one(
+        {"_id": "foo"}
+    )
+
+
+async def test_101__run_while_holding_lease__renewal_hangs(
+    mongo_client: AsyncMongoClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that the daemon is cancelled before the lease expires, if renewing hangs."""
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def daemon() -> None:
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    task = asyncio.create_task(
+        run_while_holding_lease(mongo_client, "foo", daemon, db_name=TEST_DB_NAME)
+    )
+    await asyncio.wait_for(started.wait(), timeout=ENV.LEASE_RENEW_INTERVAL)
+
+    # the db stops responding (but doesn't error)
+    async def hang(self: Lease) -> bool:
+        await asyncio.Event().wait()
+        return True
+
+    monkeypatch.setattr(Lease, "acquire", hang)
+    await asyncio.wait_for(cancelled.wait(), timeout=ENV.LEASE_DURATION)
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_200__run_once_holding_lease(mongo_client: AsyncMongoClient) -> None:
+    """Test that the task waits for the lease, runs once, then releases it."""
+    await _insert_other_replicas_lease(mongo_client, "foo", expires_in=60)
+    n_runs = 0
+
+    async def func() -> None:
+        nonlocal n_runs
+        n_runs += 1
+
+    task = asyncio.create_task(
+        run_once_holding_lease(mongo_client, "foo", func, db_name=TEST_DB_NAME)
+    )
+
+    # the other replica holds the lease
+    await asyncio.sleep(ENV.LEASE_RENEW_INTERVAL + 1)
+    assert not n_runs
+
+    # ...then, lets it go
+    await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].delete_one({"_id": "foo"})
+    await asyncio.wait_for(task, timeout=ENV.LEASE_RENEW_INTERVAL + 1)
+    assert n_runs == 1
+
+    # and, releases the lease
+    assert not await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].find_one(
+        {"_id": "foo"}
+    )
+
+
+async def test_201__run_once_holding_lease__errors(
+    mongo_client: AsyncMongoClient,
+) -> None:
+    """Test that the task's error is raised, and the lease is still released."""
+
+    async def func() -> None:
+        raise ValueError("oops")
+
+    with pytest.raises(ValueError, match="oops"):
+        await run_once_holding_lease(mongo_client, "foo", func, db_name=TEST_DB_NAME)
+
+    assert not await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].find_one(
+        {"_id": "foo"}
+    )
@@ -0,0 +1,241 @@
+"""Test the bounded 'phase_change_log's, and their full history (PhaseChangeLogColl)."""
+
+import os
+import time
+import uuid
+from typing import AsyncIterator
+
+import pytest
+import pytest_asyncio
+from pymongo import AsyncMongoClient
+
+from wms.config import ENV
+from wms.database.client import DocumentNotFoundException, WMSMongoValidatedDatabase
+from wms.database.migrations import run_migrations
+from wms.database.utils import (
+    LEASES_COLL_NAME,
+    MIGRATIONS_COLL_NAME,
+    PHASE_CHANGE_LOGS_COLL_NAME,
+    TASKFORCES_COLL_NAME,
+)
+
+TEST_DB_NAME = "WMS_DB_test_phase_change_logs"
+
+N_MAX = ENV.PHASE_CHANGE_LOG_MAX_ENTRIES
+
+
+@pytest_asyncio.fixture
+async def mongo_client() -> AsyncIterator[AsyncMongoClient]:
+    """Yield a mongo client, with an empty test database."""
+    mongo_client = AsyncMongoClient(  # type: ignore[var-annotated]
+        f"mongodb://{os.environ['MONGODB_HOST']}:{os.environ['MONGODB_PORT']}"
+    )
+    await mongo_client.drop_database(TEST_DB_NAME)
+
+    yield mongo_client
+
+    await mongo_client.drop_database(TEST_DB_NAME)
+    await mongo_client.close()
+
+
+@pytest.fixture
+def wms_db(mongo_client: AsyncMongoClient) -> WMSMongoValidatedDatabase:
+    """Yield a WMS database client, using the test database."""
+    return WMSMongoValidatedDatabase(mongo_client, db_name=TEST_DB_NAME)
+
+
+def _make_entry(i: int) -> dict:
+    return {
+        "target_phase": "pre-launch",
+        "timestamp": time.time() + i,
+        "source_event_time": None,
+        "was_successful": True,
+        "source_entity": "Test",
+        "context": f"entry #{i}",
+    }
+
+
+async def _insert_taskforce(
+    mongo_client: AsyncMongoClient,
+    workflow_id: str,
+    phase: str,
+    phase_change_log: list[dict],
+) -> str:
+    """Insert a (partial) taskforce directly, like an older WMS would have."""
+    taskforce_uuid = uuid.uuid4().hex
+    await mongo_client[TEST_DB_NAME][TASKFORCES_COLL_NAME].insert_one(
+        {
+            "taskforce_uuid": taskforce_uuid,
+            "workflow_id": workflow_id,
+            "phase": phase,
+            "phase_change_log": phase_change_log,
+        }
+    )
+    return taskforce_uuid
+
+
+async def _get_archived(mongo_client: AsyncMongoClient, taskforce_uuid: str) -> list:
+    return await (
+        mongo_client[TEST_DB_NAME][PHASE_CHANGE_LOGS_COLL_NAME]
+        .find({"taskforce_uuid": taskforce_uuid}, {"_id": False})
+        .sort("timestamp", 1)
+        .to_list()
+    )
+
+
+async def _get_phase_change_log(
+    mongo_client: AsyncMongoClient,
+    taskforce_uuid: str,
+) -> list:
+    doc = await mongo_client[TEST_DB_NAME][TASKFORCES_COLL_NAME].find_one(
+        {"taskforce_uuid": taskforce_uuid}
+    )
+    assert doc
+    return doc["phase_change_log"]
+
+
+# --------------------------------------------------------------------------------------
+
+
+async def test_000__push_is_trimmed_and_archived(
+    mongo_client: AsyncMongoClient,
+    wms_db: WMSMongoValidatedDatabase,
+) -> None:
+    """Test that a '$push' keeps the last N entries, and archives every entry."""
+    tf_uuid = await _insert_taskforce(mongo_client, "WF-1", "pre-launch", [])
+
+    entries = [_make_entry(i) for i in range(N_MAX + 5)]
+    for entry in entries:
+        await wms_db.taskforces_collection.find_one_and_update(
+            {"taskforce_uuid": tf_uuid},
+            {"$push": {"phase_change_log": entry}},
+        )
+
+    assert await _get_phase_change_log(mongo_client, tf_uuid) == entries[-N_MAX:]
+    assert await _get_archived(mongo_client, tf_uuid) == [
+        {"taskforce_uuid": tf_uuid, "workflow_id": "WF-1", **e} for e in entries
+    ]
+
+
+async def test_001__update_many_only_archives_updated(
+    mongo_client: AsyncMongoClient,
+    wms_db: WMSMongoValidatedDatabase,
+) -> None:
+    """Test that 'update_many' archives the entry only for the updated taskforces."""
+    updated = [
+        await _insert_taskforce(mongo_client, "WF-1", "pre-launch", []),
+        await _insert_taskforce(mongo_client, "WF-1", "pre-launch", []),
+    ]
+    not_updated = [
+        await _insert_taskforce(mongo_client, "WF-1", "pending-starter", []),
+        await _insert_taskforce(mongo_client, "WF-2", "pre-launch", []),
+    ]
+
+    entry = _make_entry(0)
+    n = await wms_db.taskforces_collection.update_many(
+        {"workflow_id": "WF-1", "phase": "pre-launch"},
+        {
+            "$set": {"phase": "pending-starter"},
+            "$push": {"phase_change_log": entry},
+        },
+    )
+    assert n == len(updated)
+
+    for tf_uuid in updated:
+        assert await _get_phase_change_log(mongo_client, tf_uuid) == [entry]
+        assert await _get_archived(mongo_client, tf_uuid) == [
+            {"taskforce_uuid": tf_uuid, "workflow_id": "WF-1", **entry}
+        ]
+    for tf_uuid in not_updated:
+        assert await _get_phase_change_log(mongo_client, tf_uuid) == []
+        assert await _get_archived(mongo_client, tf_uuid) == []
+
+    # and, no matches -> nothing archived
+    with pytest.raises(DocumentNotFoundException):
+        await wms_db.taskforces_collection.update_many(
+            {"workflow_id": "WF-3"},
+            {"$push": {"phase_change_log": _make_entry(1)}},
+        )
+    archive = mongo_client[TEST_DB_NAME][PHASE_CHANGE_LOGS_COLL_NAME]
+    assert await archive.count_documents({}) == len(updated)
+
+
+async def test_002__archived_in_the_writes_transaction(
+    mongo_client: AsyncMongoClient,
+    wms_db: WMSMongoValidatedDatabase,
+) -> None:
+    """Test that the archiving uses the caller's transaction, so it is rolled back
+    with the write."""
+    tf_uuid = await _insert_taskforce(mongo_client, "WF-1", "pre-launch", [])
+
+    class Abort(Exception):
+        pass
+
+    with pytest.raises(Abort):
+        async with mongo_client.start_session() as s:
+            async with await s.start_transaction():
+                await wms_db.taskforces_collection.find_one_and_update(
+                    {"taskforce_uuid": tf_uuid},
+                    {"$push": {"phase_change_log": _make_entry(0)}},
+                    session=s,
+                )
+                await wms_db.taskforces_collection.update_many(
+                    {"taskforce_uuid": tf_uuid},
+                    {"$push": {"phase_change_log": _make_entry(1)}},
+                    session=s,
+                )
+                raise Abort()
+
+    assert await _get_phase_change_log(mongo_client, tf_uuid) == []
+    assert await _get_archived(mongo_client, tf_uuid) == []
+
+
+# --------------------------------------------------------------------------------------
+
+
+async def test_100__migration_copies_and_trims(mongo_client: AsyncMongoClient) -> None:
+    """Test that the migration archives the full logs, then trims them."""
+    long_log = [_make_entry(i) for i in range(N_MAX + 7)]
+    short_log = [_make_entry(i) for i in range(3)]
+    long_uuid = await _insert_taskforce(mongo_client, "WF-1", "pre-launch", long_log)
+    short_uuid = await _insert_taskforce(mongo_client, "WF-2", "pre-launch", short_log)
+
+    for _ in range(2):  # the 2nd run is a no-op
+        await run_migrations(mongo_client, db_name=TEST_DB_NAME)
+
+        assert await _get_phase_change_log(mongo_client, long_uuid) == long_log[-N_MAX:]
+        assert await _get_phase_change_log(mongo_client, short_uuid) == short_log
+        assert await _get_archived(mongo_client, long_uuid) == [
+            {"taskforce_uuid": long_uuid, "workflow_id": "WF-1", **e} for e in long_log
+        ]
+        assert await _get_archived(mongo_client, short_uuid) == [
+            {"taskforce_uuid": short_uuid, "workflow_id": "WF-2", **e}
+            for e in short_log
+        ]
+
+    # the marker is set, and the lease is released
+    assert await mongo_client[TEST_DB_NAME][MIGRATIONS_COLL_NAME].find_one(
+        {"_id": "phase_change_logs_copied"}
+    )
+    assert not await mongo_client[TEST_DB_NAME][LEASES_COLL_NAME].find_one(
+        {"_id": "migrations"}
+    )
+
+
+async def test_101__migration_redoes_interrupted_copy(
+    mongo_client: AsyncMongoClient,
+) -> None:
+    """Test that a copy that was interrupted (no marker) is redone, w/o duplicates."""
+    log = [_make_entry(i) for i in range(N_MAX + 2)]
+    tf_uuid = await _insert_taskforce(mongo_client, "WF-1", "pre-launch", log)
+    # some of the copy happened...
+    await mongo_client[TEST_DB_NAME][PHASE_CHANGE_LOGS_COLL_NAME].insert_many(
+        [{"taskforce_uuid": tf_uuid, "workflow_id": "WF-1", **e} for e in log[:5]]
+    )
+
+    await run_migrations(mongo_client, db_name=TEST_DB_NAME)
+
+    assert await _get_phase_change_log(mongo_client, tf_uuid) == log[-N_MAX:]
+    assert await _get_archived(mongo_client, tf_uuid) == [
+        {"taskforce_uuid": tf_uuid, "workflow_id": "WF-1", **e} for e in log
+    ]
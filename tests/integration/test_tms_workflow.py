@@ -1,17 +1,24 @@
 """Mimic a TMS workflow, hitting the expected REST endpoints."""
 
+import asyncio
 import logging
 import re
+import time
 from dataclasses import asdict
 
 import pytest
 import requests
 from rest_tools.client import RestClient
 
+from wms.config import ENV
+
 from . import ewms_actions
 from .utils import (
     CONDOR_LOCATIONS_LOOKUP,
     StateForTMS,
+    _request_and_validate_and_print,
+    _request_ndjson_and_print,
+    _request_text_and_print,
     check_nothing_to_start,
     check_nothing_to_stop,
     check_taskforce_states,
@@ -1122,3 +1129,321 @@ async def test_220__add_workers_after_condor(rc: RestClient) -> None:
         workflow_id,
         "FINISHED",
     )
+
+
+# --------------------------------------------------------------------------------------
+
+
+async def test_300__batch(rc: RestClient) -> None:
+    """Many workflows at once -- all created."""
+    openapi_spec = await ewms_actions.query_for_schema(rc)
+
+    workflow_ids = await ewms_actions.user_requests_new_workflows_batch(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+        n_workflows=5,
+        bad_indexes=[],
+    )
+    assert len(workflow_ids) == 5
+
+
+async def test_301__batch_mixed(rc: RestClient) -> None:
+    """Many workflows at once -- some invalid, the rest are still created."""
+    openapi_spec = await ewms_actions.query_for_schema(rc)
+
+    workflow_ids = await ewms_actions.user_requests_new_workflows_batch(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+        n_workflows=5,
+        bad_indexes=[1, 4],
+    )
+    assert len(workflow_ids) == 3
+
+
+# --------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "kind_of_deactivation",
+    ["ABORTED", "FINISHED"],
+)
+async def test_400__deactivate_many(rc: RestClient, kind_of_deactivation: str) -> None:
+    """Deactivate many workflows at once (see param for kind_of_deactivation)."""
+    openapi_spec = await ewms_actions.query_for_schema(rc)
+
+    w0, w1, w2, w3 = await ewms_actions.user_requests_new_workflows_batch(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+        n_workflows=4,
+        bad_indexes=[],
+    )
+    n_tfs = len(CONDOR_LOCATIONS_LOOKUP)
+
+    # by ids -- one doesn't exist
+    await ewms_actions.user_deactivates_workflows(
+        rc,
+        openapi_spec,
+        kind_of_deactivation,
+        {"workflow_ids": [w0, w1, "not-a-workflow-id"]},
+        {w0: n_tfs, w1: n_tfs},
+        ["not-a-workflow-id"],
+    )
+    # by ids -- already deactivated
+    await ewms_actions.user_deactivates_workflows(
+        rc,
+        openapi_spec,
+        kind_of_deactivation,
+        {"workflow_ids": [w0]},
+        {},
+        [w0],
+    )
+    # by query -- already-deactivated ones are skipped
+    await ewms_actions.user_deactivates_workflows(
+        rc,
+        openapi_spec,
+        kind_of_deactivation,
+        {"query": {"workflow_id": {"$in": [w1, w2]}}},
+        {w2: n_tfs},
+        [],
+    )
+
+    # CHECK FINAL STATES...
+    for workflow_id in [w0, w1, w2]:
+        await check_workflow_deactivation(
+            rc,
+            openapi_spec,
+            workflow_id,
+            kind_of_deactivation,
+        )
+    await check_workflow_deactivation(rc, openapi_spec, w3, None)
+
+
+# --------------------------------------------------------------------------------------
+
+
+async def test_500__query_phase_change_logs(rc: RestClient) -> None:
+    """Query the taskforces' full phase-change histories, paginated & streamed."""
+    openapi_spec = await ewms_actions.query_for_schema(rc)
+
+    workflow_id, task_id, tms_states = await ewms_actions.user_requests_new_workflow(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+    )
+    await ewms_actions.tms_starter(rc, openapi_spec, task_id, tms_states)
+
+    # the taskforces' logs are short, so they are still complete
+    resp = await _request_and_validate_and_print(
+        rc,
+        openapi_spec,
+        "POST",
+        "/v1/query/taskforces",
+        {
+            "query": {"task_id": task_id},
+            "projection": ["taskforce_uuid", "phase_change_log"],
+        },
+    )
+    expected = [
+        {"taskforce_uuid": tf["taskforce_uuid"], "workflow_id": workflow_id, **e}
+        for tf in resp["taskforces"]
+        for e in tf["phase_change_log"]
+    ]
+    assert expected
+
+    def _key(entry: dict) -> tuple:
+        return entry["taskforce_uuid"], entry["timestamp"]
+
+    # paginated -- follow 'next_after' until done
+    paginated: list[dict] = []
+    args: dict = {"query": {"workflow_id": workflow_id}}
+    while True:
+        resp = await _request_and_validate_and_print(
+            rc,
+            openapi_spec,
+            "POST",
+            "/v1/query/phase-change-logs",
+            args,
+        )
+        paginated.extend(resp["phase_change_logs"])
+        if not resp["next_after"]:
+            break
+        args["after"] = resp["next_after"]
+    assert sorted(paginated, key=_key) == sorted(expected, key=_key)
+
+    # streamed -- same order as paginated
+    streamed = await _request_ndjson_and_print(
+        rc,
+        "POST",
+        "/v1/query/phase-change-logs",
+        {"query": {"workflow_id": workflow_id}},
+    )
+    assert streamed == paginated
+
+
+# --------------------------------------------------------------------------------------
+
+
+async def test_600__pending_starter_long_poll(rc: RestClient) -> None:
+    """A TMS's long-poll ('wait') returns as soon as there is a taskforce to start."""
+    openapi_spec = await ewms_actions.query_for_schema(rc)
+    schedd = CONDOR_LOCATIONS_LOOKUP["test-alpha"]["schedd"]
+
+    # the db was emptied (see 'rc' fixture), so nothing is pending for the schedd
+    await check_nothing_to_start(rc, openapi_spec, CONDOR_LOCATIONS_LOOKUP)
+
+    # requests are held open, so use a longer timeout
+    long_rc = RestClient(rc.address, timeout=60, retries=0)
+
+    # nothing to start -> empty, once 'wait' runs out
+    wait = 2
+    start = time.monotonic()
+    resp = await _request_and_validate_and_print(
+        long_rc,
+        openapi_spec,
+        "GET",
+        "/v1/tms/pending-starter/taskforces",
+        {"schedd": schedd, "wait": wait},
+    )
+    assert resp == {}
+    # not before 'wait' -- and the deadline is honored between rechecks (+ overhead)
+    assert wait <= time.monotonic() - start < wait + ENV.TMS_LONG_POLL_RECHECK_INTERVAL
+
+    # TMS waits...
+    async def tms_long_polls() -> tuple[dict, float]:
+        resp = await _request_and_validate_and_print(
+            long_rc,
+            openapi_spec,
+            "GET",
+            "/v1/tms/pending-starter/taskforces",
+            {"schedd": schedd, "wait": ENV.TMS_LONG_POLL_MAX_WAIT},
+        )
+        return resp, time.time()
+
+    long_poll = asyncio.create_task(tms_long_polls())
+
+    # ...while the user requests a workflow (this waits for the background runners)
+    _, task_id, _ = await ewms_actions.user_requests_new_workflow(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+    )
+    resp, returned_at = await asyncio.wait_for(
+        long_poll, timeout=ENV.TMS_LONG_POLL_MAX_WAIT * 2
+    )
+    assert resp["taskforce"]["task_id"] == task_id
+    assert resp["taskforce"]["schedd"] == schedd
+    assert resp["task_directive"]["task_id"] == task_id
+    assert resp["mqprofiles"]
+
+    # it returned when the taskforce became pending-starter -- at the latest, by the
+    #   next recheck (that is the fallback, if the notification was missed)
+    taskforce = await _request_and_validate_and_print(
+        rc,
+        openapi_spec,
+        "GET",
+        f"/v1/taskforces/{resp['taskforce']['taskforce_uuid']}",
+    )
+    assert taskforce["phase"] == "pending-starter"  # a GET doesn't advance it
+    pending_starter_ts = taskforce["phase_change_log"][-1]["timestamp"]
+    assert returned_at - pending_starter_ts < ENV.TMS_LONG_POLL_RECHECK_INTERVAL + 1
+
+
+async def test_610__pending_starter_batch(rc: RestClient) -> None:
+    """A TMS gets a batch ('limit') of taskforces to start, in order."""
+    openapi_spec = await ewms_actions.query_for_schema(rc)
+    schedd = CONDOR_LOCATIONS_LOOKUP["test-alpha"]["schedd"]
+
+    # 2 workflows, then another taskforce for the 1st one's task (bumped priority)
+    #   -> SCHEDD1 has 3 taskforces to start, 2 of which share a task directive
+    _, task_id_a, tms_states_a = await ewms_actions.user_requests_new_workflow(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+    )
+    _, task_id_b, _ = await ewms_actions.user_requests_new_workflow(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+    )
+    await ewms_actions.add_more_workers(
+        rc,
+        openapi_spec,
+        task_id_a,
+        "test-alpha",
+        tms_states_a,
+    )
+
+    # what order should they be started in?
+    resp = await _request_and_validate_and_print(
+        rc,
+        openapi_spec,
+        "POST",
+        "/v1/query/taskforces",
+        {"query": {"schedd": schedd, "phase": "pending-starter"}},
+    )
+    expected = sorted(
+        resp["taskforces"],
+        key=lambda tf: (-tf["priority"], tf["timestamp"]),  # none have failed yet
+    )
+    assert [tf["task_id"] for tf in expected] == [task_id_a, task_id_a, task_id_b]
+
+    for limit in [100, 2]:
+        resp = await _request_and_validate_and_print(
+            rc,
+            openapi_spec,
+            "GET",
+            "/v1/tms/pending-starter/taskforces",
+            {"schedd": schedd, "limit": limit},
+        )
+        assert resp["taskforces"] == expected[:limit]
+        # each task directive & mq-profile is included once
+        task_ids = [td["task_id"] for td in resp["task_directives"]]
+        assert sorted(task_ids) == sorted({tf["task_id"] for tf in expected[:limit]})
+        mqids = [p["mqid"] for p in resp["mqprofiles"]]
+        assert len(mqids) == len(set(mqids))
+        assert set(mqids) == {
+            q
+            for td in resp["task_directives"]
+            for q in td["input_queues"] + td["output_queues"]
+        }
+
+    # nothing was advanced -- that's done when the TMS confirms a condor-submit
+    await check_taskforce_states(
+        rc,
+        openapi_spec,
+        task_id_a,
+        sum(s.n_taskforces for s in tms_states_a),
+        "pending-starter",
+        ("pending-starter", True),
+    )
+
+
+# --------------------------------------------------------------------------------------
+
+
+async def test_700__metrics(rc: RestClient) -> None:
+    """The metrics reflect the requests, db operations, and taskforces so far."""
+    openapi_spec = await ewms_actions.query_for_schema(rc)
+
+    await ewms_actions.user_requests_new_workflow(
+        rc,
+        openapi_spec,
+        list(CONDOR_LOCATIONS_LOOKUP.keys()),
+    )
+
+    text, content_type = await _request_text_and_print(rc, "GET", "/v1/metrics")
+    assert content_type.startswith("text/plain")  # prometheus text format
+    assert (
+        'wms_request_seconds_count{route="/v1/workflows",method="POST",status="200"}'
+    ) in text
+    assert (
+        'wms_db_operation_seconds_count{collection="WorkflowColl",'
+        'operation="insert_many"}'
+    ) in text
+    # counted at request time -- other tests' taskforces were wiped, see conftest.py
+    n_taskforces = len(CONDOR_LOCATIONS_LOOKUP)
+    assert f'wms_taskforces{{phase="pending-starter"}} {n_taskforces}.0' in text
+    assert 'wms_taskforces{phase="condor-complete"} 0.0' in text
@@ -7,6 +7,7 @@ import os
 from typing import Any
 
 import openapi_core
+from openapi_core.contrib import requests as openapi_core_requests
 from rest_tools.client import RestClient
 from rest_tools.client.utils import request_and_validate
 
@@ -44,6 +45,66 @@ async def _request_and_validate_and_print(
     return ret
 
 
+async def _request_and_validate_and_print__with_status(
+    rc: RestClient,
+    openapi_spec: "openapi_core.OpenAPI",
+    method: str,
+    path: str,
+    args: dict[str, Any] | None = None,
+) -> tuple[int, Any]:
+    """Like `_request_and_validate_and_print()` but also return the status code.
+
+    Needed when successful responses only differ by status (ex: 200 vs 207).
+    """
+    print(f"{method} @ {path}:")
+    url, kwargs = rc._prepare(method, path, args=args)
+    response = await asyncio.wrap_future(rc.session.request(method, url, **kwargs))  # type: ignore[var-annotated,arg-type]
+    openapi_spec.validate_response(
+        openapi_core_requests.RequestsOpenAPIRequest(response.request),
+        openapi_core_requests.RequestsOpenAPIResponse(response),
+    )
+    response.raise_for_status()
+    ret = rc._decode(response.content)
+    print(f"{response.status_code}: {json.dumps(ret, indent=4)}")
+    return response.status_code, ret
+
+
+async def _request_ndjson_and_print(
+    rc: RestClient,
+    method: str,
+    path: str,
+    args: dict[str, Any] | None = None,
+) -> list[Any]:
+    """Request a streamed, newline-delimited JSON response -- one object per line.
+
+    NOTE: not validated against the OpenAPI spec, which can only describe one line.
+    """
+    print(f"{method} @ {path} (ndjson):")
+    url, kwargs = rc._prepare(
+        method, path, args=args, headers={"Accept": "application/x-ndjson"}
+    )
+    response = await asyncio.wrap_future(rc.session.request(method, url, **kwargs))  # type: ignore[var-annotated,arg-type]
+    response.raise_for_status()
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    ret = [json.loads(line) for line in response.text.splitlines()]
+    print(json.dumps(ret, indent=4))
+    return ret
+
+
+async def _request_text_and_print(
+    rc: RestClient,
+    method: str,
+    path: str,
+) -> tuple[str, str]:
+    """Request a plain-text (non-JSON) response -- return it and its content type."""
+    print(f"{method} @ {path} (text):")
+    url, kwargs = rc._prepare(method, path)
+    response = await asyncio.wrap_future(rc.session.request(method, url, **kwargs))  # type: ignore[var-annotated,arg-type]
+    response.raise_for_status()
+    print(response.text)
+    return response.text, response.headers["Content-Type"]
+
+
 async def sleep_until_background_runners_advance_taskforces(n_taskforces: int) -> None:
     ############################################
     # mq activator & launch control runs...
@@ -81,6 +142,24 @@ async def check_taskforce_states(
         assert tf["phase_change_log"][-1]["was_successful"] is last_phase_change[1]
     # fmt: on
 
+    # the server-side counts should agree
+    resp = await _request_and_validate_and_print(
+        rc,
+        openapi_spec,
+        "POST",
+        "/v1/query/taskforces/stats",
+        {
+            "query": {"task_id": task_id},
+            "group_by": ["phase"],
+        },
+    )
+    assert resp == {
+        "counts": (
+            [{"group": {"phase": phase}, "count": n_taskforces}] if n_taskforces else []
+        ),
+        "total": n_taskforces,
+    }
+
 
 async def check_workflow_deactivation(
     rc: RestClient,
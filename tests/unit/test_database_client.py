@@ -0,0 +1,28 @@
+"""Test the compiled validators of database.client.py."""
+
+import pytest
+from pymongo import AsyncMongoClient
+from tornado import web
+
+from wms.database import client
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_validate(compiled: bool, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test validation, compiled or using the library's fallback."""
+    if not compiled:  # as if wipac_dev_tools no longer had this private function
+        monkeypatch.setattr(client, "_mongo_expand_dotted_keys", None)
+    wms_db = client.WMSMongoValidatedDatabase(AsyncMongoClient(connect=False))
+    coll = wms_db.task_directives_collection
+    assert (coll._full_validator is not None) == compiled
+
+    # full docs
+    with pytest.raises(web.HTTPError):
+        coll._validate({"task_id": "TK-123"})  # missing required fields
+
+    # partial updates
+    coll._validate({"task_id": "TK-123"}, allow_partial_update=True)
+    with pytest.raises(web.HTTPError):
+        coll._validate({"task_id": 123}, allow_partial_update=True)
+    with pytest.raises(web.HTTPError):
+        coll._validate({"task_id": "TK-123", "foo": 1}, allow_partial_update=True)
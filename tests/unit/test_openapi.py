@@ -9,7 +9,7 @@ from openapi_core.templating.paths.exceptions import PathNotFound
 from openapi_core.templating.paths.finders import APICallPathFinder
 
 from wms import server
-from wms.config import OPENAPI_SPEC
+from wms.config import MAX_WORKFLOWS_PER_DEACTIVATION, OPENAPI_DICT, OPENAPI_SPEC
 
 LOGGER = logging.getLogger(__name__)
 
@@ -59,3 +59,15 @@ def test_census_routes() -> None:
     for missed in missing:
         LOGGER.critical(f"rest route not found in openapi schema: {missed}")
     assert not missing
+
+
+def test_max_workflows_per_deactivation() -> None:
+    """Check that the 'query' cap matches the 'workflow_ids' cap."""
+    for action in ["abort", "finished"]:
+        body = OPENAPI_DICT["paths"][f"/v1/workflows/actions/{action}"]["post"]
+        schema = body["requestBody"]["content"]["application/json"]["schema"]
+        (ids_form,) = [s for s in schema["oneOf"] if "workflow_ids" in s["properties"]]
+        assert (
+            ids_form["properties"]["workflow_ids"]["maxItems"]
+            == MAX_WORKFLOWS_PER_DEACTIVATION
+        )
@@ -0,0 +1,44 @@
+"""Test pilot tag resolution against the tag index."""
+
+import time
+
+import pytest
+from wipac_dev_tools.container_registry_tools import ImageNotFoundException
+
+from wms.pilot_tags import _TagIndex
+
+INDEX = _TagIndex(
+    frozenset(["3.4.5", "3.1.5", "3.3.5", "1.0.0", "test-foo"]),
+    ["3.4.5", "3.3.5", "3.1.5", "1.0.0"],
+    time.time(),
+)
+
+
+@pytest.mark.parametrize(
+    "tag,expected",
+    [
+        ("3.4.5", "3.4.5"),
+        ("v3.4.5", "3.4.5"),
+        ("3.1", "3.1.5"),
+        ("v3", "3.4.5"),
+        ("1", "1.0.0"),
+        ("latest", "3.4.5"),
+        ("test-foo", "test-foo"),
+    ],
+)
+def test_resolve(tag: str, expected: str) -> None:
+    """Test resolving tags that exist."""
+    assert INDEX.resolve(tag) == expected
+
+
+@pytest.mark.parametrize("tag", ["3.2", "2", "3.4.6", "typO_t4g"])
+def test_resolve_not_found(tag: str) -> None:
+    """Test resolving tags that do not exist."""
+    with pytest.raises(ImageNotFoundException):
+        INDEX.resolve(tag)
+
+
+def test_resolve_latest_empty() -> None:
+    """Test resolving 'latest' when there are no 'X.Y.Z' tags."""
+    with pytest.raises(ImageNotFoundException):
+        _TagIndex(frozenset(["test-foo"]), [], time.time()).resolve("latest")
@@ -0,0 +1,171 @@
+"""Test the precompiled request validators."""
+
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+import tornado
+
+from wms import server
+from wms.config import OPENAPI_DICT
+from wms.rest_handlers import request_validation
+
+LOGGER = logging.getLogger(__name__)
+
+
+def test_route_to_openapi_path() -> None:
+    """Check that all the routes convert to paths in the openapi schema."""
+    for handler in server.HANDLERS:
+        path = request_validation.route_to_openapi_path(getattr(handler, "ROUTE"))
+        LOGGER.info(f"{getattr(handler, 'ROUTE')} -> {path}")
+        assert path in OPENAPI_DICT["paths"]
+
+
+def test_compile_validators() -> None:
+    """Check that every route+method's validators compile."""
+    request_validation.compile_validators(server.HANDLERS)
+
+    for handler in server.HANDLERS:
+        for method in tornado.web.RequestHandler.SUPPORTED_METHODS:
+            if method.lower() in vars(handler):
+                assert (
+                    getattr(handler, "ROUTE"),
+                    method,
+                ) in request_validation._VALIDATORS
+
+
+def test_body_validator() -> None:
+    """Check that a body validator resolves its '$ref's against the whole spec."""
+    rv = request_validation.get_route_validator(
+        server.rest_handlers.taskforce_handlers.TaskforcesFindHandler.ROUTE,
+        "POST",
+    )
+    assert rv.body
+    assert rv.body_required
+
+    assert not list(rv.body.iter_errors({"query": {}}))
+    assert not list(rv.body.iter_errors({"query": {}, "projection": ["phase"]}))
+    assert list(rv.body.iter_errors({}))  # missing 'query'
+    assert list(rv.body.iter_errors({"query": {}, "foo": 1}))  # extra field
+
+
+def test_query_param_validator() -> None:
+    """Check that query params are compiled, including '$ref'-ed ones."""
+    rv = request_validation.get_route_validator(
+        server.rest_handlers.taskforce_handlers.TMSTaskforcePendingStarterHandler.ROUTE,
+        "GET",
+    )
+    assert rv.body is None
+    assert rv.query_params["schedd"].required
+    assert not list(rv.query_params["schedd"].validator.iter_errors("SCHEDD1"))
+    assert list(rv.query_params["schedd"].validator.iter_errors(123))
+
+
+def test_to_human_readable() -> None:
+    """Check that errors are readable, w/o the offending value."""
+    rv = request_validation.get_route_validator(
+        server.rest_handlers.taskforce_handlers.TaskforcesFindHandler.ROUTE,
+        "POST",
+    )
+    assert rv.body
+
+    errors = request_validation._check(
+        rv.body, {"query": "my-secret", "projection": []}
+    )
+    assert sorted(errors) == [
+        "'projection': must have at least 1 items",
+        "'query': must be type 'object' (dict)",
+    ]
+
+
+def _make_request(query_arguments: dict[str, list[bytes]]) -> MagicMock:
+    zelf = MagicMock()
+    zelf.request.query_arguments = query_arguments
+    zelf.request.body = b""
+    return zelf
+
+
+def test_query_params_are_cast() -> None:
+    """Check that query-param strings are cast to their schema's type."""
+    rv = request_validation.get_route_validator(
+        server.rest_handlers.taskforce_handlers.TMSTaskforcePendingStarterHandler.ROUTE,
+        "GET",
+    )
+
+    ok = _make_request({"schedd": [b"SCHEDD1"], "limit": [b"5"], "wait": [b"0"]})
+    assert request_validation._get_errors(ok, rv, {}) == []
+
+    bad = _make_request({"schedd": [b"SCHEDD1"], "limit": [b"abc"]})
+    assert request_validation._get_errors(bad, rv, {}) == [
+        "limit: must be type 'integer' (int)"
+    ]
+
+    missing = _make_request({})
+    assert request_validation._get_errors(missing, rv, {}) == [
+        "Missing required query parameter: schedd"
+    ]
+
+
+def test_repeated_query_param() -> None:
+    """Check that only the last value of a repeated query param is validated.
+
+    That is the one the handler reads (`get_argument()`).
+    """
+    rv = request_validation.get_route_validator(
+        server.rest_handlers.taskforce_handlers.TMSTaskforcePendingStarterHandler.ROUTE,
+        "GET",
+    )
+
+    last_ok = _make_request({"schedd": [b"SCHEDD1"], "limit": [b"abc", b"5"]})
+    assert request_validation._get_errors(last_ok, rv, {}) == []
+
+    last_bad = _make_request({"schedd": [b"SCHEDD1"], "limit": [b"5", b"abc"]})
+    assert request_validation._get_errors(last_bad, rv, {}) == [
+        "limit: must be type 'integer' (int)"
+    ]
+
+
+@pytest.mark.parametrize(
+    "param",
+    [
+        {"name": "x", "in": "header", "schema": {"type": "string"}},
+        {"name": "x", "in": "cookie", "schema": {"type": "string"}},
+        {"name": "x", "in": "query", "schema": {"type": "array"}},
+        {"name": "x", "in": "query", "schema": {"type": "object"}},
+        {"name": "x", "in": "query", "schema": {"type": ["string", "null"]}},
+        {"name": "x", "in": "query", "style": "form", "schema": {"type": "string"}},
+        {"name": "x", "in": "query", "content": {"application/json": {}}},
+    ],
+)
+def test_unsupported_param(param: dict) -> None:
+    """Check that params that would not be validated fully are rejected."""
+    with pytest.raises(NotImplementedError):
+        request_validation._assert_supported_param(param)
+
+
+def test_supported_param() -> None:
+    """Check that scalar path/query params are accepted, including '$ref'-ed ones."""
+    for param in [
+        {"name": "x", "in": "path", "schema": {"type": "string"}},
+        {"name": "x", "in": "query", "schema": {"type": "integer"}},
+        {"name": "x", "in": "query", "schema": {"enum": ["a", "b"]}},
+        {
+            "name": "x",
+            "in": "query",
+            "schema": {"$ref": "#/components/schemas/TaskforceProjectionProfile"},
+        },
+    ]:
+        request_validation._assert_supported_param(param)
+
+
+def test_unsupported_body() -> None:
+    """Check that non-JSON request bodies are rejected."""
+    request_validation._assert_supported_body({"content": {"application/json": {}}})
+
+    content: dict
+    for content in [
+        {"text/plain": {}},
+        {"application/json": {}, "multipart/form-data": {}},
+    ]:
+        with pytest.raises(NotImplementedError):
+            request_validation._assert_supported_body({"content": content})
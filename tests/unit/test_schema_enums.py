@@ -4,9 +4,9 @@ import logging
 
 import jsonschema
 
-from wms import schema
+from wms import config, schema
 from wms.database.client import get_jsonschema_subspec_from_openapi
-from wms.database.utils import TASKFORCES_COLL_NAME
+from wms.database.utils import TASKFORCE_PROJECTION_PROFILES, TASKFORCES_COLL_NAME
 
 LOGGER = logging.getLogger(__name__)
 
@@ -21,3 +21,19 @@ def test_tmsaction() -> None:
     for attr in [*schema.enums.TaskforcePhase]:
         print(f"validating: {attr}")
         jsonschema.validate({"phase": attr}, spec)
+
+
+def test_taskforce_projection_profile() -> None:
+    """Validate the TaskforceProjectionProfile attrs with the jsonschema."""
+    spec = config.OPENAPI_DICT["components"]["schemas"]["TaskforceProjectionProfile"]
+    assert set(spec["enum"]) == set(schema.enums.TaskforceProjectionProfile)
+
+    # and, each profile's fields are taskforce fields
+    properties = get_jsonschema_subspec_from_openapi(
+        TASKFORCES_COLL_NAME.removesuffix("Coll") + "Object"
+    )["properties"]
+    assert set(TASKFORCE_PROJECTION_PROFILES) == set(
+        schema.enums.TaskforceProjectionProfile
+    )
+    for fields in TASKFORCE_PROJECTION_PROFILES.values():
+        assert set(fields) <= set(properties)
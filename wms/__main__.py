@@ -3,7 +3,13 @@
 import asyncio
 import logging
 
-from . import database, server, taskforce_launch_control, workflow_mq_activator
+from . import (
+    database,
+    pilot_tags,
+    server,
+    taskforce_launch_control,
+    workflow_mq_activator,
+)
 from .config import ENV, config_logging
 
 LOGGER = logging.getLogger(__package__)
@@ -16,24 +22,54 @@ async def main() -> None:
     LOGGER.info("Setting up Mongo client...")
     mongo_client = await database.utils.create_mongodb_client()
     await database.utils.ensure_indexes(mongo_client)
+    await database.migrations.run_migrations(mongo_client)
     LOGGER.info("Mongo client connected.")
 
+    # wakes up components when taskforces change phase
+    phase_watcher = database.change_streams.TaskforcePhaseWatcher(mongo_client)
+
+    rs = None
     async with asyncio.TaskGroup() as tg:
-        # taskforce_launch_control
-        LOGGER.info("Starting taskforce_launch_control in background...")
-        tg.create_task(taskforce_launch_control.run(mongo_client))
-
-        # workflow_mq_activator
-        LOGGER.info("Starting workflow_mq_activator in background...")
-        tg.create_task(workflow_mq_activator.run(mongo_client))
-
-        # REST Server
-        LOGGER.info("Setting up REST server...")
-        rs = await server.make(mongo_client)
-        rs.startup(address=ENV.REST_HOST, port=ENV.REST_PORT)  # type: ignore[no-untyped-call]
+        if ENV.WATCH_TASKFORCE_CHANGE_STREAM:
+            LOGGER.info("Starting taskforce change stream watcher in background...")
+            tg.create_task(phase_watcher.run())
+
+        if ENV.RUN_DAEMONS:
+            # only one replica runs each daemon at a time -- see leases.py
+            # taskforce_launch_control
+            LOGGER.info("Starting taskforce_launch_control in background (leased)...")
+            tg.create_task(
+                database.leases.run_while_holding_lease(
+                    mongo_client,
+                    "taskforce_launch_control",
+                    lambda: taskforce_launch_control.run(mongo_client, phase_watcher),
+                )
+            )
+
+            # workflow_mq_activator
+            LOGGER.info("Starting workflow_mq_activator in background (leased)...")
+            tg.create_task(
+                database.leases.run_while_holding_lease(
+                    mongo_client,
+                    "workflow_mq_activator",
+                    lambda: workflow_mq_activator.run(mongo_client, phase_watcher),
+                )
+            )
+
+        if ENV.RUN_REST_SERVER:
+            # pilot tag index (cvmfs)
+            LOGGER.info("Starting pilot tag index refresher in background...")
+            tg.create_task(pilot_tags.run())
+
+            # REST Server
+            LOGGER.info("Setting up REST server...")
+            rs = await server.make(mongo_client, phase_watcher)
+            rs.startup(address=ENV.REST_HOST, port=ENV.REST_PORT)  # type: ignore[no-untyped-call]
+
         tg.create_task(asyncio.Event().wait())
 
-    await rs.stop()  # type: ignore[no-untyped-call]
+    if rs:
+        await rs.stop()  # type: ignore[no-untyped-call]
 
 
 if __name__ == "__main__":
@@ -4,14 +4,8 @@ import dataclasses as dc
 import logging
 from pathlib import Path
 
-import cachetools
 from rest_tools import openapi_tools
-from tornado import web
 from wipac_dev_tools import from_environment_as_dataclass, logging_tools
-from wipac_dev_tools.container_registry_tools import (
-    CVMFSRegistryTools,
-    ImageNotFoundException,
-)
 from wipac_dev_tools.logging_tools import LoggerLevel, WIPACDevToolsFormatter
 
 
@@ -25,6 +19,9 @@ TASK_MQ_ACTIVATOR_SHORTEST_SLEEP = 1
 DEFAULT_WORKFLOW_PRIORITY = 50
 MAX_WORKFLOW_PRIORITY = 100  # any value over this is used to accelerate launch
 
+# same as the 'workflow_ids' maxItems @ /workflows/actions/* in openapi.json
+MAX_WORKFLOWS_PER_DEACTIVATION = 10_000
+
 MQS_URL_V_PREFIX = "v1"
 
 # --------------------------------------------------------------------------------------
@@ -44,6 +41,9 @@ class EnvConfig:
     MQS_TOKEN_URL: str = ""  # needed in prod
     MQS_CLIENT_ID: str = ""  # ''
     MQS_CLIENT_SECRET: str = ""  # ''
+    MQS_TOKEN_REFRESH_BUFFER: int = 60  # seconds before expiry to get a new token
+    MQS_MQPROFILES_CONCURRENCY: int = 8  # max concurrent mq-profile GETs per request
+    MQS_MQPROFILES_CACHE_TTL: int = 30  # only activated mq-profiles are cached
 
     AUTH_AUDIENCE: str = ""
     AUTH_OPENID_URL: str = ""
@@ -55,19 +55,46 @@ class EnvConfig:
     LOG_LEVEL_THIRD_PARTY: LoggerLevel = "INFO"
     LOG_LEVEL_REST_TOOLS: LoggerLevel = "DEBUG"
 
+    WORKFLOW_BATCH_CONCURRENCY: int = 8  # max workflows assembled at once (MQS reservations)
+
     USER_QUERY_MAX_BYTES: int = 10 * 1024 * 1024  # 10MB
+    USER_QUERY_STREAM_FLUSH_BYTES: int = 64 * 1024  # 64KB -- see 'application/x-ndjson'
+
+    WATCH_TASKFORCE_CHANGE_STREAM: bool = True  # wake daemons on changes (vs. polling)
+
+    # which components this process runs -- ex: scale out REST-only replicas
+    RUN_REST_SERVER: bool = True
+    RUN_DAEMONS: bool = True  # only one replica runs each daemon at a time (leases)
+    LEASE_DURATION: int = 15  # a replica's daemon lease expires if not renewed by then
+    LEASE_RENEW_INTERVAL: int = 5  # heartbeat -- also, how often to try for a lease
 
     WORKFLOW_MQ_ACTIVATOR_DELAY: int = 15
     WORKFLOW_MQ_ACTIVATOR_MQS_RETRY_WAIT: int = 60
+    WORKFLOW_MQ_ACTIVATOR_CONCURRENCY: int = 4  # max workflows activated at once
+    WORKFLOW_MQ_ACTIVATOR_LEASE_DURATION: int = 10 * 60  # see 'mq_activation_lease_until'
     TASKFORCE_LAUNCH_CONTROL_DELAY: int = 1
+    TASKFORCE_LAUNCH_CONTROL_BATCH_SIZE: int = 1  # max taskforces launched per tick
+    TASKFORCE_LAUNCH_CONTROL_SCHEDD_BUDGET: int = 0  # max per schedd per tick (0: none)
+    TASKFORCE_LAUNCH_CONTROL_BACKLOG_METRIC_INTERVAL: int = 60  # recount, not every tick
 
     TMS_ACTION_RETRIES: int = 2  # 2 retries -> 3 total attempts
+    TMS_LONG_POLL_MAX_WAIT: int = 30  # cap on a pending-starter/stopper request's 'wait'
+    TMS_LONG_POLL_RECHECK_INTERVAL: int = 5  # re-query while waiting, w/o a notification
+
+    PHASE_CHANGE_LOG_MAX_ENTRIES: int = 20  # per taskforce -- full history: PhaseChangeLogColl
 
     CVMFS_PILOT_SINGULARITY_IMAGES_DIR: Path = Path(
         "/cvmfs/icecube.opensciencegrid.org/containers/ewms/observation-management-service/"
     )
+    CVMFS_PILOT_TAG_INDEX_REFRESH_INTERVAL: int = 60  # background rescan of cvmfs
+    CVMFS_PILOT_TAG_INDEX_MIN_AGE: int = 5  # an unknown tag rescans an index older than this
 
     def __post_init__(self):
+        if not self.RUN_REST_SERVER and not self.RUN_DAEMONS:
+            raise RuntimeError("at least one of RUN_REST_SERVER/RUN_DAEMONS must be set")
+        if self.LEASE_RENEW_INTERVAL >= self.LEASE_DURATION:
+            raise RuntimeError("LEASE_RENEW_INTERVAL must be less than LEASE_DURATION")
+
         # check that cvmfs images dir is available and non-empty
         if not self.CVMFS_PILOT_SINGULARITY_IMAGES_DIR.exists():
             raise FileNotFoundError(self.CVMFS_PILOT_SINGULARITY_IMAGES_DIR)
@@ -136,41 +163,6 @@ def get_cluster_schedd(cluster: str) -> str:
 # --------------------------------------------------------------------------------------
 
 
-_PILOT_IMAGE_NAME = "ewms-pilot"
-
-_CVMFS_CACHE: cachetools.TTLCache = cachetools.TTLCache(maxsize=128, ttl=5)  # see below
-
-
-@cachetools.cached(_CVMFS_CACHE)  # very short ttl just to stop stampedes & for-loops
-def get_pilot_tag(tag: str) -> str:
-    """Get/validate/resolve the pilot image tag (singularity/apptainer) on CVMFS."""
-    LOGGER.info(f"checking pilot tag: {tag}")
-
-    cvmfs = CVMFSRegistryTools(
-        ENV.CVMFS_PILOT_SINGULARITY_IMAGES_DIR, _PILOT_IMAGE_NAME
-    )
-
-    try:
-        tag = cvmfs.resolve_tag(tag)
-    except ImageNotFoundException:
-        msg = (
-            "Pilot image tag not found. "
-            "It is possible that the image has not finished uploading to its registry. "
-            "If this error persists, contact an EWMS admin."
-        )
-        raise web.HTTPError(
-            status_code=400,
-            log_message=msg,
-            reason=msg,  # to client
-        )
-
-    LOGGER.info(f"resolved pilot tag: {tag}")
-    return tag
-
-
-# --------------------------------------------------------------------------------------
-
-
 def config_logging() -> None:
     """Configure the logging level and format.
 
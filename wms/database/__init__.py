@@ -1,4 +1,4 @@
 """__init__.py."""
 
 
-from . import client, utils  # noqa: F401
+from . import change_streams, client, leases, migrations, utils  # noqa: F401
@@ -0,0 +1,115 @@
+"""Tools for reacting to database changes as they happen (vs. polling)."""
+
+import asyncio
+import logging
+from collections import defaultdict
+
+from pymongo import AsyncMongoClient
+from pymongo.errors import OperationFailure
+
+from .utils import _DB_NAME, TASKFORCES_COLL_NAME
+
+LOGGER = logging.getLogger(__name__)
+
+# "The $changeStream stage is only supported on replica sets"
+_CHANGE_STREAMS_UNSUPPORTED_CODE = 40573
+
+_RESTART_DELAY = 5
+
+
+class TaskforcePhaseWatcher:
+    """Notifies subscribers when taskforces enter a phase.
+
+    Notifications come from two sources:
+        1. the TaskforceColl change stream -- see `run()` -- which sees
+           phase changes made by any process, and
+        2. `notify()` -- for phase changes made by this process.
+
+    A subscriber gets its own `asyncio.Event`, so a notification that arrives
+    while the subscriber is busy is not lost. Subscribers should never wait
+    indefinitely -- see `wait_for_wakeup()` -- since change streams may be
+    unavailable (ex: a standalone mongod). In that case, subscribers
+    effectively fall back to polling.
+    """
+
+    def __init__(self, mongo_client: AsyncMongoClient) -> None:
+        self.mongo_client = mongo_client
+        self._subscribers: dict[str, set[asyncio.Event]] = defaultdict(set)
+
+    def subscribe(self, phase: str) -> asyncio.Event:
+        """Get an event that is set whenever a taskforce enters `phase`."""
+        event = asyncio.Event()
+        self._subscribers[phase].add(event)
+        return event
+
+    def unsubscribe(self, phase: str, event: asyncio.Event) -> None:
+        """Stop setting `event` for `phase`."""
+        self._subscribers[phase].discard(event)
+
+    def notify(self, phase: str) -> None:
+        """Wake up all the subscribers for `phase`."""
+        for event in self._subscribers.get(phase, ()):
+            event.set()
+
+    async def run(self) -> None:
+        """Watch the TaskforceColl change stream and notify subscribers.
+
+        Returns (does not raise) if change streams are not supported by the server.
+        """
+        pipeline = [
+            {
+                "$match": {
+                    "$or": [
+                        {
+                            "operationType": {"$in": ["insert", "replace"]},
+                            "fullDocument.phase": {"$exists": True},
+                        },
+                        {
+                            "operationType": "update",
+                            "updateDescription.updatedFields.phase": {"$exists": True},
+                        },
+                    ]
+                }
+            }
+        ]
+        coll = self.mongo_client[_DB_NAME][TASKFORCES_COLL_NAME]
+
+        while True:
+            try:
+                async with await coll.watch(pipeline) as stream:
+                    LOGGER.info(f"Watching {TASKFORCES_COLL_NAME} change stream...")
+                    async for change in stream:
+                        if change["operationType"] == "update":
+                            phase = change["updateDescription"]["updatedFields"]["phase"]
+                        else:
+                            phase = change["fullDocument"]["phase"]
+                        LOGGER.debug(f"change stream: a taskforce entered '{phase}'")
+                        self.notify(phase)
+            except OperationFailure as e:
+                if e.code == _CHANGE_STREAMS_UNSUPPORTED_CODE:
+                    LOGGER.warning(
+                        f"Change streams are unavailable ({e}) -- "
+                        f"subscribers will fall back to polling."
+                    )
+                    return
+                LOGGER.exception(e)
+            except Exception as e:  # never take down the process (see `__main__`)
+                LOGGER.exception(e)
+            LOGGER.info(f"Restarting change stream watcher after {_RESTART_DELAY}s...")
+            await asyncio.sleep(_RESTART_DELAY)
+
+
+async def wait_for_wakeup(event: asyncio.Event | None, timeout: float) -> None:
+    """Wait until `event` is set or `timeout` seconds pass, whichever is first.
+
+    The event is cleared afterward. If there is no event, this is simply a sleep.
+    """
+    if event is None:
+        await asyncio.sleep(timeout)
+        return
+
+    try:
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+    except TimeoutError:
+        pass
+    event.clear()
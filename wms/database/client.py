@@ -2,10 +2,14 @@
 
 import copy
 import logging
-from typing import Any
+import time
+from contextlib import AbstractContextManager
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
 
 import jsonschema
-from pymongo import AsyncMongoClient
+from pymongo import AsyncMongoClient, UpdateOne
+from pymongo.asynchronous.client_session import AsyncClientSession
+from pymongo.results import BulkWriteResult
 from tornado import web
 from wipac_dev_tools.mongo_jsonschema_tools import (
     DocumentNotFoundException,
@@ -13,9 +17,16 @@ from wipac_dev_tools.mongo_jsonschema_tools import (
     MongoJSONSchemaValidatedCollection,
 )
 
-from ..config import OPENAPI_DICT
+try:  # private -- see `WMSMongoValidatedCollection`
+    from wipac_dev_tools.mongo_jsonschema_tools import _mongo_expand_dotted_keys
+except ImportError:
+    _mongo_expand_dotted_keys = None  # type: ignore[assignment]
+
+from .. import metrics
+from ..config import ENV, OPENAPI_DICT
 from .utils import (
     _DB_NAME,
+    PHASE_CHANGE_LOGS_COLL_NAME,
     TASK_DIRECTIVES_COLL_NAME,
     TASKFORCES_COLL_NAME,
     WORKFLOWS_COLL_NAME,
@@ -25,6 +36,8 @@ __all__ = [  # export
     "DocumentNotFoundException",
 ]
 
+_T = TypeVar("_T")
+
 
 def get_jsonschema_subspec_from_openapi(object_name: str) -> dict[str, Any]:
     """Get a deep-copy of the JSONSchema spec for an 'component.schemas' object.
@@ -59,6 +72,392 @@ def _validation_exception_callback(exc: Exception) -> Exception:
             return exc
 
 
+def _compile_validator(schema: dict[str, Any]) -> jsonschema.protocols.Validator:
+    """Check the schema, then make a reusable validator for it."""
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+class WMSMongoValidatedCollection(MongoJSONSchemaValidatedCollection):
+    """A MongoJSONSchemaValidatedCollection with compiled validators, timed
+    operations, and extra (validated) bulk actions.
+
+    `jsonschema.validate()` re-checks the schema and builds a new validator on
+    every call. Here, the full-document validator is compiled once, and each
+    partial-update ('$set', '$push', ...) validator is compiled once per set of
+    dotted keys, then reused for every write.
+
+    NOTE: compiling relies on private parts of `wipac_dev_tools` (the schema
+    transformer and the dotted-keys expander), so its version is pinned. If they
+    are not there anyway, the library's own (uncompiled) validation is used.
+    The library caches each partial-update schema, but not a compiled validator.
+
+    Each operation is timed -- see `metrics.DB_OPERATION_SECONDS`.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._partial_validators: dict[
+            frozenset[str], jsonschema.protocols.Validator
+        ] = {}  # by dotted keys -- there are only a handful of distinct updates
+
+        transformer = getattr(self, "_jsonschema_transformer", None)
+        if (
+            _mongo_expand_dotted_keys is None
+            or transformer is None
+            or not hasattr(transformer, "full_schema")
+            or not hasattr(transformer, "unrequire_key_ancestors")
+        ):
+            self.logger.warning(
+                "cannot compile validators with this version of wipac_dev_tools "
+                "-- falling back to its own validation"
+            )
+            self._full_validator: jsonschema.protocols.Validator | None = None
+        else:
+            self._full_validator = _compile_validator(transformer.full_schema)
+
+    def _get_partial_validator(
+        self, dotted_keys: frozenset[str]
+    ) -> jsonschema.protocols.Validator:
+        """Get the compiled validator for a partial update with these dotted keys."""
+        try:
+            return self._partial_validators[dotted_keys]
+        except KeyError:
+            self._partial_validators[dotted_keys] = _compile_validator(
+                self._jsonschema_transformer.unrequire_key_ancestors(
+                    {k: None for k in dotted_keys}
+                )
+            )
+            return self._partial_validators[dotted_keys]
+
+    def _validate(
+        self,
+        mongo_obj: dict[str, Any],
+        allow_partial_update: bool = False,
+    ) -> None:
+        """Validate using the compiled validators (see class docstring).
+
+        Raises `jsonschema.exceptions.ValidationError` if data is invalid.
+        """
+        start = time.perf_counter()
+        if self._full_validator is None:  # fallback (see class docstring)
+            try:
+                return super()._validate(mongo_obj, allow_partial_update)
+            finally:
+                metrics.DB_WRITE_VALIDATION_SECONDS.labels(
+                    collection=self.collection_name
+                ).observe(time.perf_counter() - start)
+
+        try:
+            dotted_keys = frozenset(k for k in mongo_obj if "." in k)
+            if allow_partial_update:
+                json_obj = _mongo_expand_dotted_keys(mongo_obj)
+                validator = self._get_partial_validator(dotted_keys)
+            elif dotted_keys:
+                raise IllegalDotsNotationActionException()
+            else:
+                json_obj = mongo_obj
+                validator = self._full_validator
+            # same error as 'jsonschema.validate()' would raise
+            if error := jsonschema.exceptions.best_match(
+                validator.iter_errors(json_obj)
+            ):
+                raise error
+        except Exception as e:
+            self.logger.exception(e)
+            if self.validation_exception_callback:
+                raise self.validation_exception_callback(e) from e
+            else:
+                raise e
+        finally:
+            metrics.DB_WRITE_VALIDATION_SECONDS.labels(
+                collection=self.collection_name
+            ).observe(time.perf_counter() - start)
+
+    def _time(self, operation: str) -> AbstractContextManager:
+        """Get a context manager that times the operation."""
+        return metrics.DB_OPERATION_SECONDS.labels(
+            collection=self.collection_name, operation=operation
+        ).time()
+
+    async def _time_iter(
+        self, operation: str, docs: AsyncIterator[dict]
+    ) -> AsyncIterator[dict]:
+        """Yield the docs, timing only the fetching (not the caller's processing)."""
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    doc = await anext(docs)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield doc
+        finally:
+            metrics.DB_OPERATION_SECONDS.labels(
+                collection=self.collection_name, operation=operation
+            ).observe(elapsed)
+
+    async def insert_one(self, *args: Any, **kwargs: Any) -> dict:
+        """Insert the doc (dict)."""
+        with self._time("insert_one"):
+            return await super().insert_one(*args, **kwargs)
+
+    async def insert_many(self, *args: Any, **kwargs: Any) -> list[dict]:
+        """Insert multiple docs."""
+        with self._time("insert_many"):
+            return await super().insert_many(*args, **kwargs)
+
+    async def find_one_and_update(self, *args: Any, **kwargs: Any) -> dict:
+        """Update the doc and return updated doc."""
+        with self._time("find_one_and_update"):
+            return await super().find_one_and_update(*args, **kwargs)
+
+    async def update_many(self, *args: Any, **kwargs: Any) -> int:
+        """Update all matching docs."""
+        with self._time("update_many"):
+            return await super().update_many(*args, **kwargs)
+
+    async def find_one(self, *args: Any, **kwargs: Any) -> dict:
+        """Find one matching the query."""
+        with self._time("find_one"):
+            return await super().find_one(*args, **kwargs)
+
+    async def find_all(self, *args: Any, **kwargs: Any) -> AsyncIterator[dict]:
+        """Find all matching the query."""
+        async for doc in self._time_iter(
+            "find_all", super().find_all(*args, **kwargs)
+        ):
+            yield doc
+
+    async def aggregate(self, *args: Any, **kwargs: Any) -> AsyncIterator[dict]:
+        """Find all matching the aggregate pipeline."""
+        async for doc in self._time_iter(
+            "aggregate", super().aggregate(*args, **kwargs)
+        ):
+            yield doc
+
+    async def distinct(self, key: str, query: dict, **kwargs: Any) -> list:
+        """Get the distinct values of the key, among the docs matching the query."""
+        with self._time("distinct"):
+            return await self._collection.distinct(key, query, **kwargs)
+
+    async def bulk_update_one(
+        self,
+        query_update_pairs: list[tuple[dict, dict]],
+        **kwargs: Any,
+    ) -> BulkWriteResult:
+        """Update one doc for each (query, update) pair, in a single unordered
+        `bulk_write`.
+
+        Unlike `find_one_and_update`, this does not raise if a query matches no
+        doc -- use the result's `matched_count` to check.
+        """
+        self.logger.debug(f"bulk update one (x{len(query_update_pairs)})")
+
+        for _, update in query_update_pairs:
+            self._validate_mongo_update(update)
+        with self._time("bulk_update_one"):
+            res = await self._collection.bulk_write(
+                [UpdateOne(query, update) for query, update in query_update_pairs],
+                ordered=False,
+                **kwargs,
+            )
+
+        self.logger.debug(
+            f"bulk updated one (x{len(query_update_pairs)}): "
+            f"matched={res.matched_count} modified={res.modified_count}"
+        )
+        return res
+
+
+class TaskforcesCollection(WMSMongoValidatedCollection):
+    """The taskforces collection -- each taskforce's 'phase_change_log' is bounded.
+
+    Every '$push' onto 'phase_change_log' only keeps the last
+    `PHASE_CHANGE_LOG_MAX_ENTRIES` entries on the taskforce. Every entry is
+    also appended to the phase-change-log collection, which holds the full
+    history. The write and the archiving are in one transaction -- the write's,
+    if its session is in one, otherwise a new one (retried on transient errors).
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        phase_change_logs_collection: WMSMongoValidatedCollection,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.phase_change_logs_collection = phase_change_logs_collection
+
+    def _validate_mongo_update(self, update: dict[str, Any]) -> None:
+        """Also validate '$push' values that use modifiers ('$each', '$slice', ...)."""
+        if push := update.get("$push"):
+            with_modifiers = {
+                k: v for k, v in push.items() if isinstance(v, dict) and "$each" in v
+            }
+            if with_modifiers:
+                # validate the entries, like the library does w/ a plain '$push'
+                self._validate(
+                    {k: v["$each"] for k, v in with_modifiers.items()},
+                    allow_partial_update=True,
+                )
+                update = {k: v for k, v in update.items() if k != "$push"}
+                if rest := {k: v for k, v in push.items() if k not in with_modifiers}:
+                    update["$push"] = rest
+        super()._validate_mongo_update(update)
+
+    @staticmethod
+    def _bound_phase_change_log(update: dict[str, Any]) -> tuple[dict, dict | None]:
+        """Rewrite a '$push' onto 'phase_change_log' to keep only the last N entries.
+
+        Returns the new update and the pushed entry (None if there is none).
+        """
+        entry = update.get("$push", {}).get("phase_change_log")
+        if entry is None or "$each" in entry:
+            return update, None
+        return {
+            **update,
+            "$push": {
+                **update["$push"],
+                "phase_change_log": {
+                    "$each": [entry],
+                    "$slice": -ENV.PHASE_CHANGE_LOG_MAX_ENTRIES,
+                },
+            },
+        }, entry
+
+    async def _archive(
+        self,
+        taskforces_entries: list[tuple[dict, dict]],
+        session: AsyncClientSession,
+    ) -> None:
+        """Append each (taskforce, entry) pair to the full history."""
+        if not taskforces_entries:
+            return
+        await self.phase_change_logs_collection.insert_many(
+            [
+                {
+                    "taskforce_uuid": tf["taskforce_uuid"],
+                    "workflow_id": tf["workflow_id"],
+                    **entry,
+                }
+                for tf, entry in taskforces_entries
+            ],
+            session=session,
+        )
+
+    async def _in_transaction(
+        self,
+        callback: Callable[[AsyncClientSession], Awaitable[_T]],
+        session: AsyncClientSession | None,
+    ) -> _T:
+        """Run the callback in the session's transaction, or in a new one."""
+        if session is not None and session.in_transaction:
+            return await callback(session)
+        if session is not None:
+            return await session.with_transaction(callback)
+        async with self._collection.database.client.start_session() as s:
+            return await s.with_transaction(callback)
+
+    async def insert_one(  # type: ignore[override]
+        self,
+        doc: dict,
+        **kwargs: Any,
+    ) -> dict:
+        """Insert the doc, and archive its 'phase_change_log'."""
+        if not doc["phase_change_log"]:
+            return await super().insert_one(doc, **kwargs)
+        session = kwargs.pop("session", None)
+        insert_one = super().insert_one
+
+        async def _insert_and_archive(s: AsyncClientSession) -> dict:
+            inserted = await insert_one(doc, session=s, **kwargs)
+            await self._archive(
+                [(inserted, e) for e in inserted["phase_change_log"]], s
+            )
+            return inserted
+
+        return await self._in_transaction(_insert_and_archive, session)
+
+    async def insert_many(  # type: ignore[override]
+        self,
+        docs: list[dict],
+        **kwargs: Any,
+    ) -> list[dict]:
+        """Insert multiple docs, and archive their 'phase_change_log's."""
+        if not any(d["phase_change_log"] for d in docs):
+            return await super().insert_many(docs, **kwargs)
+        session = kwargs.pop("session", None)
+        insert_many = super().insert_many
+
+        async def _insert_and_archive(s: AsyncClientSession) -> list[dict]:
+            inserted = await insert_many(docs, session=s, **kwargs)
+            await self._archive(
+                [(d, e) for d in inserted for e in d["phase_change_log"]], s
+            )
+            return inserted
+
+        return await self._in_transaction(_insert_and_archive, session)
+
+    async def find_one_and_update(  # type: ignore[override]
+        self,
+        query: dict,
+        update: dict,
+        **kwargs: Any,
+    ) -> dict:
+        """Update the doc and return updated doc -- see class docstring."""
+        update, entry = self._bound_phase_change_log(update)
+        if not entry:
+            return await super().find_one_and_update(query, update, **kwargs)
+        session = kwargs.pop("session", None)
+        find_one_and_update = super().find_one_and_update
+
+        async def _update_and_archive(s: AsyncClientSession) -> dict:
+            doc = await find_one_and_update(query, update, session=s, **kwargs)
+            await self._archive([(doc, entry)], s)
+            return doc
+
+        return await self._in_transaction(_update_and_archive, session)
+
+    async def update_many(  # type: ignore[override]
+        self,
+        query: dict,
+        update: dict,
+        **kwargs: Any,
+    ) -> int:
+        """Update all matching docs -- see class docstring."""
+        update, entry = self._bound_phase_change_log(update)
+        if not entry:
+            return await super().update_many(query, update, **kwargs)
+        session = kwargs.pop("session", None)
+        update_many = super().update_many
+
+        async def _update_and_archive(s: AsyncClientSession) -> int:
+            # in a transaction, the update sees the same snapshot as this find
+            # -- a concurrent write to any of these is a write conflict
+            taskforces = [
+                tf
+                async for tf in self.find_all(
+                    query, ["taskforce_uuid", "workflow_id"], session=s
+                )
+            ]
+            uuids = [tf["taskforce_uuid"] for tf in taskforces]
+            n = await update_many(
+                {"$and": [query, {"taskforce_uuid": {"$in": uuids}}]},
+                update,
+                session=s,
+                **kwargs,
+            )
+            await self._archive([(tf, entry) for tf in taskforces], s)
+            return n
+
+        return await self._in_transaction(_update_and_archive, session)
+
+
 class WMSMongoValidatedDatabase:
     """Wraps a MongoDB client and collection clients with json schema validation."""
 
@@ -66,29 +465,39 @@ class WMSMongoValidatedDatabase:
         self,
         mongo_client: AsyncMongoClient,
         parent_logger: logging.Logger | None = None,
+        db_name: str = _DB_NAME,
     ):
         self.mongo_client = mongo_client
-        self.workflows_collection = MongoJSONSchemaValidatedCollection(
-            mongo_client[_DB_NAME][WORKFLOWS_COLL_NAME],
+        self.workflows_collection = WMSMongoValidatedCollection(
+            mongo_client[db_name][WORKFLOWS_COLL_NAME],
             get_jsonschema_subspec_from_openapi(
                 WORKFLOWS_COLL_NAME.removesuffix("Coll") + "Object",
             ),
             parent_logger,
             validation_exception_callback=_validation_exception_callback,
         )
-        self.task_directives_collection = MongoJSONSchemaValidatedCollection(
-            mongo_client[_DB_NAME][TASK_DIRECTIVES_COLL_NAME],
+        self.task_directives_collection = WMSMongoValidatedCollection(
+            mongo_client[db_name][TASK_DIRECTIVES_COLL_NAME],
             get_jsonschema_subspec_from_openapi(
                 TASK_DIRECTIVES_COLL_NAME.removesuffix("Coll") + "Object",
             ),
             parent_logger,
             validation_exception_callback=_validation_exception_callback,
         )
-        self.taskforces_collection = MongoJSONSchemaValidatedCollection(
-            mongo_client[_DB_NAME][TASKFORCES_COLL_NAME],
+        self.phase_change_logs_collection = WMSMongoValidatedCollection(
+            mongo_client[db_name][PHASE_CHANGE_LOGS_COLL_NAME],
+            get_jsonschema_subspec_from_openapi(
+                PHASE_CHANGE_LOGS_COLL_NAME.removesuffix("Coll") + "Object",
+            ),
+            parent_logger,
+            validation_exception_callback=_validation_exception_callback,
+        )
+        self.taskforces_collection = TaskforcesCollection(
+            mongo_client[db_name][TASKFORCES_COLL_NAME],
             get_jsonschema_subspec_from_openapi(
                 TASKFORCES_COLL_NAME.removesuffix("Coll") + "Object",
             ),
             parent_logger,
             validation_exception_callback=_validation_exception_callback,
+            phase_change_logs_collection=self.phase_change_logs_collection,
         )
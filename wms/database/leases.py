@@ -0,0 +1,191 @@
+"""Mongo-backed leases, so only one WMS replica runs each daemon task at a time.
+
+A lease is one document in the LeaseColl, keyed by the lease's name:
+
+    {"_id": <name>, "holder": <replica id>, "expires_at": <datetime>}
+
+A replica holds a lease until 'expires_at' -- unless it renews the lease
+first (a heartbeat). Any replica may take over an expired lease. All times
+come from the database server's clock ('$$NOW'), so replicas' clocks do not
+need to agree. A TTL index removes long-abandoned leases, but it is not what
+expires them (the TTL monitor only runs every ~60s).
+"""
+
+import asyncio
+import logging
+import socket
+import uuid
+from typing import Any, Callable, Coroutine
+
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from ..config import ENV
+from .utils import _DB_NAME, LEASES_COLL_NAME
+
+LOGGER = logging.getLogger(__name__)
+
+# identifies this process, for all its leases
+REPLICA_ID = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+
+class Lease:
+    """A named lease, which this replica may acquire, renew, and release."""
+
+    def __init__(
+        self,
+        mongo_client: AsyncMongoClient,
+        name: str,
+        db_name: str = _DB_NAME,
+    ) -> None:
+        self.name = name
+        self._collection = mongo_client[db_name][LEASES_COLL_NAME]  # type: ignore[index]
+
+    async def acquire(self) -> bool:
+        """Acquire (or renew) the lease, if it is free, expired, or already ours.
+
+        Returns whether this replica now holds the lease.
+        """
+        try:
+            doc = await self._collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$expr": {
+                        "$or": [
+                            {"$eq": ["$holder", REPLICA_ID]},
+                            {"$lt": ["$expires_at", "$$NOW"]},
+                        ]
+                    },
+                },
+                [  # an aggregation-pipeline update, so '$$NOW' is the db's time
+                    {
+                        "$set": {
+                            "holder": REPLICA_ID,
+                            "expires_at": {
+                                "$add": ["$$NOW", ENV.LEASE_DURATION * 1000]  # ms
+                            },
+                        }
+                    }
+                ],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False  # held by another replica, so the upsert collided
+        return bool(doc and doc["holder"] == REPLICA_ID)
+
+    async def release(self) -> None:
+        """Release the lease, if this replica holds it."""
+        await self._collection.delete_one({"_id": self.name, "holder": REPLICA_ID})
+
+
+async def _wait_to_acquire(lease: Lease) -> float:
+    """Retry every `LEASE_RENEW_INTERVAL` seconds until this replica holds the lease.
+
+    Returns when the lease expires (event-loop time), unless it is renewed.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        # the db sets 'expires_at' after the request is sent, so this is conservative
+        held_until = loop.time() + ENV.LEASE_DURATION
+        try:
+            if await lease.acquire():
+                LOGGER.info(f"acquired lease '{lease.name}' ({REPLICA_ID})")
+                return held_until
+        except PyMongoError as e:
+            LOGGER.warning(f"could not acquire lease '{lease.name}': {repr(e)}")
+        else:
+            LOGGER.debug(f"lease '{lease.name}' is held by another replica")
+        await asyncio.sleep(ENV.LEASE_RENEW_INTERVAL)
+
+
+async def _hold_while_running(
+    lease: Lease,
+    task: asyncio.Task,
+    held_until: float,
+) -> None:
+    """Renew the lease every `LEASE_RENEW_INTERVAL` seconds until the task is done.
+
+    If a renewal fails, or does not finish before the lease would expire, the
+    task is cancelled immediately. Either way, the lease is then released.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        # heartbeat
+        while not task.done():
+            await asyncio.wait({task}, timeout=ENV.LEASE_RENEW_INTERVAL)
+            sent_at = loop.time()
+            try:
+                # a renewal that hangs past expiry must not keep the task going
+                renewed = await asyncio.wait_for(
+                    lease.acquire(), timeout=held_until - sent_at
+                )
+            except TimeoutError:
+                LOGGER.warning(
+                    f"could not renew lease '{lease.name}' before it expired"
+                )
+                break
+            except PyMongoError as e:
+                LOGGER.warning(f"could not renew lease '{lease.name}': {repr(e)}")
+                break
+            if not renewed:
+                LOGGER.warning(f"lost lease '{lease.name}' to another replica")
+                break
+            held_until = sent_at + ENV.LEASE_DURATION
+    finally:
+        if not task.done():
+            LOGGER.info(f"stopping task for lease '{lease.name}'...")
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        try:  # let another replica take over now, not when the lease expires
+            await asyncio.wait_for(lease.release(), ENV.LEASE_RENEW_INTERVAL)
+        except (PyMongoError, TimeoutError) as e:
+            LOGGER.warning(f"could not release lease '{lease.name}': {repr(e)}")
+
+
+async def run_while_holding_lease(
+    mongo_client: AsyncMongoClient,
+    name: str,
+    daemon: Callable[[], Coroutine[Any, Any, Any]],
+    db_name: str = _DB_NAME,
+) -> None:
+    """Run the daemon task only while this replica holds the lease, forever.
+
+    The lease is renewed every `LEASE_RENEW_INTERVAL` seconds. If a renewal
+    fails, or does not finish before the lease would expire, the daemon is
+    cancelled immediately -- another replica may take over once the lease
+    expires. Meanwhile, a replica without the lease retries every
+    `LEASE_RENEW_INTERVAL` seconds, so failover takes at most
+    `LEASE_DURATION` + `LEASE_RENEW_INTERVAL` seconds.
+    """
+    lease = Lease(mongo_client, name, db_name=db_name)
+
+    while True:
+        held_until = await _wait_to_acquire(lease)
+        LOGGER.info(f"starting daemon task for lease '{name}'")
+        task = asyncio.create_task(daemon())
+        await _hold_while_running(lease, task, held_until)
+        if not task.cancelled() and (exc := task.exception()):
+            LOGGER.error(f"daemon task for lease '{name}' errored: {repr(exc)}")
+
+
+async def run_once_holding_lease(
+    mongo_client: AsyncMongoClient,
+    name: str,
+    func: Callable[[], Coroutine[Any, Any, Any]],
+    db_name: str = _DB_NAME,
+) -> None:
+    """Wait until this replica holds the lease, then run the task to completion.
+
+    The lease is held (renewed) the same as `run_while_holding_lease()`, then
+    released -- so, the next replica to acquire it sees the task's results.
+    Raises if the lease was lost before the task finished, or if the task did.
+    """
+    lease = Lease(mongo_client, name, db_name=db_name)
+
+    held_until = await _wait_to_acquire(lease)
+    task = asyncio.create_task(func())
+    await _hold_while_running(lease, task, held_until)
+    if task.cancelled():
+        raise RuntimeError(f"lost lease '{name}' before its task finished")
+    task.result()  # re-raise, if any
@@ -0,0 +1,193 @@
+"""One-time data migrations, for documents written by older versions of the WMS.
+
+Each migration is idempotent -- it only touches documents that need it. Only
+one replica runs the migrations at a time (see `leases.py`), the others wait.
+
+NOTE: deploying a version with a new migration must first stop every replica
+of the older version (no rolling deploy). Otherwise, an old replica can keep
+writing old-style documents after the migration ran -- ex: a 'phase_change_log'
+entry that is never archived (see `_archive_and_bound_phase_change_logs()`).
+"""
+
+import logging
+import time
+
+from pymongo import AsyncMongoClient
+
+from ..config import ENV
+from ..schema.enums import TaskforcePhase
+from .leases import run_once_holding_lease
+from .utils import (
+    _DB_NAME,
+    MIGRATIONS_COLL_NAME,
+    PHASE_CHANGE_LOGS_COLL_NAME,
+    TASKFORCES_COLL_NAME,
+    WORKFLOWS_COLL_NAME,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+async def _backfill_workflow_mq_activated_ts(
+    mongo_client: AsyncMongoClient,
+    db_name: str,
+) -> None:
+    """Set 'mq_activated_ts' on workflows that do not have it.
+
+    A workflow was mq-activated if any of its taskforces has moved past
+    "pre-mq-activation". The exact time is unknown, so "now" is used.
+    """
+    workflows = mongo_client[db_name][WORKFLOWS_COLL_NAME]  # type: ignore[index]
+    taskforces = mongo_client[db_name][TASKFORCES_COLL_NAME]  # type: ignore[index]
+
+    n = 0
+    async for workflow in workflows.find(
+        {"mq_activated_ts": {"$exists": False}},
+        {"workflow_id": True},
+    ):
+        activated = await taskforces.find_one(
+            {
+                "workflow_id": workflow["workflow_id"],
+                "phase": {"$ne": TaskforcePhase.PRE_MQ_ACTIVATOR},
+            },
+            {"_id": True},
+        )
+        await workflows.update_one(
+            {"_id": workflow["_id"]},
+            {"$set": {"mq_activated_ts": time.time() if activated else None}},
+        )
+        n += 1
+
+    LOGGER.info(f"backfilled 'mq_activated_ts' for {n} workflows")
+
+
+async def _backfill_taskforce_n_failed_phase_changes(
+    mongo_client: AsyncMongoClient,
+    db_name: str,
+) -> None:
+    """Set 'n_failed_phase_changes' on taskforces that do not have it.
+
+    The counts come from each taskforce's 'phase_change_log'.
+    """
+    taskforces = mongo_client[db_name][TASKFORCES_COLL_NAME]  # type: ignore[index]
+
+    res = await taskforces.update_many(
+        {"n_failed_phase_changes": {"$exists": False}},
+        [  # an aggregation-pipeline update, so the counts are computed in the db
+            {
+                "$set": {
+                    "n_failed_phase_changes": {
+                        phase: {
+                            "$size": {
+                                "$filter": {
+                                    "input": "$phase_change_log",
+                                    "as": "log",
+                                    "cond": {
+                                        "$and": [
+                                            {"$eq": ["$$log.target_phase", phase]},
+                                            {"$eq": ["$$log.was_successful", False]},
+                                        ]
+                                    },
+                                }
+                            }
+                        }
+                        for phase in TaskforcePhase
+                    }
+                }
+            }
+        ],
+    )
+
+    LOGGER.info(
+        f"backfilled 'n_failed_phase_changes' for {res.modified_count} taskforces"
+    )
+
+
+async def _archive_and_bound_phase_change_logs(
+    mongo_client: AsyncMongoClient,
+    db_name: str,
+) -> None:
+    """Copy every taskforce's 'phase_change_log' into the PhaseChangeLogColl, then
+    trim each to its last `PHASE_CHANGE_LOG_MAX_ENTRIES` entries.
+
+    The copy is only done once -- a marker doc records that it finished. Until
+    then, no new replica has started serving (migrations run first), and every
+    old replica has been stopped (see module docstring), so anything already in
+    the PhaseChangeLogColl is left over from an interrupted copy.
+    NOTE: run after any migration that reads the full 'phase_change_log'.
+    """
+    taskforces = mongo_client[db_name][TASKFORCES_COLL_NAME]  # type: ignore[index]
+    phase_change_logs = mongo_client[db_name][  # type: ignore[index]
+        PHASE_CHANGE_LOGS_COLL_NAME
+    ]
+    migrations = mongo_client[db_name][MIGRATIONS_COLL_NAME]  # type: ignore[index]
+
+    marker = {"_id": "phase_change_logs_copied"}
+    if not await migrations.find_one(marker):
+        # copy -- all in the db
+        await phase_change_logs.delete_many({})  # leftovers -- see docstring
+        cursor = await taskforces.aggregate(
+            [
+                {"$unwind": "$phase_change_log"},
+                {
+                    "$replaceWith": {
+                        "$mergeObjects": [
+                            {
+                                "taskforce_uuid": "$taskforce_uuid",
+                                "workflow_id": "$workflow_id",
+                            },
+                            "$phase_change_log",
+                        ]
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": PHASE_CHANGE_LOGS_COLL_NAME,
+                        "whenMatched": "fail",
+                    }
+                },
+            ]
+        )
+        await cursor.to_list()
+        await migrations.insert_one({**marker, "timestamp": time.time()})
+        LOGGER.info("archived all 'phase_change_log's")
+
+    # trim
+    res = await taskforces.update_many(
+        {
+            f"phase_change_log.{ENV.PHASE_CHANGE_LOG_MAX_ENTRIES}": {"$exists": True},
+        },
+        [
+            {
+                "$set": {
+                    "phase_change_log": {
+                        "$slice": [
+                            "$phase_change_log",
+                            -ENV.PHASE_CHANGE_LOG_MAX_ENTRIES,
+                        ]
+                    }
+                }
+            }
+        ],
+    )
+
+    LOGGER.info(f"trimmed 'phase_change_log' for {res.modified_count} taskforces")
+
+
+async def run_migrations(
+    mongo_client: AsyncMongoClient,
+    db_name: str = _DB_NAME,
+) -> None:
+    """Run all migrations, while holding the 'migrations' lease.
+
+    Call on server startup -- before serving, so other replicas wait for them.
+    """
+
+    async def _run() -> None:
+        LOGGER.info("Running migrations...")
+        await _backfill_workflow_mq_activated_ts(mongo_client, db_name)
+        await _backfill_taskforce_n_failed_phase_changes(mongo_client, db_name)
+        await _archive_and_bound_phase_change_logs(mongo_client, db_name)  # after ^^^
+        LOGGER.info("Ran migrations.")
+
+    await run_once_holding_lease(mongo_client, "migrations", _run, db_name=db_name)
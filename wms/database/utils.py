@@ -2,13 +2,15 @@
 
 import json
 import logging
+from typing import Any, AsyncIterator
 from urllib.parse import quote_plus
 
 from bson import ObjectId
-from pymongo import ASCENDING, AsyncMongoClient
+from pymongo import ASCENDING, AsyncMongoClient, DESCENDING
 from wipac_dev_tools.mongo_jsonschema_tools import MongoJSONSchemaValidatedCollection
 
 from ..config import ENV
+from ..schema.enums import TaskforcePhase, TaskforceProjectionProfile
 
 LOGGER = logging.getLogger(__name__)
 
@@ -18,6 +20,42 @@ _DB_NAME = "WMS_DB"
 WORKFLOWS_COLL_NAME = "WorkflowColl"
 TASK_DIRECTIVES_COLL_NAME = "TaskDirectiveColl"
 TASKFORCES_COLL_NAME = "TaskforceColl"
+PHASE_CHANGE_LOGS_COLL_NAME = "PhaseChangeLogColl"  # append-only
+LEASES_COLL_NAME = "LeaseColl"  # not validated -- see `leases.py`
+MIGRATIONS_COLL_NAME = "MigrationColl"  # not validated -- see `migrations.py`
+
+# the fields for each named taskforce projection (see 'projection_profile')
+TASKFORCE_PROJECTION_PROFILES: dict[str, list[str]] = {
+    # everything except the bulky fields:
+    #   'pilot_config', 'submit_dict', 'phase_change_log',
+    #   'compound_statuses', 'top_task_errors'
+    TaskforceProjectionProfile.SUMMARY: [
+        "taskforce_uuid",
+        "task_id",
+        "workflow_id",
+        "timestamp",
+        "priority",
+        "collector",
+        "schedd",
+        "n_workers",
+        "worker_config",
+        "cluster_id",
+        "job_event_log_fpath",
+        "phase",
+        "n_failed_phase_changes",
+    ],
+    # what a TMS needs to stop (condor_rm) a taskforce
+    TaskforceProjectionProfile.TMS_STOPPER: [
+        "taskforce_uuid",
+        "workflow_id",
+        "collector",
+        "schedd",
+        "cluster_id",
+        "job_event_log_fpath",
+        "phase",
+    ],
+    TaskforceProjectionProfile.FULL: [],  # aka no projection
+}
 
 
 async def create_mongodb_client() -> AsyncMongoClient:
@@ -33,7 +71,10 @@ async def create_mongodb_client() -> AsyncMongoClient:
     return AsyncMongoClient(url)
 
 
-async def ensure_indexes(mongo_client: AsyncMongoClient) -> None:
+async def ensure_indexes(
+    mongo_client: AsyncMongoClient,
+    db_name: str = _DB_NAME,
+) -> None:
     """Create indexes in collections.
 
     Call on server startup.
@@ -44,24 +85,39 @@ async def ensure_indexes(mongo_client: AsyncMongoClient) -> None:
         coll: str,
         keys: str | list[tuple[str, int]],
         unique: bool = False,
+        expire_after_seconds: int | None = None,
     ) -> None:
         LOGGER.info(f"creating index for {coll=} {keys=} {unique=}...")
         index_name = (
             keys.replace(".", "_") + "_index"
             if isinstance(keys, str)
-            else "_".join(k for k, _ in keys) + "_compound_index"
+            else "_".join(k.replace(".", "_") for k, _ in keys) + "_compound_index"
         )
-        await mongo_client[_DB_NAME][coll].create_index(  # type: ignore[index]
+        kwargs: dict[str, Any] = {}
+        if expire_after_seconds is not None:
+            kwargs["expireAfterSeconds"] = expire_after_seconds
+        await mongo_client[db_name][coll].create_index(  # type: ignore[index]
             keys,
             name=index_name,
             unique=unique,
             background=True,
+            **kwargs,
         )
 
     # WORKFLOWS
     await make_index(WORKFLOWS_COLL_NAME, "workflow_id", unique=True)
     await make_index(WORKFLOWS_COLL_NAME, "timestamp")
     await make_index(WORKFLOWS_COLL_NAME, "priority")
+    # -- speed up workflow_mq_activator's search for the next workflow
+    await make_index(
+        WORKFLOWS_COLL_NAME,
+        [
+            ("mq_activated_ts", ASCENDING),
+            ("deactivated", ASCENDING),
+            ("priority", DESCENDING),
+            ("timestamp", ASCENDING),
+        ],
+    )
 
     # TASK_DIRECTIVES
     await make_index(TASK_DIRECTIVES_COLL_NAME, "task_id", unique=True)
@@ -95,31 +151,114 @@ async def ensure_indexes(mongo_client: AsyncMongoClient) -> None:
             ("phase", ASCENDING),
         ],
     )
+    # -- speed up TMS's request queries for '.../tms/pending-starter/taskforces'
+    await make_index(
+        TASKFORCES_COLL_NAME,
+        [
+            ("schedd", ASCENDING),
+            ("phase", ASCENDING),
+            ("priority", DESCENDING),
+            (f"n_failed_phase_changes.{TaskforcePhase.CONDOR_SUBMIT}", ASCENDING),
+            ("timestamp", ASCENDING),
+        ],
+    )
+    # -- speed up TMS's request queries for '.../tms/pending-stopper/taskforces'
+    await make_index(
+        TASKFORCES_COLL_NAME,
+        [
+            ("schedd", ASCENDING),
+            ("phase", ASCENDING),
+            ("timestamp", ASCENDING),
+        ],
+    )
+    # -- speed up taskforce_launch_control's search for the next taskforces
+    await make_index(
+        TASKFORCES_COLL_NAME,
+        [
+            ("phase", ASCENDING),
+            ("priority", DESCENDING),
+            ("timestamp", ASCENDING),
+        ],
+    )
+    # -- speed up taskforce_launch_control's search, w/ a per-schedd budget
+    await make_index(
+        TASKFORCES_COLL_NAME,
+        [
+            ("phase", ASCENDING),
+            ("schedd", ASCENDING),
+            ("priority", DESCENDING),
+            ("timestamp", ASCENDING),
+        ],
+    )
+
+    # PHASE CHANGE LOGS
+    await make_index(
+        PHASE_CHANGE_LOGS_COLL_NAME,
+        [
+            ("taskforce_uuid", ASCENDING),
+            ("timestamp", ASCENDING),
+        ],
+    )
+    await make_index(PHASE_CHANGE_LOGS_COLL_NAME, "workflow_id")
+    await make_index(PHASE_CHANGE_LOGS_COLL_NAME, "timestamp")
+
+    # LEASES
+    # -- clean up abandoned leases (ex: a replica that never came back)
+    #    NOTE: this is not what expires a lease -- see `leases.py`
+    await make_index(LEASES_COLL_NAME, "expires_at", expire_after_seconds=0)
 
     LOGGER.info("Ensured indexes (may continue in background).")
 
 
+def _prep_paginated_query(
+    query: dict,
+    after: str | None,
+    projection: list,
+) -> None:
+    # arg: query -- use 'after'
+    if after:
+        query["_id"] = {"$gt": ObjectId(after)}
+
+    # arg: projection
+    if "_id" in projection:
+        projection.remove("_id")
+
+
+async def streamed_find_all(
+    query: dict,
+    after: str | None,
+    projection: list,
+    coll: MongoJSONSchemaValidatedCollection,
+) -> AsyncIterator[dict]:
+    """Yield all matches from the database, one at a time (no page limit).
+
+    Matches are ordered the same as `paginated_find_all()`, and `after` is
+    used the same way.
+    """
+    _prep_paginated_query(query, after, projection)
+
+    async for m in coll.find_all(query, projection, sort=[("_id", 1)]):
+        yield m
+
+
 async def paginated_find_all(
     query: dict,
     after: str | None,
     projection: list,
     coll: MongoJSONSchemaValidatedCollection,
-) -> tuple[list, str | None]:
+) -> tuple[list[str], str | None]:
     """
     Handle paginated queries to the database.
 
+    Returns the matches already serialized to JSON -- each doc is serialized
+    once, both to measure the page size and to write the response (see
+    `BaseWMSHandler.write_serialized_page()`).
+
     NOTE: in order for pagination to work, everything is sorted by '_id'
     -> ids are time-sortable, so there is less possibility of race condition
        in results if the db state changes between user's subsequent calls
     """
-
-    # arg: query -- use 'after'
-    if after:
-        query["_id"] = {"$gt": ObjectId(after)}
-
-    # arg: projection
-    if "_id" in projection:
-        projection.remove("_id")
+    _prep_paginated_query(query, after, projection)
 
     # search -- when memory gets too high, stop & send last id to user
     last_id = None
@@ -127,16 +266,14 @@ async def paginated_find_all(
     matches = []
     total_bytes = 0
     async for m in coll.find_all(query, projection, no_id=False, sort=[("_id", 1)]):
-        total_bytes += len(
-            json.dumps(
-                {k: v for k, v in m.items() if k != "_id"}  # '_id' is not JSON-friendly
-            ).encode()
-        )
+        _id = m.pop("_id")  # '_id' is not JSON-friendly
+        serialized = json.dumps(m)  # ascii-only, so len() is the number of bytes
+        total_bytes += len(serialized)
         if total_bytes > ENV.USER_QUERY_MAX_BYTES:
             next_after = str(last_id) if last_id else None
             break  # stop right before limit is exceeded
         else:
-            last_id = m.pop("_id")
-            matches.append(m)
+            last_id = _id
+            matches.append(serialized)
 
     return matches, next_after
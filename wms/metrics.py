@@ -0,0 +1,69 @@
+"""Prometheus metrics for the WMS."""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# --------------------------------------------------------------------------------------
+# taskforce_launch_control
+
+LAUNCH_CONTROL_BACKLOG = Gauge(
+    "wms_taskforce_launch_control_backlog",
+    "Number of taskforces waiting in 'pre-launch' (recounted every "
+    "TASKFORCE_LAUNCH_CONTROL_BACKLOG_METRIC_INTERVAL seconds).",
+)
+LAUNCH_CONTROL_PROMOTED = Counter(
+    "wms_taskforce_launch_control_promoted",
+    "Number of taskforces advanced from 'pre-launch' to 'pending-starter'.",
+)
+
+# --------------------------------------------------------------------------------------
+# daemons (all)
+
+DAEMON_ITERATION_SECONDS = Histogram(
+    "wms_daemon_iteration_seconds",
+    "Time spent on one iteration of a daemon task's loop (not counting its wait).",
+    ["daemon"],
+)
+
+# --------------------------------------------------------------------------------------
+# rest handlers
+
+REQUEST_SECONDS = Histogram(
+    "wms_request_seconds",
+    "Time spent handling a request, start to finish (including any long-poll 'wait').",
+    ["route", "method", "status"],
+)
+TASKFORCES_BY_PHASE = Gauge(
+    "wms_taskforces",
+    "Number of taskforces in each phase (as of the last scrape of '/metrics').",
+    ["phase"],
+)
+REQUEST_VALIDATION_SECONDS = Histogram(
+    "wms_request_validation_seconds",
+    "Time spent validating a request against the OpenAPI spec.",
+    ["route", "method"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05),
+)
+
+# --------------------------------------------------------------------------------------
+# database
+
+DB_OPERATION_SECONDS = Histogram(
+    "wms_db_operation_seconds",
+    "Time spent on one collection operation (for reads, until all results are fetched).",
+    ["collection", "operation"],
+)
+DB_WRITE_VALIDATION_SECONDS = Histogram(
+    "wms_db_write_validation_seconds",
+    "Time spent validating one insert/update (or update operator) before a db write.",
+    ["collection"],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01),
+)
+
+# --------------------------------------------------------------------------------------
+# mqs
+
+MQS_REQUEST_SECONDS = Histogram(
+    "wms_mqs_request_seconds",
+    "Time spent on one request to the MQS.",
+    ["method", "path"],  # the path w/o ids, ex: '/mqs/mq-profiles/{mqid}'
+)
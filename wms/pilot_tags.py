@@ -0,0 +1,154 @@
+"""Resolve pilot image tags (singularity/apptainer) on CVMFS, off the event loop.
+
+Scanning CVMFS can be slow, so it never happens on the event loop: an index of
+the available tags is scanned in a worker thread, and refreshed in the
+background (see `run()`). Tags are resolved against the index. A tag missing
+from the index (ex: an image that just finished uploading) triggers a refresh,
+which is shared by all concurrent requests (single-flight).
+"""
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Iterator
+
+from tornado import web
+from wipac_dev_tools.container_registry_tools import (
+    CVMFSRegistryTools,
+    ImageNotFoundException,
+)
+
+from . import metrics
+from .config import ENV
+from .utils import resilient_daemon_task
+
+LOGGER = logging.getLogger(__name__)
+
+_PILOT_IMAGE_NAME = "ewms-pilot"
+
+
+class _TagIndex(CVMFSRegistryTools):
+    """A snapshot of the pilot tags on CVMFS.
+
+    Tags are resolved by the library's `resolve_tag()`, but its lookups are
+    answered from the snapshot -- CVMFS is not touched.
+    """
+
+    def __init__(
+        self,
+        tags: frozenset[str],
+        x_y_z_tags: list[str],  # newest semver to oldest
+        timestamp: float,
+    ) -> None:
+        super().__init__(ENV.CVMFS_PILOT_SINGULARITY_IMAGES_DIR, _PILOT_IMAGE_NAME)
+        self.tags = tags
+        self.x_y_z_tags = x_y_z_tags
+        self.timestamp = timestamp
+
+    def get_image_path(self, tag: str, check_exists: bool = False) -> Path:
+        """Get the image path for 'tag' (optionally, check that it's in the index)."""
+        dpath = super().get_image_path(tag)
+        if check_exists and tag not in self.tags:
+            raise ImageNotFoundException(dpath)
+        return dpath
+
+    def iter_x_y_z_tags(self) -> Iterator[str]:
+        """Iterate over the index's 'X.Y.Z' tags, newest semver to oldest."""
+        return iter(self.x_y_z_tags)
+
+    def resolve(self, tag: str) -> str:
+        """Resolve the tag -- see `CVMFSRegistryTools.resolve_tag()`.
+
+        Raises `ImageNotFoundException` if the tag is not in the index.
+        """
+        return self.resolve_tag(tag)
+
+
+def _scan_cvmfs() -> _TagIndex:
+    """Scan CVMFS for all the pilot tags -- blocking, so run in a thread."""
+    cvmfs = CVMFSRegistryTools(
+        ENV.CVMFS_PILOT_SINGULARITY_IMAGES_DIR, _PILOT_IMAGE_NAME
+    )
+    return _TagIndex(
+        frozenset(
+            p.name.split(":", maxsplit=1)[1]
+            for p in ENV.CVMFS_PILOT_SINGULARITY_IMAGES_DIR.glob(
+                f"{_PILOT_IMAGE_NAME}:*"
+            )
+        ),
+        list(cvmfs.iter_x_y_z_tags()),
+        time.time(),
+    )
+
+
+class _PilotTagResolver:
+    """Holds the tag index, and refreshes it (single-flight)."""
+
+    def __init__(self) -> None:
+        self._index: _TagIndex | None = None
+        self._refreshing: asyncio.Task[_TagIndex] | None = None
+
+    async def refresh(self) -> _TagIndex:
+        """Rescan CVMFS in a thread -- concurrent callers share one scan."""
+        if not self._refreshing:
+            self._refreshing = asyncio.create_task(asyncio.to_thread(_scan_cvmfs))
+        task = self._refreshing
+        try:
+            self._index = await asyncio.shield(task)  # a cancelled caller != cancelled scan
+        finally:
+            if self._refreshing is task and task.done():
+                self._refreshing = None
+        LOGGER.debug(f"pilot tag index has {len(self._index.tags)} tags")
+        return self._index
+
+    async def resolve(self, tag: str) -> str:
+        """Resolve the tag, refreshing the index first if it's missing.
+
+        Raises `ImageNotFoundException` if the tag cannot be found.
+        """
+        index = self._index or await self.refresh()
+        try:
+            return index.resolve(tag)
+        except ImageNotFoundException:
+            # don't rescan for every typo -- an index this fresh is good enough
+            if time.time() - index.timestamp < ENV.CVMFS_PILOT_TAG_INDEX_MIN_AGE:
+                raise
+        return (await self.refresh()).resolve(tag)
+
+
+_RESOLVER = _PilotTagResolver()
+
+
+async def get_pilot_tag(tag: str) -> str:
+    """Get/validate/resolve the pilot image tag (singularity/apptainer) on CVMFS."""
+    LOGGER.info(f"checking pilot tag: {tag}")
+
+    try:
+        resolved = await _RESOLVER.resolve(tag)
+    except ImageNotFoundException:
+        msg = (
+            "Pilot image tag not found. "
+            "It is possible that the image has not finished uploading to its registry. "
+            "If this error persists, contact an EWMS admin."
+        )
+        raise web.HTTPError(
+            status_code=400,
+            log_message=msg,
+            reason=msg,  # to client
+        )
+
+    LOGGER.info(f"resolved pilot tag: {tag} -> {resolved}")
+    return resolved
+
+
+@resilient_daemon_task(ENV.CVMFS_PILOT_TAG_INDEX_REFRESH_INTERVAL, LOGGER)
+async def run() -> None:
+    """Start up the daemon task that keeps the pilot tag index fresh."""
+    LOGGER.info("Starting up pilot tag index refresher...")
+
+    iteration_seconds = metrics.DAEMON_ITERATION_SECONDS.labels(daemon="pilot_tags")
+    while True:
+        with iteration_seconds.time():
+            await _RESOLVER.refresh()
+        await asyncio.sleep(ENV.CVMFS_PILOT_TAG_INDEX_REFRESH_INTERVAL)
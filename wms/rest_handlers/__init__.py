@@ -2,6 +2,8 @@
 
 from . import (  # noqa: F401
     base_handlers,
+    metrics_handlers,
+    request_validation,
     schema_handlers,
     task_directive_handlers,
     taskforce_handlers,
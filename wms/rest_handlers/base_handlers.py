@@ -1,33 +1,87 @@
 """Base REST handlers for the WMS REST API server interface."""
 
+import json
 import logging
-from typing import Any
+from typing import Any, AsyncIterator
 
-from pymongo import AsyncMongoClient
-from rest_tools.server import RestHandler, validate_request
+from rest_tools.client import RestClient
+from rest_tools.server import RestHandler
 
 from . import auth
-from .. import config, database
+from .request_validation import route_to_openapi_path, validate_request
+from .. import config, database, metrics
 from ..utils import get_mqs_connection
 
 LOGGER = logging.getLogger(__name__)
 
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
 
 class BaseWMSHandler(RestHandler):
     """BaseWMSHandler is a RestHandler for all WMS routes."""
 
     def initialize(  # type: ignore[override]  # ty: ignore[invalid-method-override]
         self,
-        mongo_client: AsyncMongoClient,
+        wms_db: database.client.WMSMongoValidatedDatabase,
+        phase_watcher: database.change_streams.TaskforcePhaseWatcher,
         *args: Any,
         **kwargs: Any,
     ) -> None:
         """Initialize a BaseWMSHandler object."""
         super().initialize(*args, **kwargs)
-        self.wms_db = database.client.WMSMongoValidatedDatabase(mongo_client)
-        self.mqs_rc = get_mqs_connection(
-            logging.getLogger(f"{LOGGER.name.split('.', maxsplit=1)[0]}.mqs-client")
-        )
+        self.wms_db = wms_db  # shared across all requests -- see `server.make()`
+        self.phase_watcher = phase_watcher
+
+    def on_finish(self) -> None:
+        """Record the request's latency -- see `metrics.REQUEST_SECONDS`."""
+        super().on_finish()
+        metrics.REQUEST_SECONDS.labels(
+            route=route_to_openapi_path(getattr(self, "ROUTE")),
+            method=self.request.method,
+            status=self.get_status(),
+        ).observe(self.request.request_time())
+
+    @property
+    def mqs_rc(self) -> RestClient:
+        """The process-wide MQS client -- only created once a handler needs it."""
+        return get_mqs_connection()
+
+    def write_serialized_page(
+        self,
+        key: str,
+        serialized_matches: list[str],
+        next_after: str | None,
+    ) -> None:
+        """Write a page of already-serialized matches (see `paginated_find_all()`).
+
+        Equivalent to `self.write({key: matches, "next_after": next_after})`,
+        without serializing the matches again.
+        """
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(f'{{"{key}": [')
+        self.write(", ".join(serialized_matches))
+        self.write(f'], "next_after": {json.dumps(next_after)}}}')
+
+    def wants_ndjson(self) -> bool:
+        """Did the client ask for a newline-delimited JSON (streamed) response?"""
+        return NDJSON_CONTENT_TYPE in self.request.headers.get("Accept", "")
+
+    async def write_ndjson(self, docs: AsyncIterator[dict]) -> None:
+        """Stream the docs to the client as newline-delimited JSON.
+
+        The output is flushed every `USER_QUERY_STREAM_FLUSH_BYTES`, so
+        memory use stays flat regardless of how many docs there are.
+        """
+        self.set_header("Content-Type", NDJSON_CONTENT_TYPE)
+
+        n_bytes = 0
+        async for doc in docs:
+            line = json.dumps(doc) + "\n"
+            self.write(line)
+            n_bytes += len(line)
+            if n_bytes >= config.ENV.USER_QUERY_STREAM_FLUSH_BYTES:
+                await self.flush()
+                n_bytes = 0
 
 
 # --------------------------------------------------------------------------------------
@@ -39,7 +93,7 @@ class MainHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def get(self) -> None:
         """Handle GET."""
         self.write({})
@@ -0,0 +1,40 @@
+"""REST handlers for exposing the WMS's Prometheus metrics."""
+
+import logging
+
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from . import auth
+from .base_handlers import BaseWMSHandler
+from .request_validation import validate_request
+from .. import config, metrics
+from ..schema.enums import TaskforcePhase
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MetricsHandler(BaseWMSHandler):
+    """The sole handler for retrieving the metrics (Prometheus text format)."""
+
+    ROUTE = rf"/{config.URL_V_PREFIX}/metrics$"
+
+    async def _count_taskforces_by_phase(self) -> dict[TaskforcePhase, int]:
+        """Count the taskforces in each phase, in one aggregate (none -> 0)."""
+        counts = {p: 0 for p in TaskforcePhase}
+        async for g in self.wms_db.taskforces_collection.aggregate(
+            [{"$group": {"_id": "$phase", "n": {"$sum": 1}}}],
+            no_id=False,
+        ):
+            counts[TaskforcePhase(g["_id"])] = g["n"]
+        return counts
+
+    @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
+    @validate_request()
+    async def get(self) -> None:
+        """Handle GET."""
+        # the backlogs are counted now, so they're never stale
+        for phase, n in (await self._count_taskforces_by_phase()).items():
+            metrics.TASKFORCES_BY_PHASE.labels(phase=phase).set(n)
+
+        self.set_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.write(generate_latest())
@@ -0,0 +1,293 @@
+"""Precompiled OpenAPI request validation for the REST handlers.
+
+Validating with the full OpenAPI spec object (`openapi_core`) on every request
+means finding the route's operation and building its validators, each time.
+Instead, each route+method's validators are compiled once (see
+`compile_validators()`, called on server startup) then reused.
+
+This covers only the parts of OpenAPI that our spec uses -- anything else is
+rejected when compiling (so on server startup), not ignored:
+    - parameters are only 'in' the path or the query -- no headers or cookies;
+    - query parameters are scalars ('string', 'integer', 'number', 'boolean'),
+      with the default style -- no arrays or objects. If a query parameter is
+      repeated, only the last value is validated, since that is the one the
+      handlers read (`RequestHandler.get_argument()`);
+    - request bodies are only 'application/json'. The body is validated as
+      JSON regardless of the request's Content-Type, since that is how the
+      handlers read it (`RestHandler.json_body_arguments`).
+"""
+
+import dataclasses as dc
+import logging
+import re
+import time
+from functools import wraps
+from typing import Any, Callable, Sequence
+from urllib.parse import quote
+
+import jsonschema
+import tornado.web
+from referencing import Registry, Resource
+from referencing.jsonschema import DRAFT202012
+from rest_tools.openapi_tools import _schema_error_to_human_readable
+
+from .. import config, metrics
+
+LOGGER = logging.getLogger(__name__)
+
+_OPENAPI_URI = "urn:wms:openapi"
+
+_REGISTRY: Registry = Registry().with_resource(
+    _OPENAPI_URI,
+    Resource.from_contents(config.OPENAPI_DICT, default_specification=DRAFT202012),
+)
+
+# match named groups: (?P<task_id>\w+) or (?P<task_id>[\w-]+)
+_ROUTE_PARAM_PATTERN = re.compile(r"\(\?P<([^>]+)>[^)]+\)")
+
+
+def route_to_openapi_path(route: str) -> str:
+    """Convert a handler's ROUTE regex to its OpenAPI path.
+
+    Example: '/v1/workflows/(?P<workflow_id>[\\w-]+)$' -> '/v1/workflows/{workflow_id}'
+    """
+    return _ROUTE_PARAM_PATTERN.sub(r"{\1}", route).rstrip("$")
+
+
+def _make_validator(pointer: str) -> jsonschema.Draft202012Validator:
+    """Make a validator for the schema at the JSON pointer in the OpenAPI spec.
+
+    The schema is referenced, not copied, so its own '#/components/...' refs
+    resolve against the whole spec.
+    """
+    return jsonschema.Draft202012Validator(
+        {"$ref": f"{_OPENAPI_URI}#{quote(pointer, safe='/~')}"},
+        registry=_REGISTRY,
+    )
+
+
+def _escape(token: str) -> str:
+    """Escape a JSON-pointer token."""
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _deref(obj: dict) -> tuple[dict, str | None]:
+    """Follow a local '$ref' (if any), returning the object and its JSON pointer."""
+    if "$ref" not in obj:
+        return obj, None
+    resolved = _REGISTRY.resolver().lookup(f"{_OPENAPI_URI}{obj['$ref']}")
+    return resolved.contents, obj["$ref"].removeprefix("#")
+
+
+_SCALAR_TYPES = ("string", "integer", "number", "boolean")
+
+
+def _assert_supported_param(param: dict) -> None:
+    """Raise if the parameter needs more than this module validates."""
+    desc = f"{param['in']} parameter {param['name']!r}"
+    if param["in"] not in ("path", "query"):
+        raise NotImplementedError(f"{desc}: only path and query params are supported")
+    if {"content", "style", "explode"} & param.keys():
+        raise NotImplementedError(f"{desc}: only the default serialization is supported")
+    schema, _ = _deref(param["schema"])
+    if schema.get("type", "string") not in _SCALAR_TYPES:
+        raise NotImplementedError(f"{desc}: only scalar types are supported")
+
+
+def _assert_supported_body(request_body: dict) -> None:
+    """Raise if the request body needs more than this module validates."""
+    if list(request_body["content"]) != ["application/json"]:
+        raise NotImplementedError(
+            "request body: only 'application/json' is supported, not "
+            f"{list(request_body['content'])}"
+        )
+
+
+@dc.dataclass(frozen=True)
+class _Param:
+    required: bool
+    schema: dict
+    validator: jsonschema.Draft202012Validator
+
+
+@dc.dataclass(frozen=True)
+class RouteValidator:
+    """The compiled validators for one route+method."""
+
+    body: jsonschema.Draft202012Validator | None
+    body_required: bool
+    query_params: dict[str, _Param]
+    path_params: dict[str, _Param]
+
+    @staticmethod
+    def compile(openapi_path: str, method: str) -> "RouteValidator":
+        """Compile the validators for the route+method."""
+        op_pointer = f"/paths/{_escape(openapi_path)}/{method.lower()}"
+        path_item = config.OPENAPI_DICT["paths"][openapi_path]
+        operation = path_item[method.lower()]
+
+        # body
+        body, body_required = None, False
+        if "requestBody" in operation:
+            _assert_supported_body(operation["requestBody"])
+            body_required = operation["requestBody"].get("required", False)
+            body = _make_validator(
+                f"{op_pointer}/requestBody/content/{_escape('application/json')}/schema"
+            )
+
+        # params -- path-level ones, then operation-level ones
+        query_params, path_params = {}, {}
+        for where, params in [
+            (f"/paths/{_escape(openapi_path)}", path_item.get("parameters", [])),
+            (op_pointer, operation.get("parameters", [])),
+        ]:
+            for i, param in enumerate(params):
+                param, pointer = _deref(param)
+                pointer = pointer or f"{where}/parameters/{i}"
+                _assert_supported_param(param)
+                compiled = _Param(
+                    param.get("required", False),
+                    _deref(param["schema"])[0],  # for casting query-param strings
+                    _make_validator(f"{pointer}/schema"),
+                )
+                match param["in"]:
+                    case "query":
+                        query_params[param["name"]] = compiled
+                    case "path":
+                        path_params[param["name"]] = compiled
+
+        return RouteValidator(body, body_required, query_params, path_params)
+
+
+_VALIDATORS: dict[tuple[str, str], RouteValidator] = {}  # (route, method)
+
+
+def get_route_validator(route: str, method: str) -> RouteValidator:
+    """Get the compiled validators for the handler's route+method."""
+    try:
+        return _VALIDATORS[(route, method)]
+    except KeyError:
+        LOGGER.info(f"compiling request validators for {method} @ {route}...")
+        _VALIDATORS[(route, method)] = RouteValidator.compile(
+            route_to_openapi_path(route), method
+        )
+        return _VALIDATORS[(route, method)]
+
+
+def compile_validators(handlers: Sequence[type[tornado.web.RequestHandler]]) -> None:
+    """Compile the validators for all the handlers' routes+methods.
+
+    Call on server startup.
+    """
+    for handler in handlers:
+        for method in tornado.web.RequestHandler.SUPPORTED_METHODS:
+            if method.lower() in vars(handler):  # only methods defined by the class
+                get_route_validator(getattr(handler, "ROUTE"), method)
+
+
+# --------------------------------------------------------------------------------------
+
+
+def _cast(value: str, schema: dict) -> Any:
+    """Cast the query-param string to its schema's type, if it is a scalar."""
+    try:
+        match schema.get("type"):
+            case "integer":
+                return int(value)
+            case "number":
+                return float(value)
+            case "boolean":
+                return {"true": True, "false": False}.get(value.lower(), value)
+    except ValueError:
+        pass  # let the validator report it
+    return value
+
+
+def _check(
+    validator: jsonschema.Draft202012Validator,
+    instance: Any,
+    name: str = "",
+) -> list[str]:
+    prefix = f"{name}: " if name else ""
+    return [
+        prefix + _schema_error_to_human_readable(e)
+        for e in validator.iter_errors(instance)
+    ]
+
+
+def _get_errors(
+    zelf: tornado.web.RequestHandler,
+    rv: RouteValidator,
+    path_kwargs: dict[str, Any],
+) -> list[str]:
+    """Get the human-readable validation errors for the request."""
+    errors = []
+
+    # path
+    for name, param in rv.path_params.items():
+        errors += _check(param.validator, path_kwargs.get(name), name)
+
+    # query
+    for name, param in rv.query_params.items():
+        values = zelf.request.query_arguments.get(name)
+        if not values:
+            if param.required:
+                errors.append(f"Missing required query parameter: {name}")
+            continue
+        value = _cast(values[-1].decode(), param.schema)  # last one, like get_argument()
+        errors += _check(param.validator, value, name)
+
+    # body
+    if rv.body:
+        if not zelf.request.body:
+            if rv.body_required:
+                errors.append("Missing required request body")
+        else:
+            # -> 400 if not JSON dict
+            errors += _check(rv.body, zelf.json_body_arguments)  # type: ignore[attr-defined]
+
+    return errors
+
+
+def validate_request() -> Callable:
+    """A REST-endpoint wrapper to validate requests against the OpenAPI spec.
+
+    Like `rest_tools.server.validate_request`, but with precompiled validators.
+
+    Example:
+    ```
+    class MyRestHandler(BaseWMSHandler):
+
+        @validate_request()
+        async def get(self) -> None: ...
+    ```
+    """
+
+    def make_wrapper(method):  # type: ignore[no-untyped-def]
+        @wraps(method)
+        async def wrapper(zelf: tornado.web.RequestHandler, *args, **kwargs):  # type: ignore[no-untyped-def]
+            LOGGER.debug("validating with openapi spec (precompiled)")
+            route = getattr(zelf, "ROUTE")
+            http_method = zelf.request.method or "GET"
+
+            start = time.perf_counter()
+            errors = _get_errors(
+                zelf, get_route_validator(route, http_method), kwargs
+            )
+            metrics.REQUEST_VALIDATION_SECONDS.labels(
+                route=route_to_openapi_path(route), method=http_method
+            ).observe(time.perf_counter() - start)
+
+            if errors:
+                reason = "; ".join(errors)
+                raise tornado.web.HTTPError(
+                    status_code=400,
+                    log_message=f"Invalid request: {reason}",  # to stderr
+                    reason=reason,  # to client
+                )
+
+            return await method(zelf, *args, **kwargs)
+
+        return wrapper
+
+    return make_wrapper
@@ -2,10 +2,9 @@
 
 import logging
 
-from rest_tools.server import validate_request
-
 from . import auth
 from .base_handlers import BaseWMSHandler
+from .request_validation import validate_request
 from .. import config
 
 LOGGER = logging.getLogger(__name__)
@@ -17,7 +16,7 @@ class SchemaHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/schema/openapi$"
 
     @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def get(self) -> None:
         """Handle GET."""
         # get the underlying dict (json)
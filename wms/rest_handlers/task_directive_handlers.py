@@ -3,15 +3,15 @@
 import logging
 import time
 
-from rest_tools.server import validate_request
 from tornado import web
 
 from . import auth
 from .base_handlers import BaseWMSHandler
+from .request_validation import validate_request
 from .. import config
 from ..config import MAX_WORKFLOW_PRIORITY, UnknownClusterLocationException
 from ..database.client import DocumentNotFoundException
-from ..database.utils import paginated_find_all
+from ..database.utils import paginated_find_all, streamed_find_all
 from ..schema.enums import TaskforcePhase
 from ..utils import IDFactory
 
@@ -92,6 +92,8 @@ def _make_taskforce_object(
                 "context": creation_reason,
             }
         ],
+        # incremented along with each failed entry in 'phase_change_log'
+        "n_failed_phase_changes": {phase: 0 for phase in TaskforcePhase},
         #
         # updated by tms SEVERAL times
         "compound_statuses": {},
@@ -176,7 +178,7 @@ class TaskDirectiveIDHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/task-directives/(?P<task_id>[\w-]+)$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def get(self, task_id: str) -> None:
         """Handle GET.
 
@@ -206,12 +208,23 @@ class TaskDirectivesFindHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/query/task-directives$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self) -> None:
         """Handle POST.
 
         Search for task directives matching given query.
         """
+        if self.wants_ndjson():
+            await self.write_ndjson(
+                streamed_find_all(
+                    self.get_argument("query"),
+                    self.get_argument("after", None),
+                    list(self.get_argument("projection", [])),
+                    self.wms_db.task_directives_collection,
+                )
+            )
+            return
+
         matches, next_after = await paginated_find_all(
             self.get_argument("query"),
             self.get_argument("after", None),
@@ -219,7 +232,7 @@ class TaskDirectivesFindHandler(BaseWMSHandler):
             self.wms_db.task_directives_collection,
         )
 
-        self.write({"task_directives": matches, "next_after": next_after})
+        self.write_serialized_page("task_directives", matches, next_after)
 
 
 # --------------------------------------------------------------------------------------
@@ -231,7 +244,7 @@ class TaskDirectiveIDActionsAddWorkersHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/task-directives/(?P<task_id>[\w-]+)/actions/add-workers$"
 
     @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, task_id: str) -> None:
         """Handle POST.
 
@@ -284,6 +297,7 @@ class TaskDirectiveIDActionsAddWorkersHandler(BaseWMSHandler):
                     taskforce,
                     session=s,
                 )
+        self.phase_watcher.notify(TaskforcePhase.PRE_MQ_ACTIVATOR)
 
         self.write(taskforce)
 
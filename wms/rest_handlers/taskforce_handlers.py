@@ -2,21 +2,78 @@
 
 import logging
 import time
+from typing import Awaitable, Callable, TypeVar
 
 from pymongo import ASCENDING, DESCENDING
-from rest_tools.server import validate_request
 from tornado import web
 
 from . import auth
 from .base_handlers import BaseWMSHandler
+from .request_validation import validate_request
 from .. import config
-from ..config import MQS_URL_V_PREFIX
+from ..database.change_streams import wait_for_wakeup
 from ..database.client import DocumentNotFoundException
-from ..database.utils import paginated_find_all
-from ..schema.enums import TaskforcePhase
+from ..database.utils import (
+    TASKFORCE_PROJECTION_PROFILES,
+    WORKFLOWS_COLL_NAME,
+    paginated_find_all,
+    streamed_find_all,
+)
+from ..schema.enums import TaskforcePhase, TaskforceProjectionProfile
+from ..utils import get_mqprofiles
 
 LOGGER = logging.getLogger(__name__)
 
+_T = TypeVar("_T")
+
+# the (indexed) failure counters -- see 'n_failed_phase_changes'
+_N_FAILED_CONDOR_SUBMIT = f"n_failed_phase_changes.{TaskforcePhase.CONDOR_SUBMIT}"
+_N_FAILED_CONDOR_RM = f"n_failed_phase_changes.{TaskforcePhase.CONDOR_RM}"
+
+
+def get_pending_starter_query(schedd: str) -> tuple[dict, list[tuple[str, int]]]:
+    """Get the query (and sort) for the schedd's next taskforces to start.
+
+    Also used to check that it is indexed (see tests).
+    """
+    return (
+        {
+            "schedd": schedd,
+            "phase": TaskforcePhase.PENDING_STARTER,
+            # filter out taskforces with more than X failures
+            _N_FAILED_CONDOR_SUBMIT: {"$lte": config.ENV.TMS_ACTION_RETRIES},
+        },
+        [
+            ("priority", DESCENDING),  # first, highest priority
+            (_N_FAILED_CONDOR_SUBMIT, ASCENDING),  # then, fewer failed attempts
+            ("timestamp", ASCENDING),  # finally, oldest
+        ],
+    )
+
+
+def get_pending_stopper_query(schedd: str) -> tuple[dict, list[tuple[str, int]]]:
+    """Get the query (and sort) for the schedd's next taskforce to stop.
+
+    Also used to check that it is indexed (see tests).
+    """
+    return (
+        {
+            "schedd": schedd,
+            "phase": TaskforcePhase.PENDING_STOPPER,
+            "cluster_id": {"$ne": None},
+            # ^^^ there has to be something to stop
+            # filter out taskforces with more than X failures
+            _N_FAILED_CONDOR_RM: {"$lte": config.ENV.TMS_ACTION_RETRIES},
+        },
+        [
+            # Assumption: Failed taskforces are due to transient errors
+            #   in condor, iow it's not due to the nature of the
+            #   taskforce. So, we may as well respect only age, and not
+            #   sort with the number of failures.
+            ("timestamp", ASCENDING),  # oldest
+        ],
+    )
+
 
 def _make_taskforce_404(taskforce_uuid: str, adjective: str = "") -> web.HTTPError:
     adjective = adjective.strip()
@@ -29,32 +86,43 @@ def _make_taskforce_404(taskforce_uuid: str, adjective: str = "") -> web.HTTPErr
     )
 
 
-def _get_aggregate_pipeline_phasechangelog_n_failures_and_filter(
-    target_phase: str,
-    max_failures: int,
-) -> list[dict]:
-    return [
-        {
-            "$addFields": {
-                "n_failures": {
-                    "$size": {
-                        "$filter": {
-                            "input": "$phase_change_log",
-                            "as": "log",
-                            "cond": {
-                                "$and": [
-                                    {"$eq": ["$$log.target_phase", target_phase]},
-                                    {"$eq": ["$$log.was_successful", False]},
-                                ]
-                            },
-                        }
-                    }
-                }
-            }
-        },
-        # filter out taskforces with more than X failures
-        {"$match": {"n_failures": {"$lte": max_failures}}},
-    ]
+def _get_profile_projection(handler: BaseWMSHandler) -> list[str]:
+    """Get the fields of the requested 'projection_profile' (default: all fields)."""
+    return list(
+        TASKFORCE_PROJECTION_PROFILES[
+            handler.get_argument("projection_profile", TaskforceProjectionProfile.FULL)
+        ]
+    )
+
+
+async def _long_poll(
+    handler: BaseWMSHandler,
+    phase: TaskforcePhase,
+    find: Callable[[], Awaitable[_T | None]],
+) -> _T | None:
+    """Call `find()` until it finds taskforce(s), for up to 'wait' seconds.
+
+    In between, wait for a taskforce to enter `phase` (see `TaskforcePhaseWatcher`)
+    -- but never longer than `TMS_LONG_POLL_RECHECK_INTERVAL`, in case the
+    notification is missed (ex: change streams are unavailable).
+    """
+    wait = min(int(handler.get_argument("wait", 0)), config.ENV.TMS_LONG_POLL_MAX_WAIT)
+    deadline = time.monotonic() + wait
+
+    # subscribe before the first find, so no notification slips in between
+    wakeup = handler.phase_watcher.subscribe(phase)
+    try:
+        while True:
+            if (found := await find()) is not None:
+                return found
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await wait_for_wakeup(
+                wakeup, min(remaining, config.ENV.TMS_LONG_POLL_RECHECK_INTERVAL)
+            )
+    finally:
+        handler.phase_watcher.unsubscribe(phase, wakeup)
 
 
 # --------------------------------------------------------------------------------------
@@ -66,7 +134,7 @@ class TMSTaskforcesReportHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/tms/statuses/taskforces$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.TMS])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self) -> None:
         """Handle POST.
 
@@ -88,42 +156,49 @@ class TMSTaskforcesReportHandler(BaseWMSHandler):
 
         LOGGER.info(f"received updates for taskforces' statuses: {all_uuids}")
 
-        not_founds = []
-
-        # put in db
-        async with self.wms_db.mongo_client.start_session() as s:
-            async with await s.start_transaction():  # make update batch atomic
-                for uuid in all_uuids:
-                    # assemble
-                    update = {}
-                    if uuid in top_task_errors_by_taskforce:
-                        # value could be falsy -- that's ok
-                        update["top_task_errors"] = top_task_errors_by_taskforce[uuid]
-                    if uuid in compound_statuses_by_taskforce:
-                        # value could be falsy -- that's ok
-                        update["compound_statuses"] = compound_statuses_by_taskforce[
-                            uuid
-                        ]
-                    if not update:
-                        # this shouldn't trigger b/c of how all_uuids is made, but jic
-                        continue
-
-                    # db
-                    LOGGER.info(f"updating taskforce status: {uuid=} {update=}")
-                    try:
-                        await self.wms_db.taskforces_collection.find_one_and_update(
-                            {
-                                "taskforce_uuid": uuid,
-                                # we don't care what the 'phase' is
-                            },
-                            {
-                                "$set": update,
-                            },
-                            session=s,
-                        )
-                    except DocumentNotFoundException:
-                        LOGGER.warning(f"no taskforce found with uuid: {uuid}")
-                        not_founds.append(uuid)
+        # assemble
+        query_update_pairs = []
+        for uuid in all_uuids:
+            update = {}
+            if uuid in top_task_errors_by_taskforce:
+                # value could be falsy -- that's ok
+                update["top_task_errors"] = top_task_errors_by_taskforce[uuid]
+            if uuid in compound_statuses_by_taskforce:
+                # value could be falsy -- that's ok
+                update["compound_statuses"] = compound_statuses_by_taskforce[uuid]
+            if not update:
+                # this shouldn't trigger b/c of how all_uuids is made, but jic
+                continue
+            LOGGER.debug(f"updating taskforce status: {uuid=} {update=}")
+            query_update_pairs.append(
+                (
+                    {
+                        "taskforce_uuid": uuid,
+                        # we don't care what the 'phase' is
+                    },
+                    {
+                        "$set": update,
+                    },
+                )
+            )
+
+        # put in db -- all at once
+        not_founds: list[str] = []
+        if query_update_pairs:
+            res = await self.wms_db.taskforces_collection.bulk_update_one(
+                query_update_pairs
+            )
+            # only look up which ones are missing, if any are
+            if res.matched_count < len(query_update_pairs):
+                founds = {
+                    tf["taskforce_uuid"]
+                    async for tf in self.wms_db.taskforces_collection.find_all(
+                        {"taskforce_uuid": {"$in": all_uuids}},
+                        ["taskforce_uuid"],
+                    )
+                }
+                not_founds = [u for u in all_uuids if u not in founds]
+                LOGGER.warning(f"no taskforces found with uuids: {not_founds}")
 
         # respond
         if not_founds:
@@ -143,8 +218,7 @@ class TMSTaskforcesReportHandler(BaseWMSHandler):
                         "uuid": u,
                         "status": "updated",
                     }
-                    for u in all_uuids
-                    if u not in not_founds
+                    for u in set(all_uuids) - set(not_founds)
                 ]
             }
         )
@@ -159,23 +233,145 @@ class TaskforcesFindHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/query/taskforces$"
 
     @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self) -> None:
         """Handle POST.
 
         Search for taskforces matching given query.
         """
         query = self.get_argument("query")
+        # 'projection' & 'projection_profile' are mutually exclusive (see openapi)
+        projection = list(self.get_argument("projection", [])) or (
+            _get_profile_projection(self)
+        )
 
-        # query!
+        # query! -- streamed?
+        if self.wants_ndjson():
+            await self.write_ndjson(
+                streamed_find_all(
+                    query,
+                    self.get_argument("after", None),
+                    projection,
+                    self.wms_db.taskforces_collection,
+                )
+            )
+            return
+
+        # query! -- paginated
         matches, next_after = await paginated_find_all(
             query,
             self.get_argument("after", None),
-            list(self.get_argument("projection", [])),
+            projection,
             self.wms_db.taskforces_collection,
         )
 
-        self.write({"taskforces": matches, "next_after": next_after})
+        self.write_serialized_page("taskforces", matches, next_after)
+
+
+# --------------------------------------------------------------------------------------
+
+
+class TaskforcesStatsHandler(BaseWMSHandler):
+    """Handle actions for counting taskforces."""
+
+    ROUTE = rf"/{config.URL_V_PREFIX}/query/taskforces/stats$"
+
+    @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
+    @validate_request()
+    async def post(self) -> None:
+        """Handle POST.
+
+        Count taskforces matching given query, grouped by the given fields.
+        """
+        group_by = self.get_argument("group_by")
+
+        pipeline: list[dict] = [
+            {"$match": self.get_argument("query")},
+            # only keep what's needed -- lets the db use covering indexes
+            {
+                "$project": {
+                    "_id": 0,
+                    **{f: 1 for f in group_by if f != "deactivated"},
+                    **({"workflow_id": 1} if "deactivated" in group_by else {}),
+                }
+            },
+        ]
+        # 'deactivated' is a workflow field
+        if "deactivated" in group_by:
+            pipeline += [
+                {
+                    "$lookup": {
+                        "from": WORKFLOWS_COLL_NAME,
+                        "localField": "workflow_id",
+                        "foreignField": "workflow_id",  # unique index
+                        "as": "workflow",
+                    }
+                },
+                {
+                    "$set": {
+                        "deactivated": {"$arrayElemAt": ["$workflow.deactivated", 0]}
+                    }
+                },
+            ]
+        pipeline += [
+            {
+                "$group": {
+                    "_id": {f: f"${f}" for f in group_by},
+                    "count": {"$sum": 1},
+                }
+            },
+            {"$sort": {f"_id.{f}": ASCENDING for f in group_by}},
+        ]
+
+        counts = [
+            {"group": g["_id"], "count": g["count"]}
+            async for g in self.wms_db.taskforces_collection.aggregate(
+                pipeline, no_id=False
+            )
+        ]
+
+        self.write(
+            {
+                "counts": counts,
+                "total": sum(c["count"] for c in counts),
+            }
+        )
+
+
+# --------------------------------------------------------------------------------------
+
+
+class PhaseChangeLogsFindHandler(BaseWMSHandler):
+    """Handle actions for finding taskforces' full phase-change histories."""
+
+    ROUTE = rf"/{config.URL_V_PREFIX}/query/phase-change-logs$"
+
+    @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
+    @validate_request()
+    async def post(self) -> None:
+        """Handle POST.
+
+        Search for phase-change-log entries matching given query.
+        """
+        if self.wants_ndjson():
+            await self.write_ndjson(
+                streamed_find_all(
+                    self.get_argument("query"),
+                    self.get_argument("after", None),
+                    list(self.get_argument("projection", [])),
+                    self.wms_db.phase_change_logs_collection,
+                )
+            )
+            return
+
+        matches, next_after = await paginated_find_all(
+            self.get_argument("query"),
+            self.get_argument("after", None),
+            list(self.get_argument("projection", [])),
+            self.wms_db.phase_change_logs_collection,
+        )
+
+        self.write_serialized_page("phase_change_logs", matches, next_after)
 
 
 # --------------------------------------------------------------------------------------
@@ -186,67 +382,86 @@ class TMSTaskforcePendingStarterHandler(BaseWMSHandler):
 
     ROUTE = rf"/{config.URL_V_PREFIX}/tms/pending-starter/taskforces$"
 
+    async def _find_next(self, limit: int) -> list[dict] | None:
+        query, sort = get_pending_starter_query(self.get_argument("schedd"))
+        taskforces = [
+            tf
+            async for tf in self.wms_db.taskforces_collection.find_all(
+                query,
+                [],  # aka all fields
+                sort=sort,
+                limit=limit,
+            )
+        ]
+        return taskforces or None
+
     @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def get(self) -> None:
         """Handle GET.
 
         Get the next taskforce to START for the given condor location.
+
+        With 'limit', get up to that many (a batch), with each task directive
+        and mq-profile included only once.
+
+        With 'wait', hold the request open until there is one (or time runs out).
         """
-        try:
-            taskforce = await self.wms_db.taskforces_collection.aggregate_one(
-                [
-                    {
-                        "$match": {
-                            "schedd": self.get_argument("schedd"),
-                            "phase": TaskforcePhase.PENDING_STARTER,
-                        }
-                    },
-                    *_get_aggregate_pipeline_phasechangelog_n_failures_and_filter(
-                        "condor-submit",
-                        max_failures=config.ENV.TMS_ACTION_RETRIES,
-                    ),
-                    {
-                        "$sort": {
-                            "priority": DESCENDING,  # first, highest priority
-                            "n_failures": ASCENDING,  # then, fewer failed attempts
-                            "timestamp": ASCENDING,  # finally, oldest
-                        }
-                    },
-                    {"$project": {"n_failures": 0}},  # remove the computed field
-                ]
-            )
-        except DocumentNotFoundException:
-            self.write({})
-            return
+        limit = self.get_argument("limit", None)
 
-        # TMS needs some info from the task directive
-        task_directive = await self.wms_db.task_directives_collection.find_one(
-            {"task_id": taskforce["task_id"]}
+        taskforces = await _long_poll(
+            self,
+            TaskforcePhase.PENDING_STARTER,
+            lambda: self._find_next(int(limit or 1)),
         )
+        if not taskforces:
+            if limit is not None:
+                self.write({"taskforces": [], "task_directives": [], "mqprofiles": []})
+            else:
+                self.write({})
+            return
 
-        # TMS needs the mq-profiles for each queue
-        # TODO - replace with a new MQS endpoint's path for grabbing in bulk
-        mqprofiles = []
-        for mqid in set(
-            task_directive["input_queues"] + task_directive["output_queues"]
-        ):
-            resp = await self.mqs_rc.request(
-                "GET", f"/{MQS_URL_V_PREFIX}/mqs/mq-profiles/{mqid}"
+        # TMS needs some info from the task directives
+        task_directives = [
+            td
+            async for td in self.wms_db.task_directives_collection.find_all(
+                {"task_id": {"$in": list({tf["task_id"] for tf in taskforces})}},
+                [],  # aka all fields
             )
-            mqprofiles.append(resp)
+        ]
+
+        # TMS needs the mq-profiles for each queue (deduplicated)
+        mqprofiles = await get_mqprofiles(
+            self.mqs_rc,
+            [
+                q
+                for td in task_directives
+                for q in td["input_queues"] + td["output_queues"]
+            ],
+        )
 
         # NOTE: the taskforce's phase is not advanced until the TMS sends condor-submit
         #   info. This is so the TMS can die and restart well (statelessness).
         #   See POST @ .../tms/condor-submit/taskforces/{taskforce_uuid}
 
-        self.write(
-            {
-                "taskforce": taskforce,
-                "task_directive": task_directive,
-                "mqprofiles": mqprofiles,
-            }
-        )
+        # batch
+        if limit is not None:
+            self.write(
+                {
+                    "taskforces": taskforces,
+                    "task_directives": task_directives,
+                    "mqprofiles": mqprofiles,
+                }
+            )
+        # just one
+        else:
+            self.write(
+                {
+                    "taskforce": taskforces[0],
+                    "task_directive": task_directives[0],
+                    "mqprofiles": mqprofiles,
+                }
+            )
 
 
 # --------------------------------------------------------------------------------------
@@ -258,7 +473,7 @@ class TMSTaskforceCondorSubmitUUIDHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/tms/condor-submit/taskforces/(?P<taskforce_uuid>[\w-]+)$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.TMS])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, taskforce_uuid: str) -> None:
         """Handle POST.
 
@@ -307,7 +522,7 @@ class TMSTaskforceCondorSubmitUUIDFailedHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/tms/condor-submit/taskforces/(?P<taskforce_uuid>[\w-]+)/failed$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.TMS])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, taskforce_uuid: str) -> None:
         """Handle POST."""
         error = self.get_argument("error")
@@ -329,6 +544,9 @@ class TMSTaskforceCondorSubmitUUIDFailedHandler(BaseWMSHandler):
                             "context": f"ERROR: {error}",
                         },
                     },
+                    "$inc": {
+                        _N_FAILED_CONDOR_SUBMIT: 1,
+                    },
                 },
             )
         except DocumentNotFoundException as e:
@@ -349,44 +567,31 @@ class TMSTaskforcePendingStopperHandler(BaseWMSHandler):
 
     ROUTE = rf"/{config.URL_V_PREFIX}/tms/pending-stopper/taskforces$"
 
+    async def _find_next(self) -> dict | None:
+        query, sort = get_pending_stopper_query(self.get_argument("schedd"))
+        try:
+            return await self.wms_db.taskforces_collection.find_one(
+                query,
+                sort=sort,
+                projection=_get_profile_projection(self),
+            )
+        except DocumentNotFoundException:
+            return None
+
     @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def get(self) -> None:
         """Handle GET.
 
         Get the next taskforce to STOP for the given condor location.
+
+        With 'wait', hold the request open until there is one (or time runs out).
         """
-        try:
-            taskforce = await self.wms_db.taskforces_collection.aggregate_one(
-                [
-                    {
-                        "$match": {
-                            "schedd": self.get_argument("schedd"),
-                            "phase": TaskforcePhase.PENDING_STOPPER,
-                            "cluster_id": {"$ne": None},
-                            # ^^^ there has to be something to stop
-                        }
-                    },
-                    *_get_aggregate_pipeline_phasechangelog_n_failures_and_filter(
-                        "condor-rm",
-                        max_failures=config.ENV.TMS_ACTION_RETRIES,
-                    ),
-                    {
-                        "$sort": {
-                            # Assumption: Failed taskforces are due to transient errors
-                            #   in condor, iow it's not due to the nature of the
-                            #   taskforce. So, we may as well respect only age, and not
-                            #   sort with `n_failures`.
-                            "timestamp": ASCENDING,  # then, oldest
-                        }
-                    },
-                    {"$project": {"n_failures": 0}},  # remove the computed field
-                ]
-            )
-        except DocumentNotFoundException:
-            taskforce = {}
+        taskforce = await _long_poll(
+            self, TaskforcePhase.PENDING_STOPPER, self._find_next
+        )
 
-        self.write(taskforce)
+        self.write(taskforce or {})
 
 
 # --------------------------------------------------------------------------------------
@@ -400,7 +605,7 @@ class TMSTaskforceCondorRmUUIDHandler(BaseWMSHandler):
     )
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.TMS])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, taskforce_uuid: str) -> None:
         """Handle POST.
 
@@ -445,7 +650,7 @@ class TMSTaskforceCondorRmUUIDFailedHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/tms/condor-rm/taskforces/(?P<taskforce_uuid>[\w-]+)/failed$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.TMS])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, taskforce_uuid: str) -> None:
         """Handle POST."""
         error = self.get_argument("error")
@@ -467,6 +672,9 @@ class TMSTaskforceCondorRmUUIDFailedHandler(BaseWMSHandler):
                             "context": f"ERROR: {error}",
                         },
                     },
+                    "$inc": {
+                        _N_FAILED_CONDOR_RM: 1,
+                    },
                 },
             )
         except DocumentNotFoundException as e:
@@ -488,7 +696,7 @@ class TMSTaskforceCondorCompleteUUIDHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/tms/condor-complete/taskforces/(?P<taskforce_uuid>[\w-]+)$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.TMS])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, taskforce_uuid: str) -> None:
         """Handle POST.
 
@@ -536,7 +744,7 @@ class TaskforceUUIDHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/taskforces/(?P<taskforce_uuid>[\w-]+)$"
 
     @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def get(self, taskforce_uuid: str) -> None:
         """Handle GET.
 
@@ -546,7 +754,8 @@ class TaskforceUUIDHandler(BaseWMSHandler):
             taskforce = await self.wms_db.taskforces_collection.find_one(
                 {
                     "taskforce_uuid": taskforce_uuid,
-                }
+                },
+                projection=_get_profile_projection(self),
             )
         except DocumentNotFoundException as e:
             raise _make_taskforce_404(taskforce_uuid) from e
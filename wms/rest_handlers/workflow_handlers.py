@@ -1,25 +1,32 @@
 """REST handlers for workflow-related routes."""
 
+import asyncio
 import logging
 import time
 
-from rest_tools.server import validate_request
+from pymongo.errors import PyMongoError
+from rest_tools.client import RestClient
 from tornado import web
 
 from wms import database
 from . import auth
 from .base_handlers import BaseWMSHandler
+from .request_validation import validate_request
 from .task_directive_handlers import make_task_directive_object_and_taskforce_objects
-from .. import config
-from ..config import DEFAULT_WORKFLOW_PRIORITY, MAX_WORKFLOW_PRIORITY, MQS_URL_V_PREFIX
+from .. import config, pilot_tags
+from ..config import (
+    DEFAULT_WORKFLOW_PRIORITY,
+    MAX_WORKFLOW_PRIORITY,
+    MAX_WORKFLOWS_PER_DEACTIVATION,
+)
 from ..database.client import DocumentNotFoundException
-from ..database.utils import paginated_find_all
+from ..database.utils import paginated_find_all, streamed_find_all
 from ..schema.enums import (
     ENDING_OR_FINISHED_TASKFORCE_PHASES,
     TaskforcePhase,
     WorkflowDeactivatedType,
 )
-from ..utils import IDFactory
+from ..utils import IDFactory, request_mqs
 
 LOGGER = logging.getLogger(__name__)
 
@@ -32,6 +39,151 @@ def _get_all_queues(tasks: list[dict]) -> list[str]:
     return list(set(all_queues))
 
 
+def _map_aliases_to_mqids(aliases: list[str], mqid_lookup: dict[str, str]) -> list[str]:
+    """Map the queue aliases to their mqids (duplicates and unknowns are dropped)."""
+    return [mqid_lookup[a] for a in dict.fromkeys(aliases) if a in mqid_lookup]
+
+
+# --------------------------------------------------------------------------------------
+
+
+def _check_workflow_request(workflow_request: dict) -> None:
+    """Validate what json schema can't -- raise 400 if invalid.
+
+    FUTURE: if it is possible in json schema, then move to .json
+    """
+    for i, task_input in enumerate(workflow_request["tasks"]):
+        for bad_env in [
+            # pilot-task config
+            "EWMS_PILOT_TASK_IMAGE",
+            "EWMS_PILOT_TASK_ARGS",
+            "EWMS_PILOT_TASK_ENV_JSON",
+            # pilot-init config
+            "EWMS_PILOT_INIT_IMAGE",
+            "EWMS_PILOT_INIT_ARGS",
+            "EWMS_PILOT_INIT_ENV_JSON",
+        ]:
+            if bad_env in task_input.get("pilot_config", {}).get("environment", {}):
+                msg = (
+                    f"tasks[{i}].pilot_config.environment cannot include the attribute "
+                    f"'{bad_env}'. Use the top-level equivalent attribute instead."
+                )
+                raise web.HTTPError(
+                    status_code=400,
+                    log_message=msg,  # to stderr
+                    reason=msg,  # to client
+                )
+
+
+async def _assemble_workflow(
+    mqs_rc: RestClient,
+    workflow_request: dict,
+) -> tuple[dict, list[dict], list[dict]]:
+    """Assemble a new workflow, its task directives, and its taskforces.
+
+    Queues are reserved with MQS. Nothing is inserted into the db.
+    """
+    _check_workflow_request(workflow_request)
+
+    workflow = {
+        # IMMUTABLE
+        "workflow_id": IDFactory.generate_workflow_id(),
+        "timestamp": time.time(),
+        "priority": max(
+            workflow_request.get("priority", DEFAULT_WORKFLOW_PRIORITY),
+            MAX_WORKFLOW_PRIORITY,
+        ),
+        # MUTABLE
+        "deactivated": None,
+        "deactivated_ts": None,
+        "mq_activated_ts": None,  # updated by workflow_mq_activator
+        "mq_activation_lease_until": None,  # updated by workflow_mq_activator
+    }
+
+    tasks = workflow_request["tasks"]
+
+    # Reserve queues with MQS & resolve pilot tags -- concurrently
+    #   (each distinct tag is only resolved once, not once per task)
+    tags = list(
+        dict.fromkeys(t.get("pilot_config", {}).get("tag", "latest") for t in tasks)
+    )
+    resp, *resolved_tags = await asyncio.gather(
+        request_mqs(
+            mqs_rc,
+            "POST",
+            "/mqs/workflows/{workflow_id}/mq-group/reservation",
+            {
+                "queue_aliases": _get_all_queues(tasks),
+                "public": workflow_request["public_queue_aliases"],
+            },
+            workflow_id=workflow["workflow_id"],
+        ),
+        *[pilot_tags.get_pilot_tag(t) for t in tags],
+    )
+    tag_lookup = dict(zip(tags, resolved_tags))
+    mqid_lookup = {p["alias"]: p["mqid"] for p in resp["mqprofiles"]}
+
+    # Add task directives (and taskforces)
+    task_directives = []
+    taskforces = []
+    for task_input in tasks:
+        pilot_config = task_input.get("pilot_config", {})
+        td, tfs = await make_task_directive_object_and_taskforce_objects(
+            workflow["workflow_id"],  # type: ignore
+            workflow["priority"],
+            #
+            task_input["cluster_locations"],
+            #
+            task_input["task_image"],
+            task_input["task_args"],
+            task_input.get("task_env"),  # optional
+            #
+            task_input.get("init_image"),  # optional
+            task_input.get("init_args"),  # optional
+            task_input.get("init_env"),  # optional
+            #
+            #
+            _map_aliases_to_mqids(task_input["input_queue_aliases"], mqid_lookup),
+            _map_aliases_to_mqids(task_input["output_queue_aliases"], mqid_lookup),
+            #
+            {  # add values (default and/or detected)
+                "tag": tag_lookup[pilot_config.get("tag", "latest")],
+                "environment": pilot_config.get("environment", {}),
+                "input_files": pilot_config.get("input_files", []),
+            },
+            task_input["worker_config"],
+            task_input["n_workers"],  # TODO: make optional/smart
+        )
+        task_directives.append(td)
+        taskforces.extend(tfs)
+
+    return workflow, task_directives, taskforces
+
+
+async def _insert_workflow(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+    workflow: dict,
+    task_directives: list[dict],
+    taskforces: list[dict],
+) -> tuple[dict, list[dict], list[dict]]:
+    """Insert the workflow, its task directives, and its taskforces -- atomically."""
+    async with wms_db.mongo_client.start_session() as s:
+        async with await s.start_transaction():  # make update batch atomic
+            workflow = await wms_db.workflows_collection.insert_one(
+                workflow,
+                session=s,
+            )
+            task_directives = await wms_db.task_directives_collection.insert_many(
+                task_directives,
+                session=s,
+            )
+            taskforces = await wms_db.taskforces_collection.insert_many(
+                taskforces,
+                session=s,
+            )
+    return workflow, task_directives, taskforces
+
+
 # --------------------------------------------------------------------------------------
 
 
@@ -41,125 +193,22 @@ class WorkflowHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/workflows$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self) -> None:
         """Handle POST.
 
         Create a new workflow.
         """
-
-        # Advanced validation -- not possible in json schema (FUTURE: if it is, then move to .json)
-        for i, task_input in enumerate(self.get_argument("tasks")):
-            for bad_env in [
-                # pilot-task config
-                "EWMS_PILOT_TASK_IMAGE",
-                "EWMS_PILOT_TASK_ARGS",
-                "EWMS_PILOT_TASK_ENV_JSON",
-                # pilot-init config
-                "EWMS_PILOT_INIT_IMAGE",
-                "EWMS_PILOT_INIT_ARGS",
-                "EWMS_PILOT_INIT_ENV_JSON",
-            ]:
-                if bad_env in task_input.get("pilot_config", {}).get("environment", {}):
-                    msg = (
-                        f"tasks[{i}].pilot_config.environment cannot include the attribute "
-                        f"'{bad_env}'. Use the top-level equivalent attribute instead."
-                    )
-                    raise web.HTTPError(
-                        status_code=400,
-                        log_message=msg,  # to stderr
-                        reason=msg,  # to client
-                    )
-
-        # Assemble
-        workflow = {
-            # IMMUTABLE
-            "workflow_id": IDFactory.generate_workflow_id(),
-            "timestamp": time.time(),
-            "priority": max(
-                self.get_argument("priority", DEFAULT_WORKFLOW_PRIORITY),
-                MAX_WORKFLOW_PRIORITY,
-            ),
-            # MUTABLE
-            "deactivated": None,
-            "deactivated_ts": None,
-        }
-
-        # Reserve queues with MQS -- map to aliases
-        resp = await self.mqs_rc.request(
-            "POST",
-            f"/{MQS_URL_V_PREFIX}/mqs/workflows/{workflow['workflow_id']}/mq-group/reservation",
-            {
-                "queue_aliases": _get_all_queues(self.get_argument("tasks")),
-                "public": self.get_argument("public_queue_aliases"),
-            },
+        workflow, task_directives, taskforces = await _assemble_workflow(
+            self.mqs_rc,
+            self.json_body_arguments,  # already validated
         )
-        mqprofiles = resp["mqprofiles"]
-
-        # Add task directives (and taskforces)
-        task_directives = []
-        taskforces = []
-        for task_input in self.get_argument("tasks"):
-            td, tfs = await make_task_directive_object_and_taskforce_objects(
-                workflow["workflow_id"],  # type: ignore
-                workflow["priority"],
-                #
-                task_input["cluster_locations"],
-                #
-                task_input["task_image"],
-                task_input["task_args"],
-                task_input.get("task_env"),  # optional
-                #
-                task_input.get("init_image"),  # optional
-                task_input.get("init_args"),  # optional
-                task_input.get("init_env"),  # optional
-                #
-                #
-                [  # map aliases to ids
-                    p["mqid"]
-                    for p in mqprofiles
-                    if p["alias"] in task_input["input_queue_aliases"]
-                ],
-                [  # map aliases to ids
-                    p["mqid"]
-                    for p in mqprofiles
-                    if p["alias"] in task_input["output_queue_aliases"]
-                ],
-                #
-                {  # add values (default and/or detected)
-                    "tag": config.get_pilot_tag(
-                        task_input.get("pilot_config", {}).get("tag", "latest")
-                    ),
-                    "environment": task_input.get("pilot_config", {}).get(
-                        "environment", {}
-                    ),
-                    "input_files": task_input.get("pilot_config", {}).get(
-                        "input_files", []
-                    ),
-                },
-                task_input["worker_config"],
-                task_input["n_workers"],  # TODO: make optional/smart
-            )
-            task_directives.append(td)
-            taskforces.extend(tfs)
 
         # put all into db -- atomically
-        async with self.wms_db.mongo_client.start_session() as s:
-            async with await s.start_transaction():  # make update batch atomic
-                workflow = await self.wms_db.workflows_collection.insert_one(
-                    workflow,
-                    session=s,
-                )
-                task_directives = (
-                    await self.wms_db.task_directives_collection.insert_many(
-                        task_directives,
-                        session=s,
-                    )
-                )
-                taskforces = await self.wms_db.taskforces_collection.insert_many(
-                    taskforces,
-                    session=s,
-                )
+        workflow, task_directives, taskforces = await _insert_workflow(
+            self.wms_db, workflow, task_directives, taskforces
+        )
+        self.phase_watcher.notify(TaskforcePhase.PRE_MQ_ACTIVATOR)
 
         # Finish up
         self.write(
@@ -174,13 +223,76 @@ class WorkflowHandler(BaseWMSHandler):
 # --------------------------------------------------------------------------------------
 
 
+class WorkflowsBatchHandler(BaseWMSHandler):
+    """Handle actions for adding many workflows at once."""
+
+    ROUTE = rf"/{config.URL_V_PREFIX}/workflows/batch$"
+
+    @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
+    @validate_request()
+    async def post(self) -> None:
+        """Handle POST.
+
+        Create many new workflows. Each workflow is created (or not)
+        independently, so some may fail while others succeed -- see
+        each result's 'status'.
+        """
+        workflow_requests = self.get_argument("workflows")
+        semaphore = asyncio.Semaphore(config.ENV.WORKFLOW_BATCH_CONCURRENCY)
+
+        async def _create(workflow_request: dict) -> dict:
+            async with semaphore:
+                # assemble (and reserve queues)
+                try:
+                    workflow, tds, tfs = await _assemble_workflow(
+                        self.mqs_rc, workflow_request
+                    )
+                except web.HTTPError as e:
+                    return {"status": e.status_code, "error": e.reason}
+                except Exception as e:
+                    LOGGER.exception(e)
+                    return {
+                        "status": 500,
+                        "error": "Could not create workflow (could not reserve queues)",
+                    }
+                # put into db -- atomically, but only this workflow
+                #   (so one failure, or a big batch, can't sink the others)
+                try:
+                    workflow, tds, tfs = await _insert_workflow(
+                        self.wms_db, workflow, tds, tfs
+                    )
+                except (PyMongoError, web.HTTPError) as e:  # HTTPError: invalid doc
+                    LOGGER.exception(e)
+                    return {
+                        "status": 500,
+                        "error": "Could not create workflow (database error)",
+                    }
+            return {
+                "status": 200,
+                "workflow": workflow,
+                "task_directives": tds,
+                "taskforces": tfs,
+            }
+
+        # create concurrently -- one result per request, in order
+        results = await asyncio.gather(*[_create(w) for w in workflow_requests])
+        if any(r["status"] == 200 for r in results):
+            self.phase_watcher.notify(TaskforcePhase.PRE_MQ_ACTIVATOR)
+
+        self.set_status(200 if all(r["status"] == 200 for r in results) else 207)
+        self.write({"results": results})
+
+
+# --------------------------------------------------------------------------------------
+
+
 class WorkflowIDHandler(BaseWMSHandler):
     """Handle basic actions on a workflow."""
 
     ROUTE = rf"/{config.URL_V_PREFIX}/workflows/(?P<workflow_id>[\w-]+)$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def get(self, workflow_id: str) -> None:
         """Handle GET.
 
@@ -204,34 +316,54 @@ class WorkflowIDHandler(BaseWMSHandler):
 # --------------------------------------------------------------------------------------
 
 
-async def deactivate_workflow(
+async def deactivate_workflows(
     wms_db: database.client.WMSMongoValidatedDatabase,
-    workflow_id: str,
+    workflow_ids: list[str],
     deactivated_type: WorkflowDeactivatedType,
-):
-    """Stop the workflow and mark the taskforces for 'pending-stopper'."""
+) -> tuple[list[dict], list[str]]:
+    """Stop the workflows and mark their taskforces for 'pending-stopper'.
+
+    All the workflows are updated together (using '$in' filters), so the
+    number of db calls does not grow with the number of workflows.
+
+    Returns the deactivated workflows' summaries, and the ids of the ones
+    not found (or already deactivated).
+    """
+    workflow_ids = list(dict.fromkeys(workflow_ids))  # dedup, keep order
+
     async with wms_db.mongo_client.start_session() as s:
         async with await s.start_transaction():  # make update batch atomic
-            # WORKFLOW
-            try:
-                await wms_db.workflows_collection.find_one_and_update(
+            # WORKFLOWS
+            # -> which can be deactivated?
+            active = {
+                wf["workflow_id"]
+                async for wf in wms_db.workflows_collection.find_all(
                     {
-                        "workflow_id": workflow_id,
+                        "workflow_id": {"$in": workflow_ids},
                         "deactivated": None,  # aka not deactivated
                     },
-                    {
-                        "$set": {
-                            "deactivated": deactivated_type,
-                            "deactivated_ts": time.time(),
-                        },
-                    },
+                    ["workflow_id"],
                     session=s,
                 )
-            except DocumentNotFoundException as e:
-                raise web.HTTPError(
-                    status_code=404,
-                    reason=f"no non-deactivated workflow found with {workflow_id=}",  # to client
-                ) from e
+            }
+            to_deactivate = [w for w in workflow_ids if w in active]
+            not_founds = [w for w in workflow_ids if w not in active]
+            if not to_deactivate:
+                return [], not_founds
+            # -> deactivate
+            await wms_db.workflows_collection.update_many(
+                {
+                    "workflow_id": {"$in": to_deactivate},
+                    "deactivated": None,  # aka not deactivated
+                },
+                {
+                    "$set": {
+                        "deactivated": deactivated_type,
+                        "deactivated_ts": time.time(),
+                    },
+                },
+                session=s,
+            )
 
             # TASKFORCES
             # -> push "failed phase change" for any taskforces that *ARE* already ending/finished
@@ -240,7 +372,7 @@ async def deactivate_workflow(
             try:
                 await wms_db.taskforces_collection.update_many(
                     {
-                        "workflow_id": workflow_id,
+                        "workflow_id": {"$in": to_deactivate},
                         "phase": {"$in": ENDING_OR_FINISHED_TASKFORCE_PHASES},
                     },
                     {
@@ -260,6 +392,9 @@ async def deactivate_workflow(
                                 ),
                             },
                         },
+                        "$inc": {
+                            f"n_failed_phase_changes.{TaskforcePhase.PENDING_STOPPER}": 1,
+                        },
                     },
                     session=s,
                 )
@@ -267,15 +402,26 @@ async def deactivate_workflow(
                 pass  # it's actually a good thing if there were no matches
             #
             # -> now, set all not-already-ending/finished taskforces to pending-stopper
-            n_tfs_updated = 0  # in no taskforces to stop (excepted exception)
+            to_stop = {
+                # NOTE: we don't care whether the taskforce's condor cluster
+                #   has started up (see /tms/pending-stopper/taskforces)
+                "workflow_id": {"$in": to_deactivate},
+                "phase": {"$nin": ENDING_OR_FINISHED_TASKFORCE_PHASES},
+            }
+            n_tfs_by_workflow = {  # counted first, so each workflow gets its count
+                r["_id"]: r["n"]
+                async for r in wms_db.taskforces_collection.aggregate(
+                    [
+                        {"$match": to_stop},
+                        {"$group": {"_id": "$workflow_id", "n": {"$sum": 1}}},
+                    ],
+                    no_id=False,
+                    session=s,
+                )
+            }
             try:
-                n_tfs_updated = await wms_db.taskforces_collection.update_many(
-                    {
-                        "workflow_id": workflow_id,
-                        # NOTE: we don't care whether the taskforce's condor cluster
-                        #   has started up (see /tms/pending-stopper/taskforces)
-                        "phase": {"$nin": ENDING_OR_FINISHED_TASKFORCE_PHASES},
-                    },
+                await wms_db.taskforces_collection.update_many(
+                    to_stop,
                     {
                         "$set": {
                             "phase": TaskforcePhase.PENDING_STOPPER,
@@ -295,14 +441,34 @@ async def deactivate_workflow(
                 )
             except DocumentNotFoundException:
                 LOGGER.info(
-                    "okay scenario: workflow deactivated but no taskforces needed to be stopped"
+                    "okay scenario: workflow(s) deactivated but no taskforces needed to be stopped"
                 )
 
     # all done
-    return {
-        "workflow_id": workflow_id,
-        "n_taskforces": n_tfs_updated,
-    }
+    return [
+        {
+            "workflow_id": workflow_id,
+            "n_taskforces": n_tfs_by_workflow.get(workflow_id, 0),
+        }
+        for workflow_id in to_deactivate
+    ], not_founds
+
+
+async def deactivate_workflow(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+    workflow_id: str,
+    deactivated_type: WorkflowDeactivatedType,
+) -> dict:
+    """Stop the workflow and mark the taskforces for 'pending-stopper'."""
+    deactivateds, _ = await deactivate_workflows(
+        wms_db, [workflow_id], deactivated_type
+    )
+    if not deactivateds:
+        raise web.HTTPError(
+            status_code=404,
+            reason=f"no non-deactivated workflow found with {workflow_id=}",  # to client
+        )
+    return deactivateds[0]
 
 
 class WorkflowIDActionsAbortHandler(BaseWMSHandler):
@@ -311,7 +477,7 @@ class WorkflowIDActionsAbortHandler(BaseWMSHandler):
     ROUTE = rf"/{config.URL_V_PREFIX}/workflows/(?P<workflow_id>[\w-]+)/actions/abort$"
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, workflow_id: str) -> None:
         """Handle POST.
 
@@ -322,6 +488,8 @@ class WorkflowIDActionsAbortHandler(BaseWMSHandler):
             workflow_id,
             WorkflowDeactivatedType.ABORTED,
         )
+        if out["n_taskforces"]:
+            self.phase_watcher.notify(TaskforcePhase.PENDING_STOPPER)
         self.write(out)
 
 
@@ -333,7 +501,7 @@ class WorkflowIDActionsFinishedHandler(BaseWMSHandler):
     )
 
     @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self, workflow_id: str) -> None:
         """Handle POST.
 
@@ -344,24 +512,123 @@ class WorkflowIDActionsFinishedHandler(BaseWMSHandler):
             workflow_id,
             WorkflowDeactivatedType.FINISHED,
         )
+        if out["n_taskforces"]:
+            self.phase_watcher.notify(TaskforcePhase.PENDING_STOPPER)
         self.write(out)
 
 
 # --------------------------------------------------------------------------------------
 
 
+class _WorkflowsActionsDeactivateHandler(BaseWMSHandler):
+    """Base handler for deactivating many workflows at once."""
+
+    async def _deactivate(self, deactivated_type: WorkflowDeactivatedType) -> None:
+        """Deactivate the workflows given by 'workflow_ids' or 'query'.
+
+        Writes one result per workflow -- 200 if all were deactivated, else 207.
+        """
+        if self.get_argument("query", None) is not None:
+            workflow_ids = [
+                wf["workflow_id"]
+                async for wf in self.wms_db.workflows_collection.find_all(
+                    {"$and": [self.get_argument("query"), {"deactivated": None}]},
+                    ["workflow_id"],
+                    limit=MAX_WORKFLOWS_PER_DEACTIVATION + 1,  # +1 to detect overflow
+                )
+            ]
+            # same cap as 'workflow_ids' (that one is enforced by the schema)
+            if len(workflow_ids) > MAX_WORKFLOWS_PER_DEACTIVATION:
+                msg = (
+                    f"query matches more than {MAX_WORKFLOWS_PER_DEACTIVATION} "
+                    f"non-deactivated workflows, use a narrower query"
+                )
+                raise web.HTTPError(
+                    status_code=400,
+                    log_message=msg,  # to stderr
+                    reason=msg,  # to client
+                )
+        else:
+            workflow_ids = self.get_argument("workflow_ids")
+
+        deactivateds, not_founds = await deactivate_workflows(
+            self.wms_db, workflow_ids, deactivated_type
+        )
+        if any(d["n_taskforces"] for d in deactivateds):
+            self.phase_watcher.notify(TaskforcePhase.PENDING_STOPPER)
+
+        self.set_status(207 if not_founds else 200)
+        self.write(
+            {
+                "results": [{"status": 200, **d} for d in deactivateds]
+                + [
+                    {
+                        "status": 404,
+                        "workflow_id": w,
+                        "error": "no non-deactivated workflow found",
+                    }
+                    for w in not_founds
+                ]
+            }
+        )
+
+
+class WorkflowsActionsAbortHandler(_WorkflowsActionsDeactivateHandler):
+    """Handle aborting many workflows."""
+
+    ROUTE = rf"/{config.URL_V_PREFIX}/workflows/actions/abort$"
+
+    @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
+    @validate_request()
+    async def post(self) -> None:
+        """Handle POST.
+
+        Deactivate workflows (type: abort) and stop their taskforces.
+        """
+        await self._deactivate(WorkflowDeactivatedType.ABORTED)
+
+
+class WorkflowsActionsFinishedHandler(_WorkflowsActionsDeactivateHandler):
+    """Handle marking many workflows as finished."""
+
+    ROUTE = rf"/{config.URL_V_PREFIX}/workflows/actions/finished$"
+
+    @auth.service_account_auth(roles=[auth.AuthAccounts.USER])  # type: ignore
+    @validate_request()
+    async def post(self) -> None:
+        """Handle POST.
+
+        Deactivate workflows (type: mark as 'finished') and stop their taskforces.
+        """
+        await self._deactivate(WorkflowDeactivatedType.FINISHED)
+
+
+# --------------------------------------------------------------------------------------
+
+
 class WorkflowsFindHandler(BaseWMSHandler):
     """Handle actions for finding workflows."""
 
     ROUTE = rf"/{config.URL_V_PREFIX}/query/workflows$"
 
     @auth.service_account_auth(roles=auth.ALL_AUTH_ACCOUNTS)  # type: ignore
-    @validate_request(config.OPENAPI_SPEC)
+    @validate_request()
     async def post(self) -> None:
         """Handle POST.
 
         Search for workflows matching given query.
         """
+        if self.wants_ndjson():
+            await self.write_ndjson(
+                streamed_find_all(
+                    self.get_argument("query"),
+                    self.get_argument("after", None),
+                    list(self.get_argument("projection", [])),
+                    self.wms_db.workflows_collection,
+                )
+            )
+            return
+
         matches, next_after = await paginated_find_all(
             self.get_argument("query"),
             self.get_argument("after", None),
@@ -369,7 +636,7 @@ class WorkflowsFindHandler(BaseWMSHandler):
             self.wms_db.workflows_collection,
         )
 
-        self.write({"workflows": matches, "next_after": next_after})
+        self.write_serialized_page("workflows", matches, next_after)
 
 
 # --------------------------------------------------------------------------------------
@@ -30,6 +30,14 @@ ENDING_OR_FINISHED_TASKFORCE_PHASES = [
 ]
 
 
+class TaskforceProjectionProfile(enum.StrEnum):  # see comment above on enum.StrEnum
+    """The enum values used for 'projection_profile' -- the named taskforce projections."""
+
+    SUMMARY = "summary"
+    TMS_STOPPER = "tms-stopper"
+    FULL = "full"
+
+
 class WorkflowDeactivatedType(enum.StrEnum):  # see comment above on enum.StrEnum
     """The enum values used for 'deactivated'."""
 
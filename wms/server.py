@@ -6,7 +6,7 @@ from typing import Any
 from pymongo import AsyncMongoClient
 from rest_tools.server import RestHandlerSetup, RestServer
 
-from . import rest_handlers
+from . import database, rest_handlers
 from .config import ENV
 
 LOGGER = logging.getLogger(__name__)
@@ -16,8 +16,13 @@ HANDLERS = [
     #
     rest_handlers.schema_handlers.SchemaHandler,
     #
+    rest_handlers.metrics_handlers.MetricsHandler,
+    #
     rest_handlers.workflow_handlers.WorkflowHandler,
-    rest_handlers.workflow_handlers.WorkflowsFindHandler,  # must be before ID handler for regex
+    rest_handlers.workflow_handlers.WorkflowsBatchHandler,  # must be before ID handler for regex
+    rest_handlers.workflow_handlers.WorkflowsActionsAbortHandler,  # ^^^
+    rest_handlers.workflow_handlers.WorkflowsActionsFinishedHandler,  # ^^^
+    rest_handlers.workflow_handlers.WorkflowsFindHandler,  # ^^^
     rest_handlers.workflow_handlers.WorkflowIDHandler,  # ^^^
     rest_handlers.workflow_handlers.WorkflowIDActionsAbortHandler,  # ^^^
     rest_handlers.workflow_handlers.WorkflowIDActionsFinishedHandler,  # ^^^
@@ -28,6 +33,8 @@ HANDLERS = [
     #
     rest_handlers.taskforce_handlers.TMSTaskforcesReportHandler,
     rest_handlers.taskforce_handlers.TaskforcesFindHandler,  # must be before ID handler for regex
+    rest_handlers.taskforce_handlers.TaskforcesStatsHandler,  # ^^^
+    rest_handlers.taskforce_handlers.PhaseChangeLogsFindHandler,
     rest_handlers.taskforce_handlers.TaskforceUUIDHandler,  # ^^^
     #
     rest_handlers.taskforce_handlers.TMSTaskforcePendingStarterHandler,
@@ -40,7 +47,10 @@ HANDLERS = [
 ]
 
 
-async def make(mongo_client: AsyncMongoClient) -> RestServer:
+async def make(
+    mongo_client: AsyncMongoClient,
+    phase_watcher: database.change_streams.TaskforcePhaseWatcher,
+) -> RestServer:
     """Make a WMS REST service (does not start up automatically)."""
     rhs_config: dict[str, Any] = {"debug": ENV.CI}
     if ENV.AUTH_OPENID_URL:
@@ -52,7 +62,12 @@ async def make(mongo_client: AsyncMongoClient) -> RestServer:
 
     #
     # Setup clients/apis
-    args["mongo_client"] = mongo_client
+    # -> one validated-db wrapper for the whole app (not one per request)
+    args["wms_db"] = database.client.WMSMongoValidatedDatabase(mongo_client)
+    args["phase_watcher"] = phase_watcher
+
+    # compile each route's request validators now, not on its first request
+    rest_handlers.request_validation.compile_validators(HANDLERS)
 
     # Configure REST Routes
     rs = RestServer(debug=ENV.CI)
@@ -1,21 +1,158 @@
 """The daemon task that 'launches' pre-launch taskforces."""
 
 import asyncio
+import heapq
+import itertools
 import logging
 import time
+from typing import Any
 
 from pymongo import ASCENDING, AsyncMongoClient, DESCENDING
 
-from . import database
+from . import database, metrics
 from .config import ENV
+from .database.change_streams import TaskforcePhaseWatcher, wait_for_wakeup
 from .schema.enums import TaskforcePhase
 from .utils import resilient_daemon_task
 
 LOGGER = logging.getLogger(__name__)
 
 
+def get_pre_launch_query(
+    schedd: str | None = None,
+) -> tuple[dict, list[tuple[str, int]]]:
+    """Get the query (and sort) for the taskforces waiting to be launched.
+
+    If `schedd` is given, only those for that schedd.
+
+    Also used to check that it is indexed (see tests).
+    """
+    query: dict[str, Any] = {"phase": TaskforcePhase.PRE_LAUNCH}
+    if schedd is not None:
+        query["schedd"] = schedd
+    return (
+        query,
+        [
+            ("priority", DESCENDING),  # first, highest priority
+            ("timestamp", ASCENDING),  # then, oldest
+        ],
+    )
+
+
+def get_backlog_depth_pipeline() -> list[dict]:
+    """Get the aggregation that counts the taskforces waiting to be launched.
+
+    Also used to check that it is indexed (see tests).
+    """
+    query, _ = get_pre_launch_query()
+    return [{"$match": query}, {"$count": "n"}]
+
+
+async def get_backlog_depth(wms_db: database.client.WMSMongoValidatedDatabase) -> int:
+    """Count the taskforces waiting to be launched."""
+    try:
+        resp = await wms_db.taskforces_collection.aggregate_one(
+            get_backlog_depth_pipeline()
+        )
+    except database.client.DocumentNotFoundException:
+        return 0  # '$count' yields nothing when there are no matches
+    return resp["n"]
+
+
+async def _find_pre_launch(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+    schedd: str | None,
+    limit: int,
+) -> list[dict]:
+    query, sort = get_pre_launch_query(schedd)
+    return [
+        tf
+        async for tf in wms_db.taskforces_collection.find_all(
+            query,
+            ["taskforce_uuid", "schedd", "priority", "timestamp"],
+            sort=sort,
+            limit=limit,
+        )
+    ]
+
+
+async def get_next_batch(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+) -> list[dict]:
+    """Get the next taskforces to launch -- in launch order.
+
+    At most `TASKFORCE_LAUNCH_CONTROL_BATCH_SIZE` taskforces are returned, and
+    (if set) no more than `TASKFORCE_LAUNCH_CONTROL_SCHEDD_BUDGET` for any one schedd.
+    """
+    # w/o a per-schedd budget, the first N are always the batch
+    if not ENV.TASKFORCE_LAUNCH_CONTROL_SCHEDD_BUDGET:
+        return await _find_pre_launch(
+            wms_db, None, ENV.TASKFORCE_LAUNCH_CONTROL_BATCH_SIZE
+        )
+
+    # otherwise, take the top of each schedd's backlog -- then, the top of those
+    #   (so the backlog is never scanned further than each schedd's share)
+    query, _ = get_pre_launch_query()
+    schedds = await wms_db.taskforces_collection.distinct("schedd", query)
+    per_schedd = await asyncio.gather(
+        *[
+            _find_pre_launch(
+                wms_db,
+                schedd,
+                min(
+                    ENV.TASKFORCE_LAUNCH_CONTROL_SCHEDD_BUDGET,
+                    ENV.TASKFORCE_LAUNCH_CONTROL_BATCH_SIZE,
+                ),
+            )
+            for schedd in schedds
+        ]
+    )
+    launch_order = heapq.merge(
+        *per_schedd,  # each is already in launch order
+        key=lambda tf: (-tf["priority"], tf["timestamp"]),
+    )
+    return list(
+        itertools.islice(launch_order, ENV.TASKFORCE_LAUNCH_CONTROL_BATCH_SIZE)
+    )
+
+
+async def advance_to_pending_starter(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+    taskforce_uuids: list[str],
+) -> int:
+    """Advance the taskforces' phases to TaskforcePhase.PENDING_STARTER.
+
+    Returns the number of taskforces advanced.
+    """
+    return await wms_db.taskforces_collection.update_many(
+        {
+            "taskforce_uuid": {"$in": taskforce_uuids},
+            # guard: a taskforce may have moved on since it was found (ex: user abort)
+            "phase": TaskforcePhase.PRE_LAUNCH,
+        },
+        {
+            "$set": {
+                "phase": TaskforcePhase.PENDING_STARTER,
+            },
+            "$push": {
+                "phase_change_log": {
+                    "target_phase": TaskforcePhase.PENDING_STARTER,
+                    "timestamp": time.time(),
+                    "was_successful": True,
+                    "source_event_time": None,
+                    "source_entity": "Taskforce Launch Control",
+                    "context": "",
+                },
+            },
+        },
+    )
+
+
 @resilient_daemon_task(ENV.TASKFORCE_LAUNCH_CONTROL_DELAY, LOGGER)
-async def run(mongo_client: AsyncMongoClient) -> None:
+async def run(
+    mongo_client: AsyncMongoClient,
+    phase_watcher: TaskforcePhaseWatcher | None = None,
+) -> None:
     """Start up the daemon task."""
     LOGGER.info("Starting up taskforce_launch_control...")
 
@@ -23,40 +160,49 @@ async def run(mongo_client: AsyncMongoClient) -> None:
         mongo_client, parent_logger=LOGGER
     )
 
-    while True:
-        await asyncio.sleep(ENV.TASKFORCE_LAUNCH_CONTROL_DELAY)
-        LOGGER.debug("Looking at next pre-launch taskforce...")
+    # wake up as soon as there's a new 'pre-launch' taskforce (or at the delay)
+    wakeup = (
+        phase_watcher.subscribe(TaskforcePhase.PRE_LAUNCH) if phase_watcher else None
+    )
 
-        # find & advance phase
-        try:
-            taskforce = await wms_db.taskforces_collection.find_one_and_update(
-                {
-                    "phase": TaskforcePhase.PRE_LAUNCH,
-                },
-                {
-                    "$set": {
-                        "phase": TaskforcePhase.PENDING_STARTER,
-                    },
-                    "$push": {
-                        "phase_change_log": {
-                            "target_phase": TaskforcePhase.PENDING_STARTER,
-                            "timestamp": time.time(),
-                            "was_successful": True,
-                            "source_event_time": None,
-                            "source_entity": "Taskforce Launch Control",
-                            "context": "",
-                        },
-                    },
-                },
-                sort=[
-                    ("priority", DESCENDING),  # first, highest priority
-                    ("timestamp", ASCENDING),  # then, oldest
-                ],
-            )
-        except database.client.DocumentNotFoundException:
-            LOGGER.debug("NOTHING FOR TASKFORCE_LAUNCH_CONTROL TO START UP")
-        else:
-            LOGGER.info(
-                f"ADVANCED 'phase' FROM {TaskforcePhase.PRE_LAUNCH} TO {TaskforcePhase.PENDING_STARTER}"
-                f" ({taskforce['taskforce_uuid']=})"
-            )
+    iteration_seconds = metrics.DAEMON_ITERATION_SECONDS.labels(
+        daemon="taskforce_launch_control"
+    )
+    backlog_counted_at = float("-inf")  # monotonic -- counting is a full '$count'
+
+    try:
+        while True:
+            await wait_for_wakeup(wakeup, ENV.TASKFORCE_LAUNCH_CONTROL_DELAY)
+            with iteration_seconds.time():
+                LOGGER.debug("Looking at next pre-launch taskforce(s)...")
+
+                if (
+                    time.monotonic() - backlog_counted_at
+                    >= ENV.TASKFORCE_LAUNCH_CONTROL_BACKLOG_METRIC_INTERVAL
+                ):
+                    metrics.LAUNCH_CONTROL_BACKLOG.set(await get_backlog_depth(wms_db))
+                    backlog_counted_at = time.monotonic()
+
+                # find & advance phase
+                batch = await get_next_batch(wms_db)
+                if not batch:
+                    LOGGER.debug("NOTHING FOR TASKFORCE_LAUNCH_CONTROL TO START UP")
+                    continue
+                try:
+                    n_advanced = await advance_to_pending_starter(
+                        wms_db, [tf["taskforce_uuid"] for tf in batch]
+                    )
+                except database.client.DocumentNotFoundException:
+                    LOGGER.debug("NOTHING FOR TASKFORCE_LAUNCH_CONTROL TO START UP")
+                    continue
+
+                metrics.LAUNCH_CONTROL_PROMOTED.inc(n_advanced)
+                if phase_watcher:  # wake up long-polling TMSes -- see '.../pending-starter/...'
+                    phase_watcher.notify(TaskforcePhase.PENDING_STARTER)
+                LOGGER.info(
+                    f"ADVANCED 'phase' FROM {TaskforcePhase.PRE_LAUNCH} TO {TaskforcePhase.PENDING_STARTER}"
+                    f" ({n_advanced} taskforces: {[tf['taskforce_uuid'] for tf in batch]})"
+                )
+    finally:
+        if phase_watcher and wakeup:  # this task may be restarted (ex: new lease)
+            phase_watcher.unsubscribe(TaskforcePhase.PRE_LAUNCH, wakeup)
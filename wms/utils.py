@@ -4,11 +4,13 @@ import asyncio
 import logging
 import time
 import uuid
-from functools import wraps
+from functools import cache, wraps
 
+import cachetools
 from rest_tools.client import ClientCredentialsAuth, RestClient
 
-from wms.config import ENV
+from wms import metrics
+from wms.config import ENV, MQS_URL_V_PREFIX
 
 
 def resilient_daemon_task(restart_delay: float, logger: logging.Logger):
@@ -30,21 +32,91 @@ def resilient_daemon_task(restart_delay: float, logger: logging.Logger):
     return _decorator
 
 
-def get_mqs_connection(logger: logging.Logger) -> RestClient:
-    """Connect to MQS rest server."""
+@cache
+def get_mqs_connection() -> RestClient:
+    """Get the MQS rest client -- one per process, created on first use.
+
+    The client is shared by all REST handlers and daemon tasks, so its http
+    session (connection pool) and its cached access token are reused across calls.
+    """
+    logger = logging.getLogger(f"{__name__.split('.', maxsplit=1)[0]}.mqs-client")
+    logger.info("Creating MQS rest client (shared by whole process)...")
+
     if ENV.CI:
         return RestClient(
             ENV.MQS_ADDRESS,
             logger=logger,
         )
     else:
-        return ClientCredentialsAuth(
+        rc = ClientCredentialsAuth(
             ENV.MQS_ADDRESS,
             ENV.MQS_TOKEN_URL,
             ENV.MQS_CLIENT_ID,
             ENV.MQS_CLIENT_SECRET,
             logger=logger,
         )
+        # get a new token this many seconds *before* the current one expires,
+        #   so a request never waits on (or races) an about-to-expire token
+        # NOTE: rest_tools has no public option for this (see the pin in pyproject)
+        if not hasattr(rc, "_token_expire_delay_offset"):
+            raise RuntimeError(
+                "RestClient._token_expire_delay_offset is gone -- "
+                "wipac-rest-tools changed, cannot set MQS_TOKEN_REFRESH_BUFFER"
+            )
+        rc._token_expire_delay_offset = ENV.MQS_TOKEN_REFRESH_BUFFER
+        return rc
+
+
+async def request_mqs(
+    mqs_rc: RestClient,
+    method: str,
+    path: str,
+    args: dict | None = None,
+    **path_params: str,
+) -> dict:
+    """Send a request to the MQS, timed by `path` (before it's formatted).
+
+    Example: `request_mqs(rc, "GET", "/mqs/mq-profiles/{mqid}", mqid="abc123")`
+    """
+    with metrics.MQS_REQUEST_SECONDS.labels(method=method, path=path).time():
+        return await mqs_rc.request(
+            method,
+            f"/{MQS_URL_V_PREFIX}{path.format(**path_params)}",
+            args,
+        )
+
+
+_MQPROFILES_CACHE: cachetools.TTLCache = cachetools.TTLCache(
+    maxsize=1024,
+    ttl=ENV.MQS_MQPROFILES_CACHE_TTL,
+)
+
+
+async def get_mqprofiles(mqs_rc: RestClient, mqids: list[str]) -> list[dict]:
+    """Get the mq-profiles for the given mqids (duplicates are ignored).
+
+    Profiles are fetched concurrently (capped). Activated profiles are cached
+    for a short time, since they are re-requested on every TMS poll. Ones not
+    yet activated are not cached, since they will change.
+    """
+    mqids = list(dict.fromkeys(mqids))  # dedup, keep order
+    semaphore = asyncio.Semaphore(ENV.MQS_MQPROFILES_CONCURRENCY)
+
+    # TODO - replace with a new MQS endpoint's path for grabbing in bulk
+    async def _get(mqid: str) -> dict:
+        try:
+            return _MQPROFILES_CACHE[mqid]
+        except KeyError:
+            pass
+        async with semaphore:
+            resp = await request_mqs(
+                mqs_rc, "GET", "/mqs/mq-profiles/{mqid}", mqid=mqid
+            )
+        if resp.get("is_activated"):
+            _MQPROFILES_CACHE[mqid] = resp
+        return resp
+
+    return list(await asyncio.gather(*[_get(m) for m in mqids]))
 
 
 class IDFactory:
@@ -7,16 +7,12 @@ import time
 import requests
 from pymongo import ASCENDING, AsyncMongoClient, DESCENDING
 from rest_tools.client import RestClient
-from . import database
-from .config import (
-    ENV,
-    MQS_RETRY_AT_TS_DEFAULT_VALUE,
-    MQS_URL_V_PREFIX,
-    TASK_MQ_ACTIVATOR_SHORTEST_SLEEP,
-)
+from . import database, metrics
+from .config import ENV, TASK_MQ_ACTIVATOR_SHORTEST_SLEEP
+from .database.change_streams import TaskforcePhaseWatcher, wait_for_wakeup
 from .database.client import DocumentNotFoundException
 from .schema.enums import TaskforcePhase
-from .utils import get_mqs_connection, resilient_daemon_task
+from .utils import get_mqs_connection, request_mqs, resilient_daemon_task
 
 LOGGER = logging.getLogger(__name__)
 
@@ -45,130 +41,143 @@ def _mongo_syntax_advance_taskforce_to_prelaunch(context: str = "") -> dict:
     }
 
 
-async def get_next_workflow_id(
+def get_next_workflow_query(now: float) -> tuple[dict, list[tuple[str, int]]]:
+    """Get the query (and sort) for the next workflow to mq-activate.
+
+    Also used to check that it is indexed (see tests).
+    """
+    return (
+        {
+            "mq_activated_ts": None,
+            "deactivated": None,
+            # the lease is null or expired
+            "mq_activation_lease_until": {"$not": {"$gt": now}},
+        },
+        [
+            ("priority", DESCENDING),  # first, by `priority` (highest first)
+            ("timestamp", ASCENDING),  # then, by `timestamp` (oldest first)
+        ],
+    )
+
+
+def get_stragglers_pipeline() -> list[dict]:
+    """Get the aggregation for the workflows with "pre-mq-activation" taskforces.
+
+    Also used to check that it is indexed (see tests).
+    """
+    return [
+        {"$match": {"phase": TaskforcePhase.PRE_MQ_ACTIVATOR}},
+        {"$group": {"_id": "$workflow_id"}},
+    ]
+
+
+async def claim_next_workflow_id(
     wms_db: database.client.WMSMongoValidatedDatabase,
 ) -> str:
-    """Grab the id of the next workflow from db.
-
-    Find the next taskforce in the "pre-mq-activation" phase, then get its workflow id.
-    That way, we can activate all its sibling (and cousin) taskforces together.
+    """Find the next workflow to mq-activate, and claim it by taking out a lease on it.
 
-    It checks if this taskforce is behind its sibling taskforces
-    (those sharing the same `workflow_id`) by verifying if any sibling has already progressed
-    to a later phase. If the taskforce is behind, it automatically advances the phase to "pre-launch"
-    and logs this phase change. If it is not behind, it returns the `workflow_id` of the taskforce.
+    A workflow's `mq_activated_ts` is set once its queues are activated, so the
+    next workflow is found with a single (indexed) query -- no need to look at
+    its taskforces. The lease means that no other claimer (ex: another WMS
+    instance) will mq-activate the same workflow at the same time.
     """
-    while True:
-        # Aggregation pipeline to find the taskforce and check if it is behind
-        pipeline = [
-            # Stage 1: Match documents in the "pre-mq-activation" phase and with specific phase change conditions
+    now = time.time()
+    query, sort = get_next_workflow_query(now)
+    try:
+        workflow = await wms_db.workflows_collection.find_one_and_update(
+            query,
             {
-                "$match": {
-                    "phase": "pre-mq-activation",
-                    "$or": [
-                        {
-                            # Case 1: Taskforce has no failed attempts to transition to "pre-mq-activation"
-                            "phase_change_log": {
-                                "$not": {
-                                    "$elemMatch": {
-                                        "target_phase": TaskforcePhase.PRE_MQ_ACTIVATOR,
-                                        "was_successful": False,
-                                    }
-                                }
-                            }
-                        },
-                        {
-                            # Case 2: Taskforce has a failed attempt, but it was at least `X` seconds ago
-                            "phase_change_log": {
-                                "$elemMatch": {
-                                    "target_phase": TaskforcePhase.PRE_MQ_ACTIVATOR,
-                                    "was_successful": False,
-                                    "timestamp": {
-                                        "$lte": time.time()
-                                        - MQS_RETRY_AT_TS_DEFAULT_VALUE
-                                    },
-                                }
-                            }
-                        },
-                    ],
-                }
-            },
-            # Stage 2: Sort
-            {
-                "$sort": {
-                    "priority": DESCENDING,  # first, by `priority` (highest first)
-                    "timestamp": ASCENDING,  # then, by `timestamp` (oldest first)
-                }
+                "$set": {
+                    "mq_activation_lease_until": (
+                        now + ENV.WORKFLOW_MQ_ACTIVATOR_LEASE_DURATION
+                    ),
+                },
             },
-            # Stage 3: Limit to the first top-matching document
-            {"$limit": 1},
-            # Stage 4: Lookup sibling taskforces that are in later phases
+            projection={"workflow_id": True},
+            sort=sort,
+        )
+    except DocumentNotFoundException:
+        raise NoWorkflowToMQActivate()
+
+    LOGGER.info(f"mq-activation search: claimed workflow {workflow['workflow_id']}")
+    return workflow["workflow_id"]
+
+
+async def release_workflow(
+    workflows_client: database.client.MongoJSONSchemaValidatedCollection,
+    workflow_id: str,
+) -> None:
+    """Release the workflow's mq-activation lease."""
+    await workflows_client.find_one_and_update(
+        {"workflow_id": workflow_id},
+        {"$set": {"mq_activation_lease_until": None}},
+    )
+
+
+async def claim_next_workflow_ids(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+    n_workflows: int,
+) -> list[str]:
+    """Find and claim (up to) the next `n_workflows` workflows to mq-activate."""
+    claimed: list[str] = []
+
+    while len(claimed) < n_workflows:
+        try:
+            # a claimed workflow is leased, so it won't be found again
+            claimed.append(await claim_next_workflow_id(wms_db))
+        except NoWorkflowToMQActivate:
+            break
+
+    return claimed
+
+
+async def advance_stragglers_to_prelaunch(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+) -> None:
+    """Advance "pre-mq-activation" taskforces whose workflow is already mq-activated.
+
+    These are taskforces added to a workflow after it was mq-activated (ex: via
+    '.../actions/add-workers'), so they can skip straight to "pre-launch".
+    """
+    workflow_ids = [
+        d["_id"]
+        async for d in wms_db.taskforces_collection.aggregate(
+            get_stragglers_pipeline(),
+            no_id=False,
+        )
+    ]
+    if not workflow_ids:
+        return
+
+    activated_workflow_ids = [
+        w["workflow_id"]
+        async for w in wms_db.workflows_collection.find_all(
             {
-                "$lookup": {
-                    "from": wms_db.taskforces_collection.collection_name,  # The same collection for "self-join" to find siblings
-                    "let": {
-                        "workflow_id": "$workflow_id",  # Pass `workflow_id` of current taskforce
-                    },
-                    "pipeline": [
-                        {
-                            "$match": {
-                                # Match taskforces with the same `workflow_id` and later phase
-                                "$expr": {
-                                    "$and": [
-                                        # fmt: off
-                                        {"$eq": ["$workflow_id", "$$workflow_id"]},
-                                        {"$ne": ["$phase", TaskforcePhase.PRE_MQ_ACTIVATOR]},
-                                        # fmt: on
-                                    ]
-                                }
-                            }
-                        }
-                    ],
-                    "as": "later_phase_siblings",  # Field to store siblings found in later phases
-                }
+                "workflow_id": {"$in": workflow_ids},
+                "mq_activated_ts": {"$ne": None},
             },
-            # Stage 5: Project only necessary fields and determine if the taskforce is behind
+            ["workflow_id"],
+        )
+    ]
+    if not activated_workflow_ids:
+        return
+
+    LOGGER.info(
+        f"Advancing taskforces of {activated_workflow_ids} because "
+        f"their workflows (aka their sibling taskforces) have already been mq-activated..."
+    )
+    try:
+        await wms_db.taskforces_collection.update_many(
             {
-                "$project": {
-                    "taskforce_uuid": 1,
-                    "workflow_id": 1,
-                    "timestamp": 1,
-                    "phase": 1,
-                    "workflow_already_mq_activated": {  # `True` if there are any later-phase siblings
-                        "$gt": [{"$size": "$later_phase_siblings"}, 0]
-                    },
-                }
+                "workflow_id": {"$in": activated_workflow_ids},
+                "phase": TaskforcePhase.PRE_MQ_ACTIVATOR,
             },
-        ]
-
-        async with wms_db.mongo_client.start_session() as s:
-            async with await s.start_transaction():  # make update batch atomic
-                # Execute the aggregation pipeline
-                try:
-                    result = await wms_db.taskforces_collection.aggregate_one(pipeline, session=s)  # type: ignore
-                except DocumentNotFoundException:
-                    raise NoWorkflowToMQActivate()
-
-                LOGGER.info(f"mq-activation search: found taskforce {result}")
-
-                # IF not behind, return the workflow_id
-                if not result["workflow_already_mq_activated"]:
-                    return result["workflow_id"]
-                # ELSE, update its phase to "pre-launch" if needed--then loop
-                else:
-                    LOGGER.info(
-                        f"Advancing taskforce {result["taskforce_uuid"]} because "
-                        f"its workflow (aka its sibling taskforces) has already been mq-activated..."
-                    )
-                    await wms_db.taskforces_collection.find_one_and_update(
-                        {"taskforce_uuid": result["taskforce_uuid"]},
-                        _mongo_syntax_advance_taskforce_to_prelaunch(
-                            context="Auto-advanced because workflow has already been mq-activated."
-                        ),
-                        session=s,
-                    )
-        # fall-through -- look again
-        LOGGER.info("Looking again for the next workflow to mq-activate...")
+            _mongo_syntax_advance_taskforce_to_prelaunch(
+                context="Auto-advanced because workflow has already been mq-activated."
+            ),
+        )
+    except DocumentNotFoundException:
+        pass  # they moved on since they were found (ex: user abort)
 
 
 async def request_activation_to_mqs(
@@ -179,27 +188,45 @@ async def request_activation_to_mqs(
     """Send request to MQS to activate workflow's queues."""
     workflow = await workflows_client.find_one({"workflow_id": workflow_id})
 
-    return await mqs_rc.request(
+    return await request_mqs(
+        mqs_rc,
         "POST",
-        f"/{MQS_URL_V_PREFIX}/mqs/workflows/{workflow['workflow_id']}/mq-group/activation",
+        "/mqs/workflows/{workflow_id}/mq-group/activation",
         {
             "criteria": {
                 "priority": workflow["priority"],
                 # TODO (future PR) - add other fields
             },
         },
+        workflow_id=workflow["workflow_id"],
     )
 
 
 async def advance_workflows_taskforces_to_prelaunch(
-    taskforces_client: database.client.MongoJSONSchemaValidatedCollection,
+    wms_db: database.client.WMSMongoValidatedDatabase,
     workflow_id: str,
 ) -> None:
-    """Advance taskforces' phases to TaskforcePhase.PRE_LAUNCH."""
-    await taskforces_client.update_many(
-        {"workflow_id": workflow_id},
-        _mongo_syntax_advance_taskforce_to_prelaunch(),
-    )
+    """Mark the workflow as mq-activated, and advance its taskforces' phases to
+    TaskforcePhase.PRE_LAUNCH.
+    """
+    async with wms_db.mongo_client.start_session() as s:
+        async with await s.start_transaction():  # make update batch atomic
+            await wms_db.workflows_collection.find_one_and_update(
+                {"workflow_id": workflow_id},
+                {"$set": {"mq_activated_ts": time.time()}},
+                session=s,
+            )
+            try:
+                await wms_db.taskforces_collection.update_many(
+                    {
+                        "workflow_id": workflow_id,
+                        "phase": TaskforcePhase.PRE_MQ_ACTIVATOR,
+                    },
+                    _mongo_syntax_advance_taskforce_to_prelaunch(),
+                    session=s,
+                )
+            except DocumentNotFoundException:
+                pass  # they moved on since they were found (ex: user abort)
     LOGGER.info(
         f"ADVANCED taskforces 'phase' TO {TaskforcePhase.PRE_LAUNCH} ({workflow_id=})"
     )
@@ -232,42 +259,24 @@ async def record_mq_activation_failed(
                     "context": reason,
                 },
             },
+            "$inc": {
+                f"n_failed_phase_changes.{TaskforcePhase.PRE_LAUNCH}": 1,
+            },
         },
     )
 
 
-########################################################################################
-
-
-@resilient_daemon_task(ENV.WORKFLOW_MQ_ACTIVATOR_DELAY, LOGGER)
-async def run(mongo_client: AsyncMongoClient) -> None:
-    """Start up the daemon task."""
-    LOGGER.info("Starting up workflow_mq_activator...")
-
-    # database client
-    wms_db = database.client.WMSMongoValidatedDatabase(
-        mongo_client, parent_logger=LOGGER
-    )
-    # rest client
-    mqs_rc = get_mqs_connection(logging.getLogger(f"{LOGGER.name}.mqs-client"))
-
-    # main loop
-    short_sleep = False
-    while True:
-        if short_sleep:
-            await asyncio.sleep(TASK_MQ_ACTIVATOR_SHORTEST_SLEEP)
-            short_sleep = False
-        else:
-            await asyncio.sleep(ENV.WORKFLOW_MQ_ACTIVATOR_DELAY)
-        LOGGER.debug("Looking at workflow to mq-activate...")
-
-        # find next
-        try:
-            workflow_id = await get_next_workflow_id(wms_db)
-        except NoWorkflowToMQActivate:
-            LOGGER.debug("NO WORKFLOW CURRENTLY NEEDS MQ-ACTIVATION")
-            continue
+async def mq_activate_workflow(
+    wms_db: database.client.WMSMongoValidatedDatabase,
+    mqs_rc: RestClient,
+    workflow_id: str,
+    phase_watcher: TaskforcePhaseWatcher | None,
+) -> bool:
+    """Request mq-activation for a claimed workflow, then release its claim.
 
+    Returns True if the MQS said to try again later.
+    """
+    try:
         # request activation to MQS
         LOGGER.info(f"REQUESTING ACTIVATION for workflow_id={workflow_id} queues...")
         try:
@@ -278,7 +287,7 @@ async def run(mongo_client: AsyncMongoClient) -> None:
             )
         except requests.exceptions.HTTPError as e:
             LOGGER.exception(e)
-            continue
+            return False
 
         # update the database according to the MQS's response
         if mqs_resp.get("try_again_later"):
@@ -287,10 +296,76 @@ async def run(mongo_client: AsyncMongoClient) -> None:
                 workflow_id,
                 "MQS responded with 'try_again_later' signal",
             )
-            short_sleep = True  # want to give other tasks a chance to start up
-            continue
+            return True
         else:
-            await advance_workflows_taskforces_to_prelaunch(
-                wms_db.taskforces_collection,
-                workflow_id,
-            )
+            await advance_workflows_taskforces_to_prelaunch(wms_db, workflow_id)
+            if phase_watcher:
+                phase_watcher.notify(TaskforcePhase.PRE_LAUNCH)
+            return False
+    finally:
+        await release_workflow(wms_db.workflows_collection, workflow_id)
+
+
+########################################################################################
+
+
+@resilient_daemon_task(ENV.WORKFLOW_MQ_ACTIVATOR_DELAY, LOGGER)
+async def run(
+    mongo_client: AsyncMongoClient,
+    phase_watcher: TaskforcePhaseWatcher | None = None,
+) -> None:
+    """Start up the daemon task."""
+    LOGGER.info("Starting up workflow_mq_activator...")
+
+    # database client
+    wms_db = database.client.WMSMongoValidatedDatabase(
+        mongo_client, parent_logger=LOGGER
+    )
+    # rest client -- shared with the REST handlers
+    mqs_rc = get_mqs_connection()
+
+    # wake up as soon as there's a new workflow (or at the delay)
+    wakeup = (
+        phase_watcher.subscribe(TaskforcePhase.PRE_MQ_ACTIVATOR)
+        if phase_watcher
+        else None
+    )
+
+    # main loop
+    iteration_seconds = metrics.DAEMON_ITERATION_SECONDS.labels(
+        daemon="workflow_mq_activator"
+    )
+    short_sleep = False
+    try:
+        while True:
+            if short_sleep:
+                await asyncio.sleep(TASK_MQ_ACTIVATOR_SHORTEST_SLEEP)
+                short_sleep = False
+            else:
+                await wait_for_wakeup(wakeup, ENV.WORKFLOW_MQ_ACTIVATOR_DELAY)
+            with iteration_seconds.time():
+                LOGGER.debug("Looking at workflow(s) to mq-activate...")
+
+                # any taskforces added to already mq-activated workflows can go right ahead
+                await advance_stragglers_to_prelaunch(wms_db)
+
+                # find & claim next
+                workflow_ids = await claim_next_workflow_ids(
+                    wms_db, ENV.WORKFLOW_MQ_ACTIVATOR_CONCURRENCY
+                )
+                if not workflow_ids:
+                    LOGGER.debug("NO WORKFLOW CURRENTLY NEEDS MQ-ACTIVATION")
+                    continue
+
+                # activate all -- concurrently
+                try_again_laters = await asyncio.gather(
+                    *[
+                        mq_activate_workflow(wms_db, mqs_rc, wid, phase_watcher)
+                        for wid in workflow_ids
+                    ]
+                )
+                if any(try_again_laters):
+                    short_sleep = True  # want to give other tasks a chance to start up
+    finally:
+        if phase_watcher and wakeup:  # this task may be restarted (ex: new lease)
+            phase_watcher.unsubscribe(TaskforcePhase.PRE_MQ_ACTIVATOR, wakeup)